@@ -1,5 +1,11 @@
 import argparse
 import os
+import sys
+
+# the FASTA reader is shared with the EffectorO-ML scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "..", "..", "machine_learning_classification", "scripts"))
+from fasta_reader import read_ids
 
 def main():
   parser = argparse.ArgumentParser(prog='fasta_to_list.py', description="A python script that produces a list of all the sequence header names in a FASTA file.")
@@ -18,10 +24,9 @@ def main():
   OUTFILENAME = FASTA_FILE[after_dirnames + 1:].split('.')[0] + ".filterlist.txt"
 
   # write inputs to output
-  with open(FASTA_FILE, 'r') as fin, open(OUTFILENAME, 'w') as fout:
-    for line in fin:
-      if line[0] == '>':
-        fout.write(line[1:].strip().split()[0] + '\n')
+  with open(OUTFILENAME, 'w') as fout:
+    for seq_id in read_ids(FASTA_FILE):
+      fout.write(seq_id + '\n')
 
 
 if __name__ == "__main__":
@@ -17,6 +17,10 @@
 bed_input="bed/sp_GCA_004359215.1_BlacSF5_genomic_ORFs.bed"
 sorted_bam_output="bam/sorted-CG_SF5-All.bam"
 read_count_output="output/sp_GCA_004359215.1_BlacSF5_genomic_ORFs_readcounts.txt"
+classification_table="effector_classification_table.csv"
+#sbatch runs a copy of this script from its spool directory, so the scripts are found from
+#the directory the job was submitted from (this one), or next to the script when run directly
+SCRIPTS_DIR=${SLURM_SUBMIT_DIR:-$(dirname "$0")}/../../machine_learning_classification/scripts
 
 #sort
 #echo "sorting, current time: $(date)"
@@ -31,3 +35,7 @@ echo "get readcounts, current time: $(date)"
 /share/rwmwork/fletcher/programs/bedtools2/bin/bedtools multicov -bams $sorted_bam_output -bed $bed_input > $read_count_output
 
 echo "finished readcounts, current time: $(date)"
+
+#add the counts to the classification table (or count the BAM directly with:
+#samtools view $sorted_bam_output | python3 $SCRIPTS_DIR/read_counts.py -t $classification_table --bed $bed_input --sam -)
+python3 $SCRIPTS_DIR/read_counts.py -t $classification_table --counts $read_count_output
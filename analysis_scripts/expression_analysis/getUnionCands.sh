@@ -1,3 +1,15 @@
 #!/bin/bash
 
-cat mlRF88IDs_secreted_genes/ml_sp_B_lac-SF5gene-models.protei.fasta  lsg_secreted_genes/lsgIDs_sp_B_lac-SF5gene-models.protein.fasta rxlr_eer_secreted_genes/rxlr_eer_cleaved_sp_B_lac-SF5gene-models.protein.fasta  wy_secreted_genes/wy_cleaved_sp_B_lac-SF5gene-models.protein.fasta  | sort | uniq | wc -l > LSG_u_ML_u_RXLREER_u_WY_SF5_genemodels.fasta
+# union (and intersection) of the ML, LSG, RXLR-EER and WY candidates of the B. lactucae SF5 gene models,
+# joined by protein ID; see machine_learning_classification/scripts/evidence.py
+SCRIPTS_DIR=$(dirname "$0")/../../machine_learning_classification/scripts
+
+python3 $SCRIPTS_DIR/evidence.py --secretome sp_B_lac-SF5gene-models.protein.fasta \
+  --ml mlRF88IDs_secreted_genes/ml_sp_B_lac-SF5gene-models.protei.fasta \
+  --lsp lsg_secreted_genes/lsgIDs_sp_B_lac-SF5gene-models.protein.fasta \
+  --rxlr-eer rxlr_eer_secreted_genes/rxlr_eer_cleaved_sp_B_lac-SF5gene-models.protein.fasta \
+  --wy wy_secreted_genes/wy_cleaved_sp_B_lac-SF5gene-models.protein.fasta \
+  -o LSG_u_ML_u_RXLREER_u_WY_SF5_genemodels
+
+# number of candidates found by any method
+grep -c '>' LSG_u_ML_u_RXLREER_u_WY_SF5_genemodels/union_candidates.fasta
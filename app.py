@@ -1,23 +1,55 @@
-import pickle
+import os
 
 from dash import Dash
+from flask import Response, abort, stream_with_context
 import dash_bootstrap_components as dbc
 
 import app_components.html_content as html_content
 
 from app_components.callback_functions import get_callbacks
+from app_components.job_queue import JobQueue
+from app_components.predict_api import get_api_routes
+from app_components.result_table import stream_results_csv
+from app_components.upload_routes import get_upload_routes
+from instrumentation import PROFILER, aggregate, prometheus_text
+from prediction_cache import model_fingerprint
+from model_registry import load_model, freeze_for_fork
 
 # set up the app
 external_stylesheets = [dbc.themes.BOOTSTRAP, "assets/object_properties_style.css"]
 app = Dash(__name__, external_stylesheets=external_stylesheets, suppress_callback_exceptions=True)
 server = app.server
 
-# set up ML model
-trained_model = pickle.load(open("machine_learning_classification/trained_models/RF_88_best.sav", 'rb'))
+# set up ML model, loaded once in the gunicorn master (--preload) and shared by its workers
+MODEL_FILE = "machine_learning_classification/trained_models/RF_88_best.flat"
+trained_model = load_model(MODEL_FILE)
+
+# set up prediction cache, shared by all workers (set EFFECTORO_CACHE to "" to disable)
+CACHE_FILE = os.environ.get("EFFECTORO_CACHE", "prediction_cache.sqlite")
+
+# uploads are scored by background job processes, results are kept per job on disk
+JOB_DIR = os.environ.get("EFFECTORO_JOBS", "jobs")
+JOB_WORKERS = int(os.environ.get("EFFECTORO_JOB_WORKERS", 2))
+# uploads are streamed to disk in chunks, so whole-genome ORF files fit
+MAX_UPLOAD_SIZE = int(os.environ.get("EFFECTORO_MAX_UPLOAD", 1000 * 10**6))
+# the batch scoring API scores in the web worker's threads, so its requests are capped per
+# worker below the Procfile's --threads, leaving threads for the Dash callbacks and uploads;
+# a 100 MB body scores in well under a minute, inside the Procfile's --timeout
+MAX_API_SIZE = int(os.environ.get("EFFECTORO_MAX_API_SIZE", 100 * 10**6))
+MAX_API_REQUESTS = int(os.environ.get("EFFECTORO_MAX_API_REQUESTS", 2))
+
+# stage timings of the job processes, shown in the stats panel (set EFFECTORO_STATS to "" to disable)
+STATS_DIR = os.environ.get("EFFECTORO_STATS", os.path.join(JOB_DIR, "stats"))
+if STATS_DIR:
+	PROFILER.enable()
+
+job_queue = JobQueue(JOB_DIR, trained_model, CACHE_FILE or None,
+										 model_fingerprint(MODEL_FILE), workers=JOB_WORKERS,
+										 stats_dir=STATS_DIR or None)
 
 # define HTML contents
 header = html_content.create_title_navbar(app)
-fasta_input_card = html_content.create_fasta_input_card(10000000)
+fasta_input_card = html_content.create_fasta_input_card(MAX_UPLOAD_SIZE)
 info_card = html_content.create_info_card()
 table_card = html_content.create_table_card()
 
@@ -25,7 +57,31 @@ table_card = html_content.create_table_card()
 app.layout = html_content.create_app_skeleton(header, fasta_input_card, info_card, table_card)
 
 # import callback functions after app had been initialized
-get_callbacks(app)
+get_callbacks(app, job_queue)
+get_upload_routes(server, job_queue, MAX_UPLOAD_SIZE)
+get_api_routes(server, job_queue, MAX_API_SIZE, MAX_API_REQUESTS)
+
+# CSV export of a job's results, streamed from its results file
+@server.route("/download/<job_id>.csv")
+def download_results(job_id):
+	status = job_queue.status(job_id)
+	# unknown and malformed job IDs are both "missing"
+	if status["state"] == "missing":
+		abort(404)
+	# running jobs are sent up to their last status update
+	rows = None if status["state"] == "done" else status["scored"]
+	return Response(stream_with_context(stream_results_csv(job_queue, job_id, rows)), mimetype="text/csv",
+									headers={"Content-Disposition": f"attachment; filename=effectoro_{job_id}.csv"})
+
+# optional Prometheus scrape target with the same stage timings
+if os.environ.get("EFFECTORO_METRICS"):
+	@server.route("/metrics")
+	def metrics():
+		return Response(prometheus_text(aggregate(STATS_DIR or None)),
+										mimetype="text/plain; version=0.0.4")
+
+# keep the preloaded model's pages shared with the forked workers
+freeze_for_fork()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# the feature engine and other pipeline modules are shared with the command-line
+# tool and live next to predict_effectors.py; make them importable by the app
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           "machine_learning_classification", "scripts")
+if SCRIPTS_DIR not in sys.path:
+	sys.path.append(SCRIPTS_DIR)
@@ -1,70 +1,27 @@
-import pandas as pd
-from psutil import Process
-from numpy import array, round
-from base64 import b64decode
-from Bio.SeqIO import parse
-from io import StringIO
-
 from dash.dependencies import Input, Output, State
 from dash_table import DataTable
 from dash_core_components import Markdown
-from dash_html_components import Div
-
-from app_components.get_average_features import get_average_features
-
-def get_callbacks(app):
-	def parse_contents(contents, trained_model):
-		try:
-			content_type, content_string = contents.split(',')
-			decoded = b64decode(content_string)
-			seqs_to_predict = parse(StringIO(decoded.decode('utf-8')),'fasta')
-			prediction_map = {'0': "predicted non-effector", '1': "predicted effector"}
-
-			seq_ids = []
-			full_sequences = []
-			for protein in seqs_to_predict:
-				seq_ids.append(protein.id)
-				full_sequences.append(protein.seq)
-			seq_features = array([get_average_features(seq) for seq in full_sequences])
-			# get predicted output
-			predictions = trained_model.predict(seq_features)
-			probabilities = trained_model.predict_proba(seq_features)
-			meanings = array([prediction_map[pred] for pred in predictions])
-
-			df = pd.DataFrame({"proteinID": seq_ids,
-												"prediction": predictions,
-												"probability": probabilities[:,1],
-												"meaning": meanings
-												})
-
-			# round probabilities
-			df['probability'] = round(df['probability'], 3)
-
-		except Exception as e:
-			print(e)
-			df = pd.DataFrame({"proteinID": [],
-												"prediction": [],
-												"probability": [],
-												"meaning": []
-												})
-		return df
+from dash_html_components import A, Div, Table, Thead, Tbody, Tr, Th, Td
+
+from instrumentation import aggregate, stage_rows
+from model_registry import memory_report
+
+from app_components.result_table import DISPLAY_COLUMNS, PAGE_SIZE, load_results, results_page
 
+
+def get_callbacks(app, job_queue):
+	# the job ID of an upload is set by assets/chunked_upload.js once the file is sent
 	@app.callback(Output('datatable', 'children'),
-								[Input('upload-data', 'contents'),
-								Input('upload-data', 'filename')])
-	def get_new_datatable(contents, filename):
-		table = parse_contents(contents, filename)
-
-		# TODO: use pd.DataFrame.rename(...) here
-		table['Protein ID'] = table['proteinID']
-		table['Probability'] = table['probability']
-		table['Classification'] = table['prediction']
-		table['Prediction'] = table['meaning']
-		table = table[['Protein ID', 'Probability', 'Classification', 'Prediction']]
+								[Input('job-id', 'data')])
+	def get_new_datatable(job_id):
+		# the table is built once per job, its pages are sent by get_datatable_page
+		if job_id is None:
+			return Div()
 
 		formatted_table = DataTable(
-			columns=[{"name": i, "id": i} for i in table.columns],
-			data=table.to_dict("records"),
+			id='results-table',
+			columns=[{"name": i, "id": i} for i in DISPLAY_COLUMNS],
+			data=[],
 			tooltip_header={
 				'Protein ID': 'Protein ID obtained from fasta file',
 				'Classification': 'Binary classification value of non-effector (0) and effector(1), \
@@ -80,10 +37,14 @@ def get_callbacks(app):
 				"font-size": "16px"
 			},
 			tooltip_delay=0,
-			page_size=18,
-			export_format="csv",
-			sort_action='native',
-			filter_action='native',
+			page_current=0,
+			page_size=PAGE_SIZE,
+			page_action='custom',
+			sort_action='custom',
+			sort_mode='multi',
+			sort_by=[],
+			filter_action='custom',
+			filter_query='',
 			tooltip_duration=None,
 			style_table={"overflowY": "scroll"},
 			fixed_rows={"headers": False, "data": 0},
@@ -93,20 +54,77 @@ def get_callbacks(app):
 			},
 		)
 
-
-		return Div([formatted_table])
+		# the CSV export is streamed by the server, see app.py
+		download = A("Download CSV", href=f"/download/{job_id}.csv", className="btn btn-outline-primary btn-sm")
+		return Div([download, formatted_table])
+
+	@app.callback([Output('job-progress', 'children'),
+								 Output('job-interval', 'disabled')],
+								[Input('job-interval', 'n_intervals'),
+								 Input('job-id', 'data')])
+	def get_job_progress(n_intervals, job_id):
+		if job_id is None:
+			return "", True
+
+		status = job_queue.status(job_id)
+		finished = status["state"] in ("done", "failed", "missing")
+		if status["state"] == "failed":
+			progress = f"Could not score the uploaded file: {status.get('error', '')}"
+		elif finished:
+			progress = f"Scored {status['scored']} sequences."
+		else:
+			progress = f"Scoring... {status['scored']} of {status['total']} sequences done."
+		return progress, finished
+
+	@app.callback([Output('results-table', 'data'),
+								 Output('results-table', 'page_count')],
+								[Input('results-table', 'page_current'),
+								 Input('results-table', 'page_size'),
+								 Input('results-table', 'sort_by'),
+								 Input('results-table', 'filter_query'),
+								 Input('job-interval', 'n_intervals')],
+								[State('job-id', 'data')])
+	def get_datatable_page(page_current, page_size, sort_by, filter_query, n_intervals, job_id):
+		# only the rows of the shown page are sent, sorted and filtered on the server
+		if job_id is None:
+			return [], 1
+		status = job_queue.status(job_id)
+		table = load_results(job_queue, job_id, status["scored"])
+		return results_page(table, page_current, page_size or PAGE_SIZE, sort_by, filter_query)
 
 
 	def get_memory_usage():
-		return Process().memory_info().rss  # Get the resident set size (RSS) memory usage
+		# resident (rss), private (uss) and proportional (pss) memory of this worker
+		return memory_report()
 
 	@app.callback(
 			Output('memory-usage', 'children'),
 			[Input('interval-component', 'n_intervals')]
 	)
-	def update_memory_usage():
+	def update_memory_usage(n_intervals):
 			memory_usage = get_memory_usage()
-			return f"Memory Usage: {memory_usage / 1024 / 1024:.2f} MB"
+			sizes = ", ".join(f"{name.upper()} {memory_usage[name] / 1024 / 1024:.2f} MB"
+												for name in ("rss", "uss", "pss") if name in memory_usage)
+			return f"Memory Usage (worker {memory_usage['pid']}): {sizes}"
+
+	@app.callback(
+			Output('pipeline-stats', 'children'),
+			[Input('interval-component', 'n_intervals')]
+	)
+	def update_pipeline_stats(n_intervals):
+		# totals of this worker and of the job processes, see instrumentation.py
+		stats = aggregate(job_queue.stats_dir)
+		rows = stage_rows(stats["stages"])
+		if not rows:
+			return Div()
+		columns = ["stage", "calls", "sequences", "seconds", "sequences_per_second", "peak_rss_mb"]
+		headers = ["Stage", "Calls", "Sequences", "Seconds", "Sequences/s", "Peak RSS (MB)"]
+		return Div([
+			Markdown(f"**Pipeline stages** ({len(stats['processes'])} processes)"),
+			Table([Thead(Tr([Th(header) for header in headers])),
+						 Tbody([Tr([Td(row[column]) for column in columns]) for row in rows])],
+						className="table table-sm"),
+		])
 
 
 	@app.callback(
@@ -1,4 +1,4 @@
-from dash_core_components import Markdown, Upload
+from dash_core_components import Markdown, Interval, Store
 from dash_html_components import (
   Div, H3, P, A,
   Button as html_Button, Img
@@ -32,14 +32,22 @@ def create_app_skeleton(header: str, fasta_input_card: Card, info_card: Card, ta
                      '''),
             style={'margin': '30px'}
           ),
-        # Interval(id='interval-component',
-        #              interval=2000,  # Refresh the memory usage every 2 seconds
-        #              n_intervals=0),
+        Interval(id='interval-component',
+                 interval=2000,  # Refresh the memory usage every 2 seconds
+                 n_intervals=0),
+        # poll the background scoring job of the current upload
+        Store(id='job-id'),
+        Interval(id='job-interval',
+                 interval=1000,
+                 n_intervals=0,
+                 disabled=True),
         Container([Row([Col(fasta_input_card, md=6),
                         Col(info_card, md=6)]),
                    Row([Col(table_card)])],
 			                fluid=True),
         Div(id="memory-usage"),
+        # per-stage timings of the scoring jobs, refreshed with the memory usage
+        Div(id="pipeline-stats", style={'margin': '30px'}),
       ],
     )
   )
@@ -98,16 +106,13 @@ def create_fasta_input_card(max_byte_size):
         CardBody(
           Row([
             Col([
-              # upload button with max file size 10 MB
-              Upload(
-                html_Button(
-                  "Select a FASTA file",
-                  # TODO: edit style of input FASTA file button
-                ),
-                id="upload-data",
-                max_size=max_byte_size,
-                # TODO: edit style of upload
-              )
+              # opens a file picker, the file is sent in chunks by assets/chunked_upload.js
+              html_Button(
+                "Select a FASTA file",
+                id="upload-button",
+                # TODO: edit style of input FASTA file button
+              ),
+              Div(id="upload-progress"),
             ]),
             Div([
               Markdown(
@@ -115,7 +120,7 @@ def create_fasta_input_card(max_byte_size):
                  **File Requirements:**
 
                  - FASTA-formatted file of predicted amino acid sequences
-                 - File less than {max_byte_size / 10**6} MB
+                 - File less than {max_byte_size / 10**6:g} MB
                  '''
               )
             ])
@@ -155,7 +160,7 @@ def create_table_card():
     Card(
       [
         CardHeader(H3("EffectorO-ML Prediction Table")),
-        CardBody(Row(Col([Div(id="datatable")])))
+        CardBody(Row(Col([Div(id="job-progress"), Div(id="datatable")])))
       ]
     )
   )
\ No newline at end of file
@@ -0,0 +1,355 @@
+import fcntl
+import functools
+import json
+import os
+import re
+import shutil
+import sys
+import time
+import uuid
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pandas as pd
+from numpy import array, round
+
+from instrumentation import PROFILER, stage
+from predict_effectors import read_chunks
+from prediction_cache import MemoryCache, PredictionCache, predict_sequences
+
+# Uploaded FASTA files are scored in a background process pool instead of
+# inside the Dash request. Every job lives in its own directory holding the
+# input, a status file and the results scored so far, so whichever gunicorn
+# worker receives a poll request can report on any job.
+
+INPUT_FILE = "input.fasta"
+STATUS_FILE = "status.json"
+RESULTS_FILE = "results.csv"
+
+RESULT_COLUMNS = ["proteinID", "prediction", "probability", "meaning"]
+
+# Uploads are sent by the browser in chunks of UPLOAD_CHUNK_SIZE bytes and
+# appended to UPLOAD_DIR/{upload ID}.part, so no request ever holds more than
+# one chunk. A finished upload is moved into its job directory.
+UPLOAD_DIR = "uploads"
+UPLOAD_CHUNK_SIZE = 1024**2
+# bytes copied from a request to disk at a time
+COPY_BLOCK_SIZE = 64 * 1024
+
+prediction_map = {'0': "predicted non-effector", '1': "predicted effector"}
+
+JOB_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+# model and cache of the current job worker process
+_worker_model = None
+_worker_cache = None
+_worker_fingerprint = None
+# directory the worker's stage timings are dumped to, None to not profile
+_worker_stats_dir = None
+
+
+def score_sequences(trained_model, seq_ids, sequences, prediction_cache=None, model_fingerprint=None):
+	'''
+	Method: Scores sequences into the table shown by the app
+
+	Input:
+
+		- trained_model: fitted classifier with predict/predict_proba
+		- seq_ids: FASTA IDs
+		- sequences: amino acid strings
+		- prediction_cache: optional PredictionCache
+		- model_fingerprint: fingerprint of trained_model, required with a cache
+	'''
+	# get predicted output, previously seen sequences come from the cache
+	predictions, probabilities = predict_sequences(trained_model, sequences,
+																								 prediction_cache, model_fingerprint)
+	meanings = array([prediction_map[pred] for pred in predictions])
+
+	df = pd.DataFrame({"proteinID": seq_ids,
+										"prediction": predictions,
+										"probability": probabilities,
+										"meaning": meanings
+										})
+
+	# round probabilities
+	df['probability'] = round(df['probability'], 3)
+	return df
+
+
+def append_chunk(part_file, stream, max_size=None):
+	'''
+	Method: Appends a file-like stream to part_file in blocks and returns the new size
+
+	Input:
+
+		- part_file: path of the partial upload
+		- stream: readable binary stream, e.g. the body of a chunk request
+		- max_size: largest size the upload may reach, in bytes (default: no limit)
+
+	Raises ValueError, leaving part_file as it was, if the upload would exceed max_size.
+	'''
+	start = size = os.path.getsize(part_file)
+	with open(part_file, 'ab') as handle:
+		for block in iter(lambda: stream.read(COPY_BLOCK_SIZE), b''):
+			size += len(block)
+			if max_size is not None and size > max_size:
+				handle.truncate(start)
+				raise ValueError(f"upload is larger than {max_size} bytes")
+			handle.write(block)
+	return size
+
+
+def count_records(fasta_file):
+	'''
+	Method: Counts the header lines of a FASTA file, reading it in blocks
+
+	Only a '>' at the start of a line counts, so headers holding a '>' do not.
+	'''
+	records = 0
+	# the file starts like a line does
+	previous = b'\n'
+	with open(fasta_file, 'rb') as handle:
+		for block in iter(lambda: handle.read(UPLOAD_CHUNK_SIZE), b''):
+			records += (previous + block).count(b'\n>')
+			previous = block[-1:]
+	return records
+
+
+def _write_status(job_path, **status):
+	# replace the status file atomically so pollers never read half a file
+	status["updated"] = time.time()
+	tmp_file = os.path.join(job_path, STATUS_FILE + ".tmp")
+	with open(tmp_file, 'w') as handle:
+		json.dump(status, handle)
+	os.replace(tmp_file, os.path.join(job_path, STATUS_FILE))
+
+
+def _init_worker(trained_model, cache_path, model_fingerprint, stats_dir=None):
+	global _worker_model, _worker_cache, _worker_fingerprint, _worker_stats_dir
+	if not sys.warnoptions:
+		warnings.simplefilter("ignore")
+	_worker_model = trained_model
+	_worker_cache = PredictionCache(cache_path) if cache_path else None
+	_worker_fingerprint = model_fingerprint
+	_worker_stats_dir = stats_dir
+	if stats_dir:
+		# forked workers start from the parent's totals, count only their own
+		PROFILER.reset()
+		PROFILER.enable()
+
+
+def _job_finished(job_path, total, future):
+	# _run_job records its own errors; a future that failed lost its worker
+	# process (e.g. killed for memory) or never ran, and its job would
+	# otherwise stay queued or running forever
+	if future.cancelled() or future.exception() is not None:
+		error = "cancelled" if future.cancelled() else str(future.exception()) or "job worker stopped"
+		try:
+			with open(os.path.join(job_path, STATUS_FILE)) as handle:
+				scored = json.load(handle).get("scored", 0)
+		except (OSError, ValueError):
+			scored = 0
+		_write_status(job_path, state="failed", scored=scored, total=total, error=error)
+
+
+def _run_job(job_path, total, chunk_size):
+	scored = 0
+	# without a cache file, sequences repeated in later chunks of the upload are still scored once
+	cache = _worker_cache if _worker_cache is not None else MemoryCache()
+	_write_status(job_path, state="running", scored=scored, total=total)
+	try:
+		for seq_ids, sequences in read_chunks(os.path.join(job_path, INPUT_FILE), chunk_size):
+			df = score_sequences(_worker_model, seq_ids, sequences,
+													 cache, _worker_fingerprint)
+			with stage("write", len(df)):
+				df.to_csv(os.path.join(job_path, RESULTS_FILE), mode='a', header=scored == 0, index=False)
+			scored += len(df)
+			_write_status(job_path, state="running", scored=scored, total=total)
+			if _worker_stats_dir:
+				PROFILER.dump(_worker_stats_dir)
+	except Exception as e:
+		print(e)
+		_write_status(job_path, state="failed", scored=scored, total=total, error=str(e))
+		return
+	_write_status(job_path, state="done", scored=scored, total=total)
+
+
+class JobQueue:
+	'''
+	Background scoring of uploaded FASTA files, tracked through job directories
+	'''
+
+	def __init__(self, job_dir, trained_model, cache_path=None, model_fingerprint=None,
+							 workers=2, chunk_size=1000, max_age=24 * 60 * 60, stats_dir=None):
+		self.job_dir = job_dir
+		self.stats_dir = stats_dir
+		self.trained_model = trained_model
+		self.cache_path = cache_path
+		self.model_fingerprint = model_fingerprint
+		self.workers = workers
+		self.chunk_size = chunk_size
+		self.max_age = max_age
+		self._pool = None
+		self._pool_pid = None
+		os.makedirs(job_dir, exist_ok=True)
+
+	@property
+	def pool(self):
+		# the pool is started lazily in the process that submits jobs, never in
+		# a gunicorn master that forks its workers afterwards
+		if self._pool is None or self._pool_pid != os.getpid():
+			self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+																			 initargs=(self.trained_model, self.cache_path,
+																								 self.model_fingerprint, self.stats_dir))
+			self._pool_pid = os.getpid()
+		return self._pool
+
+	def job_path(self, job_id):
+		if not job_id or not JOB_ID_PATTERN.match(job_id):
+			raise ValueError(f"invalid job ID {job_id!r}")
+		return os.path.join(self.job_dir, job_id)
+
+	def _queue(self, job_id, total):
+		job_path = self.job_path(job_id)
+		_write_status(job_path, state="queued", scored=0, total=total)
+		try:
+			future = self.pool.submit(_run_job, job_path, total, self.chunk_size)
+		except BrokenProcessPool:
+			# a worker died and took the pool with it, start a new one
+			self._pool.shutdown(wait=False)
+			self._pool = None
+			future = self.pool.submit(_run_job, job_path, total, self.chunk_size)
+		future.add_done_callback(functools.partial(_job_finished, job_path, total))
+		return job_id
+
+	def upload_path(self, upload_id):
+		if not upload_id or not JOB_ID_PATTERN.match(upload_id):
+			raise ValueError(f"invalid upload ID {upload_id!r}")
+		return os.path.join(self.job_dir, UPLOAD_DIR, upload_id + ".part")
+
+	def start_upload(self):
+		'''
+		Method: Starts an empty chunked upload and returns its upload ID
+		'''
+		self.expire_jobs()
+
+		upload_id = uuid.uuid4().hex
+		part_file = self.upload_path(upload_id)
+		os.makedirs(os.path.dirname(part_file), exist_ok=True)
+		open(part_file, 'wb').close()
+		return upload_id
+
+	def upload_size(self, upload_id):
+		'''
+		Method: Returns the number of bytes received for an upload, None if there is no such upload
+		'''
+		try:
+			return os.path.getsize(self.upload_path(upload_id))
+		except (OSError, ValueError):
+			return None
+
+	def append_upload(self, upload_id, offset, stream, max_size=None):
+		'''
+		Method: Appends one chunk to an upload and returns the number of bytes received
+
+		Input:
+
+			- upload_id: ID returned by start_upload()
+			- offset: position of the chunk in the file; a chunk that does not
+			  start where the upload ends is refused, so an interrupted upload
+			  resumes from upload_size()
+			- stream: readable binary stream of the chunk
+			- max_size: largest size of the whole file, in bytes
+		'''
+		try:
+			part_file = self.upload_path(upload_id)
+			handle = open(part_file, 'rb')
+		except (OSError, ValueError):
+			raise KeyError(upload_id)
+		with handle:
+			# a retried chunk racing its slow original must not be appended twice,
+			# so the size check and the append hold the file's lock together
+			fcntl.flock(handle, fcntl.LOCK_EX)
+			size = os.fstat(handle.fileno()).st_size
+			if offset != size:
+				raise ValueError(f"chunk at byte {offset}, upload has {size} bytes")
+			return append_chunk(part_file, stream, max_size)
+
+	def submit_upload(self, upload_id):
+		'''
+		Method: Queues a finished chunked upload for scoring and returns its job ID
+		'''
+		part_file = self.upload_path(upload_id)
+		if not os.path.isfile(part_file):
+			raise KeyError(upload_id)
+
+		job_id = uuid.uuid4().hex
+		job_path = self.job_path(job_id)
+		os.makedirs(job_path)
+		input_file = os.path.join(job_path, INPUT_FILE)
+		os.replace(part_file, input_file)
+		return self._queue(job_id, count_records(input_file))
+
+	def status(self, job_id):
+		'''
+		Method: Returns the status dictionary of a job (state, scored, total)
+		'''
+		try:
+			with open(os.path.join(self.job_path(job_id), STATUS_FILE)) as handle:
+				return json.load(handle)
+		except (OSError, ValueError):
+			return {"state": "missing", "scored": 0, "total": 0}
+
+	def results(self, job_id, rows=None):
+		'''
+		Method: Returns the results scored so far for a job
+
+		Input:
+
+			- job_id: ID returned by submit_upload()
+			- rows: number of rows to read, the "scored" count of the job's status
+		'''
+		results_file = os.path.join(self.job_path(job_id), RESULTS_FILE)
+		if rows == 0 or not os.path.isfile(results_file):
+			return pd.DataFrame({column: [] for column in RESULT_COLUMNS})
+		# rows past the last status update may still be being written
+		return pd.read_csv(results_file, nrows=rows, dtype={"proteinID": str, "prediction": str})
+
+	def expire_jobs(self):
+		'''
+		Method: Removes job directories untouched for longer than max_age seconds
+		'''
+		cutoff = time.time() - self.max_age
+		# every worker process expires jobs, so anything listed here may be
+		# removed by another one (or, for uploads, moved into its job) before
+		# it is looked at
+		for job_id in os.listdir(self.job_dir):
+			job_path = os.path.join(self.job_dir, job_id)
+			try:
+				if JOB_ID_PATTERN.match(job_id) and os.path.getmtime(job_path) < cutoff:
+					shutil.rmtree(job_path, ignore_errors=True)
+			except FileNotFoundError:
+				continue
+		# uploads that were never finished
+		upload_dir = os.path.join(self.job_dir, UPLOAD_DIR)
+		if os.path.isdir(upload_dir):
+			for name in os.listdir(upload_dir):
+				part_file = os.path.join(upload_dir, name)
+				try:
+					if os.path.getmtime(part_file) < cutoff:
+						os.remove(part_file)
+				except FileNotFoundError:
+					continue
+		# timings of worker processes that are long gone
+		if self.stats_dir and os.path.isdir(self.stats_dir):
+			for name in os.listdir(self.stats_dir):
+				# {pid}.json.tmp files are renamed away by Profiler.dump() as it goes
+				if not name.endswith(".json"):
+					continue
+				stats_file = os.path.join(self.stats_dir, name)
+				try:
+					if os.path.getmtime(stats_file) < cutoff:
+						os.remove(stats_file)
+				except FileNotFoundError:
+					continue
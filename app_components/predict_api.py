@@ -0,0 +1,145 @@
+import gzip
+import io
+import itertools
+import json
+import threading
+
+from flask import Response, jsonify, request, stream_with_context
+
+from app_components.job_queue import COPY_BLOCK_SIZE, score_sequences
+from fasta_reader import read_fasta_stream
+from instrumentation import PROFILER, stage
+from prediction_cache import MemoryCache, PredictionCache
+
+# Batch scoring for pipelines, without the Dash interface:
+#
+#   POST /api/v1/predict    FASTA request body, plain or gzipped
+#
+# The body is parsed as it arrives and scored API_CHUNK_SIZE records at a
+# time with the model the app already loaded. Every protein is sent back as
+# one JSON line (NDJSON) as soon as its chunk is scored:
+#
+#   {"proteinID": "...", "prediction": "1", "probability": 0.93, "meaning": "predicted effector"}
+#
+# A record without residues gets {"proteinID": "...", "error": "empty sequence"}.
+# A body that cannot be read to its end, e.g. one that turns out to be too
+# large once decompressed, ends the stream with an {"error": "..."} line after
+# the proteins read up to there.
+#
+# Requests are scored in the web worker's own threads (see Procfile), at most
+# max_requests at a time per worker.
+#
+#   curl -sS --data-binary @secretome.fasta.gz https://.../api/v1/predict
+
+API_CHUNK_SIZE = 250
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+class _RequestBody(io.RawIOBase):
+	# the WSGI input as a raw stream, so it can be buffered and peeked at
+	# whatever stream class the server hands over
+	def __init__(self, stream):
+		self.stream = stream
+
+	def readable(self):
+		return True
+
+	def readinto(self, buffer):
+		data = self.stream.read(len(buffer))
+		buffer[:len(data)] = data
+		return len(data)
+
+
+def open_body(stream):
+	'''
+	Method: Returns a binary stream of a request body, decompressed if it is gzipped
+
+	Gzip is recognized by its magic bytes, so callers need not set Content-Encoding.
+	'''
+	body = io.BufferedReader(_RequestBody(stream), COPY_BLOCK_SIZE)
+	if body.peek(len(GZIP_MAGIC))[:len(GZIP_MAGIC)] == GZIP_MAGIC:
+		return gzip.GzipFile(fileobj=body)
+	return body
+
+
+def limited_lines(handle, max_size):
+	'''
+	Method: Yields the lines of a binary stream, raising ValueError past max_size bytes
+
+	The limit applies to the decompressed bytes, so a small gzip body cannot
+	expand into more than max_size; no line longer than the limit is ever read.
+	'''
+	size = 0
+	while True:
+		line = handle.readline(max_size - size + 1)
+		if not line:
+			return
+		size += len(line)
+		if size > max_size:
+			raise ValueError(f"request body is larger than {max_size} bytes")
+		yield line
+
+
+def get_api_routes(server, job_queue, max_byte_size, max_requests):
+	# one cache connection per worker process and thread, see PredictionCache.connection
+	prediction_cache = PredictionCache(job_queue.cache_path) if job_queue.cache_path else None
+	# requests scored at once by this worker process; more are turned away
+	# instead of queued, so callers back off rather than time out
+	slots = threading.BoundedSemaphore(max_requests)
+
+	def score_stream(records):
+		# without a cache file, sequences repeated in later chunks of the body are still scored once
+		cache = prediction_cache if prediction_cache is not None else MemoryCache()
+		try:
+			while True:
+				chunk, error = [], None
+				with stage("parse") as call:
+					try:
+						chunk.extend(itertools.islice(records, API_CHUNK_SIZE))
+					except Exception as e:
+						# the records read before a bad or oversized part of the body are still scored
+						error = e
+					call.sequences = len(chunk)
+				if chunk:
+					yield score_chunk(chunk, cache)
+				if error is not None:
+					raise error
+				if len(chunk) < API_CHUNK_SIZE:
+					return
+		except Exception as e:
+			# the status line is long sent, so a body that is too large or not
+			# (gzipped) FASTA ends the stream instead
+			print(e)
+			yield json.dumps({"error": str(e) or type(e).__name__}) + "\n"
+		finally:
+			if job_queue.stats_dir and PROFILER.enabled:
+				PROFILER.dump(job_queue.stats_dir)
+
+	def score_chunk(chunk, cache):
+		# records without residues have no features, they get an error line of their own
+		scored = [(seq_id, seq.decode()) for seq_id, seq in chunk if seq]
+		df = score_sequences(job_queue.trained_model, [seq_id for seq_id, _ in scored],
+												 [seq for _, seq in scored], cache, job_queue.model_fingerprint)
+		with stage("write", len(chunk)):
+			rows = iter(df.to_dict(orient="records"))
+			return "".join(json.dumps(next(rows) if seq else {"proteinID": seq_id, "error": "empty sequence"}) + "\n"
+										 for seq_id, seq in chunk)
+
+	@server.route("/api/v1/predict", methods=["POST"])
+	def predict():
+		if request.content_length and request.content_length > max_byte_size:
+			return jsonify(error=f"request body is larger than {max_byte_size} bytes"), 413
+		if not slots.acquire(blocking=False):
+			response = jsonify(error="too many prediction requests, try again later")
+			response.headers["Retry-After"] = "5"
+			return response, 429
+		try:
+			records = read_fasta_stream(limited_lines(open_body(request.stream), max_byte_size))
+			response = Response(stream_with_context(score_stream(records)), mimetype="application/x-ndjson")
+		except BaseException:
+			slots.release()
+			raise
+		# the slot is held until the last line is sent or the client goes away
+		response.call_on_close(slots.release)
+		return response
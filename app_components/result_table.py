@@ -0,0 +1,177 @@
+import os
+import threading
+from collections import OrderedDict
+from itertools import islice
+
+from pandas.api.types import is_numeric_dtype
+
+from app_components.job_queue import RESULTS_FILE
+
+# Paging, sorting and filtering of a job's results on the server, for the
+# results DataTable in custom mode: the browser only ever receives the rows of
+# the page it shows.
+
+PAGE_SIZE = 18
+
+# {column shown in the table: column of the job's results file}
+DISPLAY_COLUMNS = OrderedDict([
+	("Protein ID", "proteinID"),
+	("Probability", "probability"),
+	("Classification", "prediction"),
+	("Prediction", "meaning"),
+])
+
+# DataTable filter operators, longest first so '>=' is not read as '>'
+FILTER_OPERATORS = [
+	("s>=", "ge"), ("s<=", "le"), ("s!=", "ne"), ("s>", "gt"), ("s<", "lt"), ("s=", "eq"),
+	("ge ", "ge"), ("le ", "le"), ("ne ", "ne"), ("gt ", "gt"), ("lt ", "lt"), ("eq ", "eq"),
+	(">=", "ge"), ("<=", "le"), ("!=", "ne"), (">", "gt"), ("<", "lt"), ("=", "eq"),
+	("icontains ", "icontains"), ("scontains ", "contains"), ("contains ", "contains"),
+]
+
+# number of result sets kept in memory per worker
+RESULTS_CACHE_SIZE = 8
+
+_results_cache = OrderedDict()
+_results_lock = threading.Lock()
+
+
+def load_results(job_queue, job_id, rows):
+	'''
+	Method: Returns the first rows results of a job, renamed to DISPLAY_COLUMNS
+
+	Input:
+
+		- job_queue: JobQueue the job was submitted to
+		- job_id: ID of the job
+		- rows: number of rows scored so far, the "scored" count of the job's status
+
+	Result sets are kept per (job, rows), so paging through a finished job
+	reads its results file only once per worker.
+	'''
+	key = (job_id, rows)
+	with _results_lock:
+		if key in _results_cache:
+			_results_cache.move_to_end(key)
+			return _results_cache[key]
+
+	table = job_queue.results(job_id, rows)
+	table = table[list(DISPLAY_COLUMNS.values())]
+	table.columns = list(DISPLAY_COLUMNS)
+
+	with _results_lock:
+		_results_cache[key] = table
+		while len(_results_cache) > RESULTS_CACHE_SIZE:
+			_results_cache.popitem(last=False)
+	return table
+
+
+def split_filter_part(filter_part):
+	'''
+	Method: Splits one clause of a DataTable filter_query into (column, operator, value)
+
+	The operator is only looked for right after the {column}, so values holding
+	an operator (contains "gene 1", contains "a<b") are taken as they are.
+	Returns (None, None, None) for clauses it does not understand.
+	'''
+	name_start, name_end = filter_part.find('{'), filter_part.find('}')
+	if name_start == -1 or name_end < name_start:
+		return None, None, None
+	name = filter_part[name_start + 1:name_end]
+	rest = filter_part[name_end + 1:].lstrip()
+	for symbol, operator in FILTER_OPERATORS:
+		if rest.startswith(symbol):
+			value_part = rest[len(symbol):].strip()
+			if len(value_part) > 1 and value_part[0] == value_part[-1] and value_part[0] in "'\"`":
+				value = value_part[1:-1].replace('\\' + value_part[0], value_part[0])
+			else:
+				try:
+					value = float(value_part)
+				except ValueError:
+					value = value_part
+			return name, operator, value
+	return None, None, None
+
+
+def filter_results(table, filter_query):
+	'''
+	Method: Returns the rows of table matching a DataTable filter_query
+	'''
+	if not filter_query:
+		return table
+	for filter_part in filter_query.split(" && "):
+		name, operator, value = split_filter_part(filter_part)
+		if name not in table.columns:
+			continue
+		column = table[name]
+		if operator in ("contains", "icontains"):
+			# contains is case-sensitive, as in the DataTable's own filtering
+			table = table[column.astype(str).str.contains(str(value), case=operator == "contains", regex=False)]
+			continue
+		if isinstance(value, float) and not is_numeric_dtype(column):
+			# numbers typed into a text column, e.g. a classification of 1
+			value = str(value).rstrip('0').rstrip('.') if value == int(value) else str(value)
+		if operator == "eq":
+			table = table[column == value]
+		elif operator == "ne":
+			table = table[column != value]
+		elif operator == "gt":
+			table = table[column > value]
+		elif operator == "ge":
+			table = table[column >= value]
+		elif operator == "lt":
+			table = table[column < value]
+		elif operator == "le":
+			table = table[column <= value]
+	return table
+
+
+def sort_results(table, sort_by):
+	'''
+	Method: Returns table sorted by a DataTable sort_by list
+	'''
+	sort_by = [column for column in (sort_by or []) if column["column_id"] in table.columns]
+	if not sort_by:
+		return table
+	return table.sort_values([column["column_id"] for column in sort_by],
+													 ascending=[column["direction"] == "asc" for column in sort_by],
+													 kind="mergesort")
+
+
+def results_page(table, page_current, page_size=PAGE_SIZE, sort_by=None, filter_query=None):
+	'''
+	Method: Returns (records of the requested page, number of pages) of a result set
+	'''
+	table = sort_results(filter_results(table, filter_query), sort_by)
+	page_count = max(1, -(-len(table) // page_size))
+	page_current = min(page_current or 0, page_count - 1)
+	page = table.iloc[page_current * page_size:(page_current + 1) * page_size]
+	return page.to_dict("records"), page_count
+
+
+def stream_results_csv(job_queue, job_id, rows=None, block_size=1024**2):
+	'''
+	Method: Yields the results file of a job in blocks, with the table's column names as header
+
+	Input:
+
+		- job_queue: JobQueue the job was submitted to
+		- job_id: ID of the job
+		- rows: number of rows to send, for jobs still running (default: the whole file)
+		- block_size: number of characters per block of a finished job
+	'''
+	results_file = os.path.join(job_queue.job_path(job_id), RESULTS_FILE)
+	source_names = {source: name for name, source in DISPLAY_COLUMNS.items()}
+	if not os.path.isfile(results_file):
+		yield ",".join(DISPLAY_COLUMNS) + "\n"
+		return
+	with open(results_file) as handle:
+		header = handle.readline().rstrip("\n").split(",")
+		yield ",".join(source_names.get(column, column) for column in header) + "\n"
+		if rows is None:
+			for block in iter(lambda: handle.read(block_size), ''):
+				yield block
+		else:
+			# rows past the last status update may still be being written
+			for line in islice(handle, rows):
+				yield line
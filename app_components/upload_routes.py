@@ -0,0 +1,51 @@
+from flask import abort, jsonify, request
+
+from app_components.job_queue import UPLOAD_CHUNK_SIZE
+
+# Chunked upload of FASTA files, used by assets/chunked_upload.js:
+#
+#   POST /upload                       starts an upload, returns its ID and the chunk size
+#   PUT  /upload/<upload_id>?offset=N  appends the request body, sent at byte N of the file
+#   GET  /upload/<upload_id>           bytes received so far, to resume an interrupted upload
+#   POST /upload/<upload_id>/finish    queues the file for scoring, returns the job ID
+#
+# Chunks are copied to disk as they arrive, so a request holds at most a small
+# block of the file in memory however large the file is.
+
+
+def get_upload_routes(server, job_queue, max_byte_size):
+	@server.route("/upload", methods=["POST"])
+	def start_upload():
+		return jsonify(upload_id=job_queue.start_upload(), chunk_size=UPLOAD_CHUNK_SIZE,
+									 max_size=max_byte_size)
+
+	@server.route("/upload/<upload_id>", methods=["GET"])
+	def upload_size(upload_id):
+		size = job_queue.upload_size(upload_id)
+		if size is None:
+			abort(404)
+		return jsonify(size=size)
+
+	@server.route("/upload/<upload_id>", methods=["PUT"])
+	def append_upload(upload_id):
+		offset = request.args.get("offset", type=int)
+		if offset is None:
+			abort(400)
+		if request.content_length and request.content_length > UPLOAD_CHUNK_SIZE:
+			abort(413)
+		try:
+			size = job_queue.append_upload(upload_id, offset, request.stream, max_byte_size)
+		except KeyError:
+			abort(404)
+		except ValueError as e:
+			# the client resumes from the size it is sent back
+			status = 413 if offset + (request.content_length or 0) > max_byte_size else 409
+			return jsonify(error=str(e), size=job_queue.upload_size(upload_id)), status
+		return jsonify(size=size)
+
+	@server.route("/upload/<upload_id>/finish", methods=["POST"])
+	def finish_upload(upload_id):
+		try:
+			return jsonify(job_id=job_queue.submit_upload(upload_id))
+		except (KeyError, ValueError):
+			abort(404)
@@ -0,0 +1,88 @@
+/* Chunked upload of a FASTA file picked with #upload-button
+––––––––––––––––––––––––––––––––––––––––––––––––––
+The file is sliced in the browser and sent chunk by chunk to the /upload
+routes (app_components/upload_routes.py), which append every chunk to disk.
+A chunk that fails is retried from the size the server reports, so a dropped
+connection resumes instead of starting over. Once the file is complete the
+job ID is handed to the app's job-id store. */
+
+(function () {
+  var MAX_RETRIES = 5;
+
+  function showProgress(text) {
+    var progress = document.getElementById("upload-progress");
+    if (progress) {
+      progress.textContent = text;
+    }
+  }
+
+  function json(response) {
+    return response.json().then(function (body) {
+      body.status = response.status;
+      return body;
+    });
+  }
+
+  function sendChunks(file, upload, offset, retries) {
+    if (offset >= file.size) {
+      return fetch("/upload/" + upload.upload_id + "/finish", {method: "POST"}).then(json);
+    }
+    var end = Math.min(offset + upload.chunk_size, file.size);
+    showProgress("Uploading... " + Math.floor(100 * offset / file.size) + "%");
+    return fetch("/upload/" + upload.upload_id + "?offset=" + offset, {
+      method: "PUT",
+      headers: {"Content-Type": "application/octet-stream"},
+      body: file.slice(offset, end)
+    }).then(json).then(function (body) {
+      if (body.status === 200) {
+        return sendChunks(file, upload, body.size, MAX_RETRIES);
+      }
+      if (body.status === 413 || retries === 0) {
+        throw new Error(body.error || "upload failed");
+      }
+      return sendChunks(file, upload, body.size, retries - 1);
+    }, function (error) {
+      if (retries === 0) {
+        throw error;
+      }
+      // ask where the server stopped and go on from there
+      return fetch("/upload/" + upload.upload_id).then(json).then(function (body) {
+        return sendChunks(file, upload, body.size, retries - 1);
+      });
+    });
+  }
+
+  function uploadFile(file) {
+    return fetch("/upload", {method: "POST"}).then(json).then(function (upload) {
+      if (file.size > upload.max_size) {
+        throw new Error("file is larger than " + upload.max_size / 1e6 + " MB");
+      }
+      return sendChunks(file, upload, 0, MAX_RETRIES);
+    });
+  }
+
+  function pickFile() {
+    // html components have no file input, so the picker is made here
+    var input = document.createElement("input");
+    input.type = "file";
+    input.addEventListener("change", function () {
+      if (!input.files.length) {
+        return;
+      }
+      var file = input.files[0];
+      uploadFile(file).then(function (body) {
+        showProgress("Uploaded " + file.name + ".");
+        window.dash_clientside.set_props("job-id", {data: body.job_id});
+      }).catch(function (error) {
+        showProgress("Could not upload " + file.name + ": " + error.message);
+      });
+    });
+    input.click();
+  }
+
+  document.addEventListener("click", function (event) {
+    if (event.target.closest && event.target.closest("#upload-button")) {
+      pickFile();
+    }
+  });
+})();
@@ -0,0 +1,369 @@
+import argparse
+import datetime
+import glob
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys, warnings
+import tempfile
+import time
+
+import numpy as np
+
+from feature_engine import get_features_matrix
+from flat_forest import predict_with_proba
+from instrumentation import PeakRSS
+from model_registry import load_model
+from predict_effectors import (DEFAULT_CHUNK_SIZE, DEFAULT_MODEL_FILE, ResultWriter, predict_file,
+                               read_chunks, score_chunk)
+
+## Throughput benchmark of the prediction pipeline.
+##
+## Every stage (FASTA parsing, featurization, model scoring, output writing,
+## and the whole run end to end) is timed on its own, for both the
+## command-line path (predict_effectors.py) and the web app path (the upload
+## decoding and background job of app_components). Inputs are synthetic
+## proteomes of a chosen size and length distribution and/or the bundled
+## secretomes. Results are written as JSON, tagged with the git commit, so
+## runs can be compared across commits (--baseline).
+
+## RUN LIKE THIS:
+##    python3 benchmark.py --synthetic 1000 100000 --secretomes -o benchmark.json
+##    python3 benchmark.py --synthetic 100000 --baseline benchmark.json -o benchmark_new.json
+
+## output:
+##    1) JSON of sequences/second, seconds and peak RSS per dataset, path and stage
+
+BUNDLED_SECRETOMES = "../../results/EffectorO_genome_results/secretomes/*.fasta"
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# amino acid composition of UniProtKB/Swiss-Prot (release 2023_01), in percent
+AMINO_ACID_FREQUENCIES = {
+    'A': 8.25, 'R': 5.53, 'N': 4.06, 'D': 5.46, 'C': 1.38, 'Q': 3.93, 'E': 6.72,
+    'G': 7.07, 'H': 2.27, 'I': 5.91, 'L': 9.65, 'K': 5.80, 'M': 2.41, 'F': 3.86,
+    'P': 4.74, 'S': 6.65, 'T': 5.36, 'W': 1.10, 'Y': 2.92, 'V': 6.86,
+}
+LENGTH_DISTRIBUTIONS = ["lognormal", "normal", "uniform", "fixed"]
+MIN_SYNTHETIC_LENGTH = 30
+
+# rows per chunk of a web app job, see app_components/job_queue.py
+DASH_CHUNK_SIZE = 1000
+
+# seconds between RSS samples while a stage runs
+RSS_INTERVAL = 0.002
+
+
+def time_stage(function, n_sequences, repeat=1):
+    '''
+    Method: Runs a stage repeat times, returning its result and fastest-run statistics
+
+    Input:
+
+        - function: callable running the stage once, its last result is returned
+        - n_sequences: number of sequences the stage processes
+        - repeat: number of runs, the fastest one is reported
+
+    Returns (result, {"seconds", "sequences_per_second", "peak_rss_mb", "rss_increase_mb"}).
+    '''
+    best = None
+    result = None
+    for _ in range(repeat):
+        result = None
+        with PeakRSS(RSS_INTERVAL) as rss:
+            start = time.perf_counter()
+            result = function()
+            seconds = time.perf_counter() - start
+        if best is None or seconds < best["seconds"]:
+            best = {"seconds": round(seconds, 6),
+                    "sequences_per_second": round(n_sequences / seconds, 1) if seconds > 0 else None,
+                    "peak_rss_mb": round(rss.peak / 1024**2, 2),
+                    "rss_increase_mb": round((rss.peak - rss.start) / 1024**2, 2)}
+    return result, best
+
+
+def synthetic_lengths(n_sequences, distribution="lognormal", mean_length=400, spread=0.6, rng=None):
+    '''
+    Method: Draws protein lengths
+
+    Input:
+
+        - n_sequences: number of lengths
+        - distribution: one of LENGTH_DISTRIBUTIONS
+        - mean_length: median (lognormal), mean (normal, uniform) or length (fixed)
+        - spread: sigma of log length (lognormal), or the standard deviation (normal)
+          and half-width (uniform) as a fraction of mean_length
+        - rng: numpy random Generator
+    '''
+    rng = rng or np.random.default_rng()
+    if distribution == "lognormal":
+        lengths = rng.lognormal(np.log(mean_length), spread, n_sequences)
+    elif distribution == "normal":
+        lengths = rng.normal(mean_length, spread * mean_length, n_sequences)
+    elif distribution == "uniform":
+        lengths = rng.uniform(mean_length * (1 - spread), mean_length * (1 + spread), n_sequences)
+    elif distribution == "fixed":
+        lengths = np.full(n_sequences, mean_length)
+    else:
+        raise ValueError(f"unknown length distribution {distribution!r}")
+    return np.maximum(np.round(lengths), MIN_SYNTHETIC_LENGTH).astype(np.int64)
+
+
+def write_synthetic_fasta(fasta_file, n_sequences, distribution="lognormal", mean_length=400,
+                          spread=0.6, seed=0):
+    '''
+    Method: Writes a FASTA file of random proteins with the Swiss-Prot amino acid composition
+
+    Sequences start with M and end with a stop ('*') like the predicted
+    proteomes in results/, and are wrapped at 60 residues.
+    '''
+    rng = np.random.default_rng(seed)
+    residues = np.frombuffer("".join(AMINO_ACID_FREQUENCIES).encode(), dtype=np.uint8)
+    weights = np.array(list(AMINO_ACID_FREQUENCIES.values()))
+    lengths = synthetic_lengths(n_sequences, distribution, mean_length, spread, rng)
+    with open(fasta_file, 'w') as handle:
+        for index, length in enumerate(lengths):
+            body = rng.choice(residues, length - 2, p=weights / weights.sum()).tobytes().decode()
+            sequence = "M" + body + "*"
+            handle.write(f">synthetic_{index + 1}\n")
+            for start in range(0, len(sequence), 60):
+                handle.write(sequence[start:start + 60] + "\n")
+    return int(lengths.sum())
+
+
+def benchmark_cli(trained_model, fasta_file, work_dir, chunk_size=DEFAULT_CHUNK_SIZE, repeat=1):
+    '''
+    Method: Times the stages of predict_effectors.py on one FASTA file
+    '''
+    stages = {}
+    chunks, stages["parse"] = time_stage(lambda: list(read_chunks(fasta_file, chunk_size)),
+                                         0, repeat)
+    n_sequences = sum(len(seq_ids) for seq_ids, _ in chunks)
+    # parsing is timed before the number of sequences is known
+    stages["parse"]["sequences_per_second"] = round(n_sequences / stages["parse"]["seconds"], 1) \
+        if stages["parse"]["seconds"] > 0 else None
+
+    features, stages["features"] = time_stage(
+        lambda: [get_features_matrix(sequences) for _, sequences in chunks], n_sequences, repeat)
+    _, stages["predict"] = time_stage(
+        lambda: [predict_with_proba(trained_model, X) for X in features], n_sequences, repeat)
+
+    # the frames written are built outside the timed region
+    resultDFs = []
+    offset = 0
+    for seq_ids, sequences in chunks:
+        resultDFs.append(score_chunk(trained_model, seq_ids, sequences, offset))
+        offset += len(seq_ids)
+    del chunks, features
+
+    def write():
+        writer = ResultWriter(os.path.join(work_dir, "table.csv"), os.path.join(work_dir, "effectors.fasta"))
+        for resultDF in resultDFs:
+            writer.write(resultDF)
+        writer.close()
+
+    _, stages["write"] = time_stage(write, n_sequences, repeat)
+    del resultDFs
+
+    def end_to_end():
+        writer = ResultWriter(os.path.join(work_dir, "table.csv"), os.path.join(work_dir, "effectors.fasta"))
+        predict_file(trained_model, fasta_file, writer, chunk_size)
+        writer.close()
+
+    _, stages["end_to_end"] = time_stage(end_to_end, n_sequences, repeat)
+    return n_sequences, stages
+
+
+def import_dash_path():
+    '''
+    Method: Returns the job_queue module of the web app, or None without Dash
+    '''
+    if REPO_DIR not in sys.path:
+        sys.path.append(REPO_DIR)
+    try:
+        import app_components.job_queue as job_queue
+    except ImportError as e:
+        print(f"Skipping the web app path: {e}")
+        return None
+    return job_queue
+
+
+def benchmark_dash(trained_model, fasta_file, work_dir, dash_path, chunk_size=DASH_CHUNK_SIZE, repeat=1):
+    '''
+    Method: Times the stages of scoring an upload in the web app on one FASTA file
+
+    The upload is appended to a job directory chunk by chunk, as the upload
+    routes do, and scored by the job queue's worker function in this process.
+    '''
+    job_queue = dash_path
+    job_path = os.path.join(work_dir, "job")
+    os.makedirs(job_path, exist_ok=True)
+    input_file = os.path.join(job_path, job_queue.INPUT_FILE)
+
+    stages = {}
+
+    def upload():
+        open(input_file, 'wb').close()
+        with open(fasta_file, 'rb') as handle:
+            for chunk in iter(lambda: handle.read(job_queue.UPLOAD_CHUNK_SIZE), b''):
+                job_queue.append_chunk(input_file, io.BytesIO(chunk))
+        return job_queue.count_records(input_file)
+
+    total, stages["upload"] = time_stage(upload, 0, repeat)
+
+    chunks, stages["parse"] = time_stage(lambda: list(read_chunks(input_file, chunk_size)), 0, repeat)
+    n_sequences = sum(len(seq_ids) for seq_ids, _ in chunks)
+    for stage in ("upload", "parse"):
+        stages[stage]["sequences_per_second"] = round(n_sequences / stages[stage]["seconds"], 1) \
+            if stages[stage]["seconds"] > 0 else None
+
+    features, stages["features"] = time_stage(
+        lambda: [get_features_matrix(sequences) for _, sequences in chunks], n_sequences, repeat)
+    _, stages["predict"] = time_stage(
+        lambda: [predict_with_proba(trained_model, X) for X in features], n_sequences, repeat)
+
+    frames = [job_queue.score_sequences(trained_model, seq_ids, sequences) for seq_ids, sequences in chunks]
+    del chunks, features
+    results_file = os.path.join(job_path, job_queue.RESULTS_FILE)
+
+    def write():
+        written = 0
+        for df in frames:
+            df.to_csv(results_file, mode='w' if written == 0 else 'a', header=written == 0, index=False)
+            written += len(df)
+
+    _, stages["write"] = time_stage(write, n_sequences, repeat)
+    del frames
+
+    def end_to_end():
+        if os.path.isfile(results_file):
+            os.remove(results_file)
+        job_queue._init_worker(trained_model, None, None)
+        job_queue._run_job(job_path, total, chunk_size)
+
+    _, stages["end_to_end"] = time_stage(end_to_end, n_sequences, repeat)
+    return n_sequences, stages
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    '''
+    Method: Prints the throughput of every stage relative to a baseline benchmark JSON
+    '''
+    previous = {(dataset["name"], path, stage): timing["sequences_per_second"]
+                for dataset in baseline["datasets"]
+                for path, stages in dataset["paths"].items() for stage, timing in stages.items()}
+    print(f"compared with {baseline.get('commit') or 'baseline'} (sequences/second, new/old):")
+    for dataset in results["datasets"]:
+        for path, stages in dataset["paths"].items():
+            for stage, timing in stages.items():
+                old = previous.get((dataset["name"], path, stage))
+                if old and timing["sequences_per_second"]:
+                    print(f"  {dataset['name']:<30} {path:<5} {stage:<11} "
+                          f"{timing['sequences_per_second']:>12.1f} {timing['sequences_per_second'] / old:>6.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='benchmark.py',
+                                     description="Benchmark the throughput of the effector prediction pipeline.")
+    parser.add_argument("--synthetic", type=int, nargs='+', default=None, metavar="N_SEQUENCES",
+                        help="Sizes of synthetic proteomes to generate (default: 10000 unless --secretomes or --fasta is given).")
+    parser.add_argument("--length-distribution", choices=LENGTH_DISTRIBUTIONS, default="lognormal",
+                        help="Length distribution of synthetic proteins (default: %(default)s).")
+    parser.add_argument("--mean-length", type=int, default=400,
+                        help="Median (lognormal) or mean length of synthetic proteins (default: %(default)s).")
+    parser.add_argument("--length-spread", type=float, default=0.6,
+                        help="Sigma of log length (lognormal), or spread as a fraction of the mean length (default: %(default)s).")
+    parser.add_argument("--secretomes", type=str, nargs='?', const=BUNDLED_SECRETOMES, default=None,
+                        metavar="PATTERN",
+                        help="Also benchmark the bundled secretomes, or the FASTA files matching PATTERN.")
+    parser.add_argument("--fasta", type=str, nargs='+', default=[], help="Also benchmark these FASTA files.")
+    parser.add_argument("-m", "--model", type=str, default=DEFAULT_MODEL_FILE,
+                        help="Model scored with (default: %(default)s).")
+    parser.add_argument("--paths", choices=["cli", "dash"], nargs='+', default=["cli", "dash"],
+                        help="Pipelines to benchmark (default: both).")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Runs per stage, the fastest is reported (default: %(default)s).")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the synthetic proteomes (default: %(default)s).")
+    parser.add_argument("-o", "--output", type=str, default="benchmark.json",
+                        help="JSON file the results are written to (default: %(default)s).")
+    parser.add_argument("--baseline", type=str, default=None,
+                        help="Earlier benchmark JSON to compare the results with.")
+    args = parser.parse_args()
+
+    if not sys.warnoptions:
+        warnings.simplefilter("ignore")
+    for path in [args.model] + args.fasta + ([args.baseline] if args.baseline else []):
+        if not os.path.exists(path):
+            exit(f"{path} does not exist.")
+
+    synthetic = args.synthetic
+    if synthetic is None:
+        synthetic = [] if args.secretomes or args.fasta else [10000]
+
+    trained_model = load_model(args.model)
+    dash_path = import_dash_path() if "dash" in args.paths else None
+
+    work_dir = tempfile.mkdtemp(prefix="effectoro_benchmark_")
+    try:
+        datasets = []
+        for n_sequences in synthetic:
+            fasta_file = os.path.join(work_dir, f"synthetic_{n_sequences}.fasta")
+            residues = write_synthetic_fasta(fasta_file, n_sequences, args.length_distribution,
+                                             args.mean_length, args.length_spread, args.seed)
+            datasets.append({"name": os.path.basename(fasta_file), "file": None, "residues": residues,
+                             "synthetic": {"sequences": n_sequences, "length_distribution": args.length_distribution,
+                                           "mean_length": args.mean_length, "length_spread": args.length_spread,
+                                           "seed": args.seed},
+                             "_path": fasta_file})
+        fasta_files = sorted(glob.glob(args.secretomes)) if args.secretomes else []
+        for fasta_file in fasta_files + args.fasta:
+            datasets.append({"name": os.path.basename(fasta_file), "file": fasta_file, "_path": fasta_file})
+
+        for dataset in datasets:
+            fasta_file = dataset.pop("_path")
+            dataset["paths"] = {}
+            dataset["sequences"] = 0
+            if "cli" in args.paths:
+                n_sequences, dataset["paths"]["cli"] = benchmark_cli(trained_model, fasta_file, work_dir,
+                                                                     repeat=args.repeat)
+                dataset["sequences"] = n_sequences
+            if dash_path is not None:
+                n_sequences, dataset["paths"]["dash"] = benchmark_dash(trained_model, fasta_file, work_dir,
+                                                                       dash_path, repeat=args.repeat)
+                dataset["sequences"] = n_sequences
+            for path, stages in dataset["paths"].items():
+                print(f"{dataset['name']} ({dataset['sequences']} sequences), {path}: " +
+                      ", ".join(f"{stage} {timing['sequences_per_second']} seq/s" for stage, timing in stages.items()))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    results = {
+        "commit": git_commit(),
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "platform": {"python": sys.version.split()[0], "machine": platform.machine(),
+                     "system": platform.platform(), "cpus": os.cpu_count()},
+        "model": args.model,
+        "repeat": args.repeat,
+        "datasets": datasets,
+    }
+    with open(args.output, 'w') as handle:
+        json.dump(results, handle, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as handle:
+            compare(results, json.load(handle))
+
+
+if __name__ == "__main__":
+    main()
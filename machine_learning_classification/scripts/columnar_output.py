@@ -0,0 +1,168 @@
+import os
+
+from feature_engine import FEATURE_NAMES
+from motifs import MOTIF_COLUMNS
+from predict_effectors import EFFECTORS_FILE, ResultWriter
+
+## Columnar (Parquet or Arrow IPC) output of predict_effectors.py.
+##
+## Instead of effector_classification_table.csv, the scored chunks are
+## appended to a compressed columnar table holding the predictions, the
+## averaged features (so results can be re-scored or plotted without the
+## FASTA) and, with --motifs, the motif columns. Sequences, which make up
+## most of a CSV of a large ORF set, go to a second file keyed by proteinID
+## and are only read when asked for. Either file can be limited to a subset
+## of columns. Needs pyarrow (pip install pyarrow).
+
+OUTPUT_FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+TABLE_NAME = "effector_classification_table"
+SEQUENCES_NAME = "effector_sequences"
+
+DEFAULT_COMPRESSION = "zstd"
+
+# Arrow type of every column a table may hold
+COLUMN_TYPES = dict(
+    [("proteinID", "string"), ("prediction", "string"), ("probability", "double"), ("meaning", "string")]
+    + [(name, "double") for name in FEATURE_NAMES]
+    + [("rxlr_position", "int64"), ("eer_position", "int64"), ("rxlr_eer", "bool"), ("wy", "bool")]
+)
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("writing Parquet or Arrow output needs pyarrow (pip install pyarrow)")
+    return pyarrow
+
+
+def output_files(output_format, directory="."):
+    '''
+    Method: Returns the (table, sequences) file paths of an output format
+    '''
+    suffix = OUTPUT_FORMATS[output_format]
+    return (os.path.join(directory, TABLE_NAME + suffix),
+            os.path.join(directory, SEQUENCES_NAME + suffix))
+
+
+def available_columns(motifs=False):
+    '''
+    Method: Returns the columns a columnar table can hold, 'sequence' standing for the sequences file
+    '''
+    columns = ["proteinID", "sequence", "prediction", "probability", "meaning"] + FEATURE_NAMES
+    if motifs:
+        columns += MOTIF_COLUMNS
+    return columns
+
+
+class _ColumnarFile:
+    # a Parquet or Arrow IPC file written one record batch at a time
+    def __init__(self, path, schema, output_format, compression):
+        pyarrow = _import_pyarrow()
+        self.schema = schema
+        if output_format == "parquet":
+            self._writer = pyarrow.parquet.ParquetWriter(path, schema, compression=compression)
+        else:
+            options = pyarrow.ipc.IpcWriteOptions(compression=compression)
+            self._writer = pyarrow.ipc.new_file(path, schema, options=options)
+
+    def write(self, frame):
+        pyarrow = _import_pyarrow()
+        self._writer.write_table(pyarrow.Table.from_pandas(frame, schema=self.schema, preserve_index=False))
+
+    def close(self):
+        self._writer.close()
+
+
+class ColumnarResultWriter(ResultWriter):
+    '''
+    Appends scored chunks to a columnar table, a sequences file and the effector FASTA
+    '''
+
+    def __init__(self, output_format="parquet", directory=".", effectors_file=EFFECTORS_FILE, motifs=False,
+                 columns=None, compression=DEFAULT_COMPRESSION):
+        '''
+        Input:
+
+            - output_format: one of OUTPUT_FORMATS
+            - directory: directory of the table and sequences files
+            - effectors_file: path of the predicted effectors FASTA file
+            - motifs: whether the chunks carry the motif columns
+            - columns: columns to keep (default: all of available_columns()); the
+              sequences file is only written if 'sequence' is among them
+            - compression: codec of both files, e.g. zstd, lz4 or none
+        '''
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"unknown output format {output_format!r}")
+        available = available_columns(motifs)
+        columns = list(columns) if columns else available
+        unknown = [column for column in columns if column not in available]
+        if unknown:
+            raise ValueError(f"unknown columns {', '.join(unknown)}; choose from {', '.join(available)}")
+
+        self.output_format = output_format
+        self.compression = None if compression == "none" else compression
+        self.table_file, self.sequences_file = output_files(output_format, directory)
+        # proteinID keys both files, so it is always kept
+        self.table_columns = ["proteinID"] + [column for column in columns
+                                              if column not in ("proteinID", "sequence")]
+        self.with_sequences = "sequence" in columns
+        self.features = any(column in FEATURE_NAMES for column in self.table_columns)
+        self.sequences = None
+        super().__init__(self.table_file, effectors_file, motifs)
+        self.columns = self.table_columns
+
+    def _schema(self, columns):
+        pyarrow = _import_pyarrow()
+        types = dict(COLUMN_TYPES, sequence="string")
+        return pyarrow.schema([(column, pyarrow.type_for_alias(types[column])) for column in columns])
+
+    def _open_table(self, table_file):
+        if self.with_sequences:
+            self.sequences = _ColumnarFile(self.sequences_file, self._schema(["proteinID", "sequence"]),
+                                           self.output_format, self.compression)
+        return _ColumnarFile(table_file, self._schema(self.table_columns), self.output_format, self.compression)
+
+    def _write_table(self, resultDF):
+        self.table.write(resultDF[self.table_columns])
+        if self.sequences is not None:
+            self.sequences.write(resultDF[["proteinID", "sequence"]])
+
+    def _close_table(self):
+        # files without any batch still hold the schema, so they read as empty tables
+        self.table.close()
+        if self.sequences is not None:
+            self.sequences.close()
+
+
+def read_results(table_file, columns=None, sequences_file=None):
+    '''
+    Method: Reads a columnar classification table into a DataFrame
+
+    Input:
+
+        - table_file: .parquet or .arrow table written by ColumnarResultWriter
+        - columns: columns to read (default: all), only these are decoded
+        - sequences_file: optional sequences file of the same run, adding the sequence column
+
+    Both files are written row by row together, so sequences are joined by position.
+    '''
+    pyarrow = _import_pyarrow()
+
+    def read(path, read_columns):
+        if path.endswith(OUTPUT_FORMATS["arrow"]):
+            with pyarrow.memory_map(path) as source:
+                table = pyarrow.ipc.open_file(source).read_all()
+            return table.select(read_columns) if read_columns else table
+        return pyarrow.parquet.read_table(path, columns=read_columns)
+
+    resultDF = read(table_file, columns).to_pandas()
+    if sequences_file:
+        sequences = read(sequences_file, ["sequence"]).column("sequence").to_pandas()
+        if len(sequences) != len(resultDF):
+            raise ValueError(f"{sequences_file} does not belong to {table_file}")
+        resultDF["sequence"] = sequences.values
+    return resultDF
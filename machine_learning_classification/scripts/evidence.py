@@ -0,0 +1,230 @@
+import argparse
+import glob
+import os
+
+import pandas as pd
+
+from fasta_reader import read_ids, read_records
+
+## take in (per secretome):
+##    1) secreted proteins fasta file
+##    2) any of: ML predictions (ID list or effector_classification_table.csv),
+##       lineage-specific IDs, RXLR-EER IDs, WY IDs
+
+## RUN LIKE THIS:
+##    python3 evidence.py --results-dir ../../results/EffectorO_genome_results
+##    python3 evidence.py --secretome sp_B_lac-SF5.protein.fasta --ml ml_sp_B_lac-SF5.protein.fasta \
+##        --lsp lsgIDs_sp_B_lac-SF5.protein.fasta --rxlr-eer rxlr_eer_cleaved_sp_B_lac-SF5.protein.fasta \
+##        --wy wy_cleaved_sp_B_lac-SF5.protein.fasta -o B_lac_evidence
+##
+## the candidate sets of every method are loaded as ID sets and the secretome
+## is read once, writing the evidence table and the union/intersection fasta
+## files as it goes
+
+## output (per secretome):
+##    1) evidence_table.csv: proteinID|one column per method|number of methods
+##    2) union_candidates.fasta: proteins found by any method
+##    3) intersection_candidates.fasta: proteins found by every method given
+##    4) with --results-dir: ML_and_LSP_overlap_results/mlRF88_LSP_closeRemove_30_{SPECIES}
+
+METHODS = ["ml", "lsp", "rxlr_eer", "wy"]
+
+EVIDENCE_TABLE_FILE = "evidence_table.csv"
+UNION_FILE = "union_candidates.fasta"
+INTERSECTION_FILE = "intersection_candidates.fasta"
+
+# layout of results/EffectorO_genome_results: {method: (directory, file prefix)}
+RESULTS_LAYOUT = {
+    "ml": ("ML_results", "ml_"),
+    "lsp": ("LSP_results", "lsgIDs_"),
+    "rxlr_eer": ("RXLREER_results", "rxlr_eer_cleaved_"),
+    "wy": ("WY_results", "wy_cleaved_"),
+}
+SECRETOMES_DIR = "secretomes"
+OVERLAP_DIR = "ML_and_LSP_overlap_results"
+OVERLAP_PREFIX = "mlRF88_LSP_closeRemove_30_"
+EVIDENCE_DIR = "evidence_results"
+
+
+def read_id_list(id_file):
+    '''
+    Method: Returns the IDs of a candidate list, a FASTA file or a plain list of IDs
+
+    Input:
+
+        - id_file: path of the list
+    '''
+    with open(id_file) as handle:
+        first = handle.read(1)
+    if first == '>':
+        return set(read_ids(id_file))
+    with open(id_file) as handle:
+        return {line.split()[0] for line in handle if line.strip()}
+
+
+def read_ml_scores(ml_file):
+    '''
+    Method: Returns {ID: effector probability} of an ML result, or the ID set of an ID list
+
+    Input:
+
+        - ml_file: effector_classification_table.csv of predict_effectors.py, or a list of predicted effector IDs
+    '''
+    if not ml_file.endswith(".csv"):
+        return read_id_list(ml_file)
+    table = pd.read_csv(ml_file, usecols=["proteinID", "probability", "prediction"],
+                        dtype={"proteinID": str, "prediction": str})
+    return {seq_id: probability for seq_id, probability, prediction
+            in zip(table["proteinID"], table["probability"], table["prediction"]) if prediction == '1'}
+
+
+def combine_evidence(secretome_file, candidates, output_dir):
+    '''
+    Method: Joins the candidate sets of every method on protein ID in one pass over the secretome
+
+    Input:
+
+        - secretome_file: fasta file of the secretome, or None to only tabulate the candidates
+        - candidates: {method: set of IDs, or {ID: score} for scored methods}
+        - output_dir: directory receiving the evidence table and candidate fasta files
+
+    Candidates missing from the secretome are still listed in the table, but
+    have no sequence to write to the fasta files. Returns a dictionary
+    summarizing the run.
+    '''
+    os.makedirs(output_dir, exist_ok=True)
+    methods = [method for method in METHODS if method in candidates]
+    scored = [method for method in methods if isinstance(candidates[method], dict)]
+    columns = ["proteinID"] + methods + [method + "_probability" for method in scored] + ["n_methods"]
+
+    remaining = set().union(*candidates.values())
+    n_proteins = n_union = n_intersection = 0
+
+    def evidence_row(seq_id):
+        flags = [seq_id in candidates[method] for method in methods]
+        scores = [candidates[method].get(seq_id, "") for method in scored]
+        return flags, [seq_id] + flags + scores + [sum(flags)]
+
+    with open(os.path.join(output_dir, EVIDENCE_TABLE_FILE), 'w') as table, \
+            open(os.path.join(output_dir, UNION_FILE), 'w') as union, \
+            open(os.path.join(output_dir, INTERSECTION_FILE), 'w') as intersection:
+        table.write(",".join(columns) + "\n")
+        rows = []
+        for header, seq in read_records(secretome_file) if secretome_file else []:
+            seq_id = header.split(None, 1)[0].decode() if header.strip() else ""
+            flags, row = evidence_row(seq_id)
+            rows.append(row)
+            n_proteins += 1
+            remaining.discard(seq_id)
+            if any(flags):
+                union.write(">" + header.decode() + "\n" + seq.decode() + "\n")
+                n_union += 1
+                if all(flags):
+                    intersection.write(">" + header.decode() + "\n" + seq.decode() + "\n")
+                    n_intersection += 1
+            if len(rows) >= 10000:
+                pd.DataFrame(rows, columns=columns).to_csv(table, header=False, index=False)
+                rows = []
+
+        # candidates the secretome does not contain, e.g. from another annotation
+        for seq_id in sorted(remaining):
+            rows.append(evidence_row(seq_id)[1])
+        pd.DataFrame(rows, columns=columns).to_csv(table, header=False, index=False)
+
+    return {"secretome": secretome_file or output_dir, "methods": methods, "proteins": n_proteins,
+            "union": n_union, "intersection": n_intersection, "missing": len(remaining)}
+
+
+def write_overlap(first, second, overlap_file):
+    '''
+    Method: Writes the sorted IDs found in both candidate sets
+    '''
+    with open(overlap_file, 'w') as handle:
+        for seq_id in sorted(set(first) & set(second)):
+            handle.write(seq_id + '\n')
+
+
+def species_name(secretome_file):
+    # sp_Alb_can.protein.fasta -> sp_Alb_can
+    return os.path.basename(secretome_file).split('.')[0]
+
+
+def combine_results_dir(results_dir, output_dir=None, overlap_prefix=OVERLAP_PREFIX):
+    '''
+    Method: Combines the per-method results of every secretome in a results directory
+
+    Input:
+
+        - results_dir: directory laid out like results/EffectorO_genome_results
+        - output_dir: directory for the per-species evidence (default: results_dir/evidence_results)
+        - overlap_prefix: file name prefix of the ML and LSP overlap lists
+    '''
+    output_dir = output_dir or os.path.join(results_dir, EVIDENCE_DIR)
+    overlap_dir = os.path.join(results_dir, OVERLAP_DIR)
+    os.makedirs(overlap_dir, exist_ok=True)
+
+    # every secretome, plus species that only have per-method results
+    names = {os.path.basename(path) for path in glob.glob(os.path.join(results_dir, SECRETOMES_DIR, "*.fasta"))}
+    for directory, prefix in RESULTS_LAYOUT.values():
+        names.update(os.path.basename(path)[len(prefix):]
+                     for path in glob.glob(os.path.join(results_dir, directory, prefix + "*")))
+
+    summaries = []
+    for name in sorted(names):
+        secretome_file = os.path.join(results_dir, SECRETOMES_DIR, name)
+        if not os.path.isfile(secretome_file):
+            secretome_file = None
+        candidates = {}
+        for method, (directory, prefix) in RESULTS_LAYOUT.items():
+            method_file = os.path.join(results_dir, directory, prefix + name)
+            if os.path.isfile(method_file):
+                candidates[method] = read_ml_scores(method_file) if method == "ml" else read_id_list(method_file)
+
+        species = species_name(name)
+        if "ml" in candidates and "lsp" in candidates:
+            write_overlap(candidates["ml"], candidates["lsp"],
+                          os.path.join(overlap_dir, overlap_prefix + species))
+        summaries.append(combine_evidence(secretome_file, candidates, os.path.join(output_dir, species)))
+    return summaries
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='evidence.py',
+                                     description="Combine ML, lineage-specificity, RXLR-EER and WY candidates per protein.")
+    parser.add_argument("--results-dir", type=str, default=None,
+                        help="Directory laid out like results/EffectorO_genome_results; every secretome in it is combined.")
+    parser.add_argument("--secretome", type=str, default=None, help="Secreted proteins FASTA file.")
+    parser.add_argument("--ml", type=str, default=None,
+                        help="ML predictions: effector_classification_table.csv or a list of predicted effector IDs.")
+    parser.add_argument("--lsp", type=str, default=None, help="IDs of lineage-specific proteins.")
+    parser.add_argument("--rxlr-eer", type=str, default=None, help="IDs of proteins with an RXLR-EER motif.")
+    parser.add_argument("--wy", type=str, default=None, help="IDs of proteins with a WY domain.")
+    parser.add_argument("-o", "--output-dir", type=str, default=None,
+                        help="Output directory (default: current directory, or RESULTS_DIR/evidence_results).")
+    parser.add_argument("--overlap-prefix", type=str, default=OVERLAP_PREFIX,
+                        help="File name prefix of the ML and LSP overlap lists written with --results-dir (default: %(default)s).")
+    args = parser.parse_args()
+
+    if (args.results_dir is None) == (args.secretome is None):
+        parser.error("give either --results-dir or --secretome")
+
+    if args.results_dir is not None:
+        summaries = combine_results_dir(args.results_dir, args.output_dir, args.overlap_prefix)
+    else:
+        method_files = {"ml": args.ml, "lsp": args.lsp, "rxlr_eer": args.rxlr_eer, "wy": args.wy}
+        for path in [args.secretome] + [path for path in method_files.values() if path]:
+            if not os.path.isfile(path):
+                exit(f"{path} either is a directory or does not exist.")
+        candidates = {method: read_ml_scores(path) if method == "ml" else read_id_list(path)
+                      for method, path in method_files.items() if path}
+        summaries = [combine_evidence(args.secretome, candidates, args.output_dir or ".")]
+
+    for summary in summaries:
+        print(f"{summary['secretome']}: {summary['proteins']} proteins, {summary['union']} found by any of "
+              f"{', '.join(summary['methods']) or 'no method'}, {summary['intersection']} by all")
+        if summary["missing"]:
+            print(f"  {summary['missing']} candidate IDs are not in the secretome")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+import argparse
+import mmap
+import os
+
+## Lightweight FASTA reading.
+##
+## read_fasta() memory-maps a FASTA file and yields (ID, sequence bytes) pairs,
+## the same IDs and residues Bio.SeqIO gives, without building a SeqRecord
+## per sequence. FastaIndex keeps a samtools-style .fai index next to the file
+## (name, length, offset, line bases, line width) and fetches single sequences
+## by ID without rescanning the file. read_fasta_stream() reads records from a
+## stream that cannot be mapped, such as the body of a web request.
+
+## RUN LIKE THIS:
+##    python3 fasta_reader.py index {INPUT_FASTA_PATH}
+##    python3 fasta_reader.py fetch {INPUT_FASTA_PATH} {ID} [ID ...]
+
+INDEX_SUFFIX = ".fai"
+
+# whitespace dropped from sequence lines
+_SEQUENCE_WHITESPACE = b" \t\r\n"
+
+# bytes of records split at a time
+BLOCK_SIZE = 16 * 1024**2
+
+
+def _map_file(handle):
+    # empty files cannot be memory-mapped
+    if os.fstat(handle.fileno()).st_size == 0:
+        return b""
+    return mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _records(data, block_size=BLOCK_SIZE):
+    # yields (header, raw sequence lines, offset of the sequence) for every record;
+    # the file is split a block of whole records at a time, which keeps the
+    # per-record work in C
+    if data[:1] == b">":
+        start = 0
+    else:
+        # anything before the first header line (comments, blank lines) is skipped
+        start = data.find(b"\n>")
+        if start == -1:
+            return
+        start += 1
+    while start < len(data):
+        stop = data.find(b"\n>", start + block_size)
+        stop = len(data) if stop == -1 else stop + 1
+        offset = start + 1
+        for record in data[start + 1:stop].split(b"\n>"):
+            header, _, lines = record.partition(b"\n")
+            yield header, lines, offset + len(header) + 1
+            offset += len(record) + 2
+        start = stop
+
+
+def record_id(header):
+    '''
+    Method: Returns the ID of a header line (without '>'), its first word
+    '''
+    words = header.split(None, 1)
+    return words[0].decode() if words else ""
+
+
+def read_fasta(fasta_file):
+    '''
+    Method: Yields (ID, sequence) pairs of a FASTA file, sequences as bytes
+
+    Input:
+
+        - fasta_file: path of the FASTA file to read
+    '''
+    with open(fasta_file, 'rb') as handle:
+        data = _map_file(handle)
+        try:
+            for header, lines, _ in _records(data):
+                yield record_id(header), lines.translate(None, _SEQUENCE_WHITESPACE)
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+
+
+def read_fasta_stream(handle):
+    '''
+    Method: Yields (ID, sequence) pairs of a binary FASTA stream, sequences as bytes
+
+    Input:
+
+        - handle: readable binary stream, e.g. a request body or a gzip.GzipFile
+
+    The stream is read line by line, so a record is yielded as soon as the
+    next header line arrives and only one sequence is held at a time.
+    '''
+    seq_id, lines = None, []
+    for line in handle:
+        if line.startswith(b">"):
+            if seq_id is not None:
+                yield seq_id, b"".join(lines).translate(None, _SEQUENCE_WHITESPACE)
+            seq_id, lines = record_id(line[1:]), []
+        elif seq_id is not None:
+            # anything before the first header line is skipped, as in read_fasta()
+            lines.append(line)
+    if seq_id is not None:
+        yield seq_id, b"".join(lines).translate(None, _SEQUENCE_WHITESPACE)
+
+
+def read_records(fasta_file):
+    '''
+    Method: Yields (header line without '>', sequence) pairs of a FASTA file, both as bytes
+    '''
+    with open(fasta_file, 'rb') as handle:
+        data = _map_file(handle)
+        try:
+            for header, lines, _ in _records(data):
+                yield header.rstrip(b"\r"), lines.translate(None, _SEQUENCE_WHITESPACE)
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+
+
+def read_ids(fasta_file):
+    '''
+    Method: Yields the IDs of a FASTA file without reading its sequences
+    '''
+    with open(fasta_file, 'rb') as handle:
+        data = _map_file(handle)
+        try:
+            for header, _, _ in _records(data):
+                yield record_id(header)
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+
+
+def build_index(fasta_file, index_file=None):
+    '''
+    Method: Writes a .fai index of a FASTA file and returns its path
+
+    Input:
+
+        - fasta_file: path of the FASTA file to index
+        - index_file: path of the index (default: fasta_file + ".fai")
+
+    Line bases and width are taken from the first sequence line, as samtools
+    does; fetching here does not depend on them, so ragged files still work.
+    '''
+    index_file = index_file or fasta_file + INDEX_SUFFIX
+    tmp_file = f"{index_file}.{os.getpid()}.tmp"
+    with open(fasta_file, 'rb') as handle, open(tmp_file, 'w') as index:
+        data = _map_file(handle)
+        try:
+            for header, lines, offset in _records(data):
+                first_line = lines[:lines.find(b"\n") + 1] or lines
+                length = len(lines.translate(None, _SEQUENCE_WHITESPACE))
+                index.write(f"{record_id(header)}\t{length}\t{offset}\t"
+                            f"{len(first_line.rstrip())}\t{len(first_line)}\n")
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+    os.replace(tmp_file, index_file)
+    return index_file
+
+
+class FastaIndex:
+    '''
+    Random access to the sequences of a FASTA file by ID
+    '''
+
+    def __init__(self, fasta_file, index_file=None):
+        self.fasta_file = fasta_file
+        self.index_file = index_file or fasta_file + INDEX_SUFFIX
+        # (re)build the index if it is missing or older than the FASTA file
+        if not os.path.isfile(self.index_file) or \
+                os.path.getmtime(self.index_file) < os.path.getmtime(fasta_file):
+            build_index(fasta_file, self.index_file)
+
+        self.offsets = {}
+        with open(self.index_file) as index:
+            for line in index:
+                name, length, offset = line.split('\t')[:3]
+                self.offsets.setdefault(name, (int(offset), int(length)))
+
+        self._handle = open(fasta_file, 'rb')
+        self._data = _map_file(self._handle)
+
+    def __contains__(self, seq_id):
+        return seq_id in self.offsets
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def ids(self):
+        return list(self.offsets)
+
+    def fetch(self, seq_id):
+        '''
+        Method: Returns the sequence of seq_id as bytes, KeyError if it is not in the file
+        '''
+        offset, length = self.offsets[seq_id]
+        if length == 0:
+            return b""
+        end = self._data.find(b"\n>", offset)
+        end = len(self._data) if end == -1 else end + 1
+        return self._data[offset:end].translate(None, _SEQUENCE_WHITESPACE)
+
+    def fetch_many(self, seq_ids):
+        '''
+        Method: Yields (ID, sequence) pairs for the IDs present in the file
+        '''
+        for seq_id in seq_ids:
+            if seq_id in self.offsets:
+                yield seq_id, self.fetch(seq_id)
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._handle.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='fasta_reader.py',
+                                     description="Index a FASTA file, or fetch sequences from it by ID.")
+    parser.add_argument("command", choices=["index", "fetch"])
+    parser.add_argument("fasta", type=str, help="Input FASTA file.")
+    parser.add_argument("ids", type=str, nargs='*', help="IDs of the sequences to fetch.")
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.fasta):
+        exit(f"{args.fasta} either is a directory or does not exist.")
+
+    if args.command == "index":
+        print(f"Wrote {build_index(args.fasta)}")
+        return
+
+    index = FastaIndex(args.fasta)
+    try:
+        for seq_id in args.ids:
+            if seq_id not in index:
+                exit(f"{seq_id} is not in {args.fasta}")
+            print(">" + seq_id)
+            print(index.fetch(seq_id).decode())
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
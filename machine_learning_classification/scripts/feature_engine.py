@@ -0,0 +1,130 @@
+import hashlib
+
+import numpy as np
+import FEAT
+
+## Vectorized replacement for the per-residue get_average_features loop.
+##
+## The six FEAT scales are compiled once into a 256 x 6 lookup matrix indexed
+## by residue byte. A batch of sequences is encoded into a (sequences x 900)
+## byte matrix and pushed through the table one residue column at a time, so
+## every sequence is still accumulated left to right exactly like the original
+## loop (results are bit-for-bit identical).
+
+MAX_SEQUENCE_LENGTH = 900
+
+FEATURE_NAMES = ["gravy", "hydrophobicity", "exposed",
+                 "disorder", "bulkiness", "interface"]
+
+FEATURE_TABLES = [FEAT.GRAVY_DIC, FEAT.HYDRO_DIC, FEAT.EXPOSED_DIC,
+                  FEAT.DISORDER_DIC, FEAT.BULKY_DIC, FEAT.INTERFACE_DIC]
+
+# byte used to pad short sequences; like any unknown residue it maps to zeros
+PAD_BYTE = b"\0"
+
+
+def compile_lookup_table(tables=FEATURE_TABLES):
+    '''
+    Method: Builds a 256 x len(tables) lookup matrix of residue scale values
+
+    Input:
+
+        - tables: list of FEAT-style {residue: value} dictionaries
+
+    Residues are recognized in either case (the original loop upper-cased
+    them); every other byte maps to a row of zeros so unknown residues add
+    nothing but still count towards the sequence length.
+    '''
+    table = np.zeros((256, len(tables)), dtype=np.float64)
+    for aa in FEAT.INTERFACE_DIC:
+        for col, scale in enumerate(tables):
+            table[ord(aa.upper()), col] = scale[aa]
+            table[ord(aa.lower()), col] = scale[aa]
+    return table
+
+
+LOOKUP_TABLE = compile_lookup_table()
+
+
+def feature_table_hash(table=LOOKUP_TABLE, max_length=MAX_SEQUENCE_LENGTH):
+    '''
+    Method: Hashes the FEAT scales, feature names and residue cutoff the features depend on
+
+    Models record it when trained, so a change to FEAT.py shows up as a mismatch.
+    '''
+    digest = hashlib.sha256(np.ascontiguousarray(table, dtype=np.float64).tobytes())
+    digest.update(",".join(FEATURE_NAMES).encode())
+    digest.update(str(max_length).encode())
+    return digest.hexdigest()[:16]
+
+
+def to_residue_bytes(sequence, max_length=MAX_SEQUENCE_LENGTH):
+    '''
+    Method: Returns the first max_length residues of a sequence as ASCII bytes
+    '''
+    if isinstance(sequence, (bytes, bytearray)):
+        return bytes(sequence[:max_length])
+
+    text = str(sequence[:max_length])
+    if not text.isascii():
+        # mirror aa.upper() on the odd non-ASCII character; anything that
+        # doesn't upper-case to a single residue letter is unknown
+        text = "".join(aa.upper() if len(aa.upper()) == 1 and aa.upper().isascii()
+                       else "?" for aa in text)
+    return text.encode("ascii")
+
+
+def encode_sequences(sequences, max_length=MAX_SEQUENCE_LENGTH):
+    '''
+    Method: Encodes a batch of sequences into a padded byte matrix
+
+    Input:
+
+        - sequences: iterable of amino acid strings, Seq objects or bytes
+        - max_length: number of leading residues to keep
+
+    Returns a (sequences x width) uint8 matrix and the per-sequence lengths.
+    '''
+    encoded = [to_residue_bytes(seq, max_length) for seq in sequences]
+    lengths = np.array([len(seq) for seq in encoded], dtype=np.int64)
+    width = int(lengths.max()) if len(encoded) else 0
+
+    buffer = b"".join(seq.ljust(width, PAD_BYTE) for seq in encoded)
+    codes = np.frombuffer(buffer, dtype=np.uint8).reshape(len(encoded), width)
+    return codes, lengths
+
+
+def get_features_matrix(sequences, max_length=MAX_SEQUENCE_LENGTH, table=LOOKUP_TABLE):
+    '''
+    Method: Calculates the averaged features of a batch of sequences
+
+    Input:
+
+        - sequences: iterable of amino acid strings, Seq objects or bytes
+        - max_length: number of leading residues averaged over
+        - table: residue lookup matrix from compile_lookup_table()
+
+    Returns a (sequences x features) float64 matrix, in FEATURE_NAMES order.
+    '''
+    codes, lengths = encode_sequences(sequences, max_length)
+    if (lengths == 0).any():
+        raise ZeroDivisionError("cannot calculate features of an empty sequence")
+
+    sums = np.zeros((codes.shape[0], table.shape[1]), dtype=np.float64)
+    for position in range(codes.shape[1]):
+        sums += table[codes[:, position]]
+
+    return sums / lengths[:, np.newaxis]
+
+
+def get_average_features(sequence, df=0, protID=0):
+    '''
+    Method: Calculates net averages of the FEAT scales for a single sequence
+
+    Input:
+
+        - sequence: amino acid string
+        - df: unused, kept for backwards compatibility
+        - protID: unused, kept for backwards compatibility
+    '''
+    return get_features_matrix([sequence])[0].tolist()
@@ -0,0 +1,189 @@
+import argparse
+import collections
+import os
+import re
+
+from fasta_reader import read_records
+
+## take in:
+##    1) predicted effectors fasta file (output of predict_effectors.py)
+##    2) (optional) filter list, a file of sequence IDs to focus on (e.g. from fasta_to_list.py)
+##    3) (optional) minimum and/or maximum effector probability cutoffs
+
+## RUN LIKE THIS:
+##    python3 filter_predictions.py -i predicted_effectors.fasta -f {FILTER_LIST_PATH} -L 0.85
+##
+## the Python counterpart of the filtering in analyze_effectoro.r: the filter
+## list is held in a hash set and the predictions are read once, so large
+## filter lists no longer mean a scan of the list for every sequence
+
+## output (in {FILTER_LIST_NAME}_analysis_results/ next to the filter list if one is given):
+##    1) fasta file of the predicted effectors in the filter list
+##    2) log of filter list IDs missing from the predictions ({FILTER_LIST_NAME}_analysis_results_warnings.log)
+##    3) frequency tables of probabilities and sequence lengths
+##    4) fasta file of the sequences within the cutoffs (predicted_effectors_filtered_L{MIN}_H{MAX}.fasta)
+
+MISSING_WARNING = "Warning: these sequence names are not found in the input FASTA file:"
+
+PROBABILITY_FREQUENCIES_FILE = "effector_probabilities_frequencies.txt"
+LENGTH_FREQUENCIES_FILE = "length_of_seqs_frequencies.txt"
+
+
+def format_number(value):
+    # numbers are written the way R prints them (0.5, not 0.50 or 0.500000)
+    return f"{value:.15g}"
+
+
+def analysis_dir(filter_list_file):
+    '''
+    Method: Returns the output directory of a filter list, named like analyze_effectoro.r does
+    '''
+    return re.sub(r"[.][a-zA-Z0-9,]+", '', filter_list_file) + "_analysis_results"
+
+
+def cutoff_file_name(min_cutoff=None, max_cutoff=None):
+    '''
+    Method: Returns the name of the fasta file of sequences within the cutoffs
+    '''
+    name = "predicted_effectors_filtered"
+    if min_cutoff is not None:
+        name += "_L" + format_number(min_cutoff)
+    if max_cutoff is not None:
+        name += "_H" + format_number(max_cutoff)
+    return name + ".fasta"
+
+
+def read_filter_list(filter_list_file):
+    '''
+    Method: Returns the IDs of a filter list in file order, without duplicates
+    '''
+    with open(filter_list_file) as handle:
+        return list(dict.fromkeys(line.strip() for line in handle if line.strip()))
+
+
+def header_probability(header):
+    '''
+    Method: Returns the probability of a predict_effectors.py header (">ID meaning probability=P")
+    '''
+    fields = header.split(' ')
+    if len(fields) < 3 or not fields[2].startswith("probability="):
+        raise ValueError(f"no probability in FASTA header {header!r}")
+    return float(fields[2].split('=')[1])
+
+
+def write_frequencies(counts, out_file):
+    # most frequent first, ties in ascending order of value, like R's sorted table()
+    with open(out_file, 'w') as handle:
+        handle.write('"data"\t"Freq"\n')
+        for value, count in sorted(counts.items(), key=lambda item: (-item[1], item[0])):
+            handle.write(f'"{format_number(value)}"\t{count}\n')
+
+
+def filter_predictions(fasta_file, filter_ids=None, min_cutoff=None, max_cutoff=None,
+                       filtered_file=None, cutoff_file=None):
+    '''
+    Method: Streams the predicted effectors once, writing the filter list and cutoff subsets
+
+    Input:
+
+        - fasta_file: predicted effectors fasta file
+        - filter_ids: optional IDs to keep, all sequences are kept without them
+        - min_cutoff/max_cutoff: optional probability bounds (inclusive) of the cutoff subset
+        - filtered_file: fasta file for the sequences in filter_ids
+        - cutoff_file: fasta file for the kept sequences within the cutoffs
+
+    Returns the filter IDs not found, and the probability and length counts of the kept sequences.
+    '''
+    # IDs are dropped once found, so only the first record of a repeated ID is kept
+    remaining = set(filter_ids) if filter_ids is not None else None
+    probabilities = collections.Counter()
+    lengths = collections.Counter()
+
+    filtered = open(filtered_file, 'w') if filtered_file else None
+    within_cutoffs = open(cutoff_file, 'w') if cutoff_file else None
+    try:
+        for header, seq in read_records(fasta_file):
+            header, seq = header.decode(), seq.decode()
+            seq_id = header.split(' ')[0]
+            if remaining is not None:
+                if seq_id not in remaining:
+                    continue
+                remaining.discard(seq_id)
+
+            probability = header_probability(header)
+            probabilities[probability] += 1
+            # doesn't count '*' at end of sequences
+            lengths[len(seq) - 1] += 1
+
+            record = ">" + header + "\n" + seq + "\n"
+            if filtered is not None:
+                filtered.write(record)
+            if within_cutoffs is not None and \
+                    (min_cutoff is None or probability >= min_cutoff) and \
+                    (max_cutoff is None or probability <= max_cutoff):
+                within_cutoffs.write(record)
+    finally:
+        for handle in (filtered, within_cutoffs):
+            if handle is not None:
+                handle.close()
+
+    missing = [seq_id for seq_id in filter_ids if seq_id in remaining] if filter_ids is not None else []
+    return missing, probabilities, lengths
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='filter_predictions.py',
+                                     description="Subset predicted effectors by a list of IDs and/or probability cutoffs.")
+    parser.add_argument("--input", "-i", type=str, required=True,
+                        help="Predicted effectors FASTA file (output of predict_effectors.py).")
+    parser.add_argument("--filter_list", "-f", type=str, default=None,
+                        help="Input file that lists names of sequences to be focused on.")
+    parser.add_argument("--min_cutoff", "-L", type=float, default=None,
+                        help="Minimum effector probability cutoff.")
+    parser.add_argument("--max_cutoff", "-H", type=float, default=None,
+                        help="Maximum effector probability cutoff.")
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.input):
+        exit(f"Input FASTA file {args.input} does not exist.")
+
+    out_dir = "."
+    filter_ids = None
+    filtered_file = None
+    if args.filter_list is not None:
+        if not os.path.isfile(args.filter_list):
+            exit(f"Filter list file {args.filter_list} does not exist.")
+        filter_ids = read_filter_list(args.filter_list)
+        out_dir = analysis_dir(args.filter_list)
+        os.makedirs(out_dir, exist_ok=True)
+        filtered_file = os.path.join(out_dir, os.path.basename(out_dir) + "_predicted_effectors.fasta")
+
+    cutoff_file = None
+    if args.min_cutoff is not None or args.max_cutoff is not None:
+        cutoff_file = os.path.join(out_dir, cutoff_file_name(args.min_cutoff, args.max_cutoff))
+
+    missing, probabilities, lengths = filter_predictions(args.input, filter_ids,
+                                                         args.min_cutoff, args.max_cutoff,
+                                                         filtered_file, cutoff_file)
+
+    # warn user if some filter names were not found in the file
+    if filter_ids is not None:
+        warnings_list = [MISSING_WARNING] + ['\t' + seq_id for seq_id in missing] if missing else []
+        with open(os.path.join(out_dir, os.path.basename(out_dir) + "_warnings.log"), 'w') as log:
+            for line in warnings_list:
+                log.write(line + '\n')
+        if missing:
+            print(MISSING_WARNING, len(missing), "IDs, see the warnings log")
+
+    write_frequencies(probabilities, os.path.join(out_dir, PROBABILITY_FREQUENCIES_FILE))
+    write_frequencies(lengths, os.path.join(out_dir, LENGTH_FREQUENCIES_FILE))
+
+    print("Sequences kept:", sum(probabilities.values()))
+    if filtered_file is not None:
+        print("Filter list sequences in:", filtered_file)
+    if cutoff_file is not None:
+        print("Sequences within the cutoffs in:", cutoff_file)
+
+
+if __name__ == "__main__":
+    main()
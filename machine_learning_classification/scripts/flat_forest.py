@@ -0,0 +1,232 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+## Flat-array Random Forest inference engine.
+##
+## The trees of a fitted scikit-learn forest are exported into contiguous
+## node arrays (feature, threshold, left/right child, per-leaf class
+## probabilities). A batch of rows is then pushed through all trees at once,
+## one tree level per step, and predict_with_proba() returns the classes and
+## probabilities from that single pass. Results match the forest's own
+## predict/predict_proba exactly.
+##
+## Exported forests are plain .npy files, so they load without scikit-learn
+## (or a pinned version of it) and can be memory-mapped by several processes.
+
+## RUN LIKE THIS:
+##    python3 flat_forest.py export ../trained_models/RF_88_best.sav ../trained_models/RF_88_best.flat
+##    python3 flat_forest.py verify ../trained_models/RF_88_best.sav ../trained_models/RF_88_best.flat [FASTA ...]
+##
+## parity with scikit-learn is also checked by tests/test_flat_forest.py on freshly fitted forests
+
+METADATA_FILE = "model.json"
+ARRAY_NAMES = ["feature", "threshold", "left", "right", "leaf_proba", "roots", "classes"]
+
+
+class FlatForest:
+    '''
+    Random Forest classifier evaluated from flat node arrays
+    '''
+
+    def __init__(self, feature, threshold, left, right, leaf_proba, roots, classes, max_depth):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.leaf_proba = leaf_proba
+        self.roots = roots
+        self.classes_ = classes
+        self.max_depth = max_depth
+
+    @classmethod
+    def from_sklearn(cls, forest):
+        '''
+        Method: Exports the trees of a fitted scikit-learn forest classifier
+
+        Input:
+
+            - forest: fitted RandomForestClassifier/ExtraTreesClassifier
+        '''
+        features, thresholds, lefts, rights, leaf_probas, roots = [], [], [], [], [], []
+        max_depth = 0
+        offset = 0
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            node_ids = np.arange(tree.node_count, dtype=np.int32)
+            is_leaf = tree.children_left == -1
+
+            # leaves point back to themselves, so extra steps leave rows in place
+            feature = np.where(is_leaf, 0, tree.feature).astype(np.int32)
+            threshold = np.where(is_leaf, 0.0, tree.threshold).astype(np.float64)
+            left = np.where(is_leaf, node_ids, tree.children_left).astype(np.int32) + offset
+            right = np.where(is_leaf, node_ids, tree.children_right).astype(np.int32) + offset
+
+            # normalize leaf values exactly like DecisionTreeClassifier.predict_proba
+            value = tree.value[:, 0, :forest.n_classes_].astype(np.float64)
+            normalizer = value.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+
+            features.append(feature)
+            thresholds.append(threshold)
+            lefts.append(left)
+            rights.append(right)
+            leaf_probas.append(value / normalizer)
+            roots.append(offset)
+            max_depth = max(max_depth, tree.max_depth)
+            offset += tree.node_count
+
+        return cls(np.concatenate(features), np.concatenate(thresholds),
+                   np.concatenate(lefts), np.concatenate(rights),
+                   np.concatenate(leaf_probas), np.array(roots, dtype=np.int32),
+                   np.asarray(forest.classes_), max_depth)
+
+    def save(self, directory):
+        '''
+        Method: Writes the node arrays (.npy) and metadata to a directory
+        '''
+        os.makedirs(directory, exist_ok=True)
+        for name in ARRAY_NAMES:
+            array = self.classes_ if name == "classes" else getattr(self, name)
+            if array.dtype == object:
+                # string labels are pickled as objects, store them as text
+                array = array.astype(str)
+            np.save(os.path.join(directory, name + ".npy"), array, allow_pickle=False)
+        with open(os.path.join(directory, METADATA_FILE), 'w') as handle:
+            json.dump({"format": "flat_forest", "max_depth": int(self.max_depth),
+                       "n_estimators": int(len(self.roots)), "n_nodes": int(len(self.feature)),
+                       "n_features": int(self.feature.max()) + 1 if len(self.feature) else 0},
+                      handle, indent=2)
+
+    @classmethod
+    def load(cls, directory, mmap_mode=None):
+        '''
+        Method: Loads an exported forest, optionally memory-mapping its arrays
+
+        Input:
+
+            - directory: directory written by save()
+            - mmap_mode: None to read the arrays, 'r' to map them read-only
+        '''
+        with open(os.path.join(directory, METADATA_FILE)) as handle:
+            metadata = json.load(handle)
+        arrays = {name: np.load(os.path.join(directory, name + ".npy"),
+                                mmap_mode=mmap_mode, allow_pickle=False)
+                  for name in ARRAY_NAMES}
+        # classes are tiny and compared often, keep them in memory
+        arrays["classes"] = np.array(arrays["classes"])
+        return cls(max_depth=metadata["max_depth"], **arrays)
+
+    @staticmethod
+    def is_exported(path):
+        return os.path.isfile(os.path.join(path, METADATA_FILE))
+
+    def apply(self, X):
+        '''
+        Method: Returns the leaf reached in every tree, a (trees x rows) node index matrix
+        '''
+        # trees split float32 features against float64 thresholds
+        X = np.ascontiguousarray(np.asarray(X, dtype=np.float32).astype(np.float64).T)
+        n_rows = X.shape[1]
+        if n_rows == 0 or self.max_depth == 0:
+            return np.repeat(self.roots[:, np.newaxis], n_rows, axis=1)
+
+        # every row starts at the roots, so the first level needs no gathers
+        roots = self.roots
+        go_left = X[self.feature[roots]] <= self.threshold[roots][:, np.newaxis]
+        nodes = np.where(go_left, self.left[roots][:, np.newaxis], self.right[roots][:, np.newaxis])
+
+        values = X.ravel()
+        columns = np.arange(n_rows)
+        for _ in range(self.max_depth - 1):
+            go_left = values[self.feature[nodes] * n_rows + columns] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return nodes
+
+    def predict_proba(self, X):
+        leaves = self.apply(X)
+        proba = np.zeros((leaves.shape[1], len(self.classes_)), dtype=np.float64)
+        # trees are summed in order, like the forest does, to get the same rounding
+        for tree_leaves in leaves:
+            proba += self.leaf_proba[tree_leaves]
+        proba /= len(self.roots)
+        return proba
+
+    def predict_with_proba(self, X):
+        '''
+        Method: Returns the predicted classes and class probabilities in one pass
+        '''
+        proba = self.predict_proba(X)
+        return self.classes_.take(np.argmax(proba, axis=1), axis=0), proba
+
+    def predict(self, X):
+        return self.predict_with_proba(X)[0]
+
+
+def compile_model(trained_model):
+    '''
+    Method: Returns a FlatForest for tree ensembles, other models unchanged
+    '''
+    if hasattr(trained_model, "estimators_") and \
+            all(hasattr(estimator, "tree_") for estimator in trained_model.estimators_):
+        return FlatForest.from_sklearn(trained_model)
+    return trained_model
+
+
+def predict_with_proba(trained_model, X):
+    '''
+    Method: Predicted classes and class probabilities, in a single pass when possible
+    '''
+    if hasattr(trained_model, "predict_with_proba"):
+        return trained_model.predict_with_proba(X)
+    return trained_model.predict(X), trained_model.predict_proba(X)
+
+
+def check_parity(trained_model, flat_forest, X):
+    '''
+    Method: Returns True if the flat forest reproduces the model's classes and probabilities exactly
+    '''
+    predictions, probabilities = flat_forest.predict_with_proba(X)
+    return bool(np.array_equal(predictions, trained_model.predict(X)) and
+                np.array_equal(probabilities, trained_model.predict_proba(X)))
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='flat_forest.py',
+                                     description="Export a trained Random Forest into flat node arrays, or verify an export.")
+    parser.add_argument("command", choices=["export", "verify"])
+    parser.add_argument("model", type=str, help="Pickled scikit-learn forest (.sav).")
+    parser.add_argument("flat", type=str, help="Directory of the exported node arrays.")
+    parser.add_argument("fasta", type=str, nargs='*',
+                        help="FASTA files whose features are also compared when verifying.")
+    args = parser.parse_args()
+
+    import warnings
+    from model_registry import _read_model
+    warnings.simplefilter("ignore")
+    trained_model = _read_model(args.model)
+
+    if args.command == "export":
+        FlatForest.from_sklearn(trained_model).save(args.flat)
+        print(f"Exported {len(trained_model.estimators_)} trees to {args.flat}")
+        return
+
+    # random rows spanning the range of every feature, plus any FASTA inputs
+    from feature_engine import get_features_matrix, LOOKUP_TABLE
+    from predict_effectors import read_chunks
+    rng = np.random.default_rng(0)
+    X = rng.uniform(LOOKUP_TABLE.min(axis=0), LOOKUP_TABLE.max(axis=0), size=(10000, LOOKUP_TABLE.shape[1]))
+    for fasta_file in args.fasta:
+        for _, sequences in read_chunks(fasta_file):
+            X = np.vstack([X, get_features_matrix(sequences)])
+
+    flat_forest = FlatForest.load(args.flat)
+    if not check_parity(trained_model, flat_forest, X):
+        exit(f"{args.flat} does NOT match {args.model}")
+    print(f"{args.flat} matches {args.model} on {len(X)} feature rows")
+
+
+if __name__ == "__main__":
+    main()
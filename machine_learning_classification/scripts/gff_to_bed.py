@@ -0,0 +1,170 @@
+import argparse
+import os
+import sys
+
+## take in:
+##    1) list of candidate IDs, one per line (e.g. protein IDs of predicted effectors)
+##    2) GFF3 annotation of the genome the candidates come from
+
+## RUN LIKE THIS:
+##    python3 gff_to_bed.py -i candidate_ids.txt -g GCA_004359215.1_BlacSF5_genomic.gff -o candidates.bed
+##    python3 gff_to_bed.py -i candidate_orfs.txt -g BlacSF5_genomic_ORFs.gff --orfs -o candidate_orfs.bed
+##
+## the GFF is read once into an index of ID -> locus tag -> gene coordinates,
+## so any number of IDs costs one pass over the GFF instead of four greps of
+## it per ID (makeBed.sh / makeORFsBed.sh)
+
+## output:
+##    BED lines scaffold|begin|end|locus tag, in the order of the ID list
+##    (begin and end are the GFF coordinates, as makeBed.sh wrote them)
+
+# {preset: (attribute naming the locus, feature type holding its coordinates)}
+PRESETS = {
+    "gene": ("locus_tag", "gene"),  # makeBed.sh, gene models
+    "orf": ("Name", "ORF"),         # makeORFsBed.sh, ORF calls
+}
+
+
+def parse_attributes(column):
+    '''
+    Method: Returns the key=value pairs of a GFF3 attributes column as a dictionary
+    '''
+    attributes = {}
+    for pair in column.strip().split(';'):
+        key, sep, value = pair.partition('=')
+        if sep:
+            attributes[key.strip()] = value.strip()
+    return attributes
+
+
+def id_keys(value):
+    '''
+    Method: Returns the IDs an attribute value can be looked up by
+
+    Besides the value itself, every item of a comma-separated list and the
+    part after a 'GenBank:' or 'cds-' style prefix, so protein IDs find the
+    lines that name them as 'protein_id=...', 'ID=cds-...' or 'Dbxref=GenBank:...'.
+    '''
+    keys = set()
+    for item in value.split(','):
+        keys.add(item)
+        for separator in (':', '-'):
+            prefix, sep, rest = item.partition(separator)
+            if sep and rest and prefix.isalpha():
+                keys.add(rest)
+    return keys
+
+
+class GffIndex:
+    '''
+    ID -> (scaffold, locus tag) and locus tag -> (begin, end) of a GFF3 file, read in one pass
+    '''
+
+    def __init__(self, gff_file, tag_attribute="locus_tag", feature_type="gene"):
+        '''
+        Input:
+
+            - gff_file: GFF3 annotation
+            - tag_attribute: attribute naming the locus of a feature, e.g. locus_tag or Name
+            - feature_type: type of the features whose coordinates are written, e.g. gene or ORF
+        '''
+        self.tag_attribute = tag_attribute
+        self.feature_type = feature_type
+        self.loci = {}
+        self.coordinates = {}
+        with open(gff_file) as handle:
+            for line in handle:
+                if line.startswith('#') or not line.strip():
+                    continue
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) < 9:
+                    continue
+                attributes = parse_attributes(fields[8])
+                tag = attributes.get(tag_attribute)
+                if tag is None:
+                    continue
+                scaffold = fields[0]
+                # the first feature naming an ID wins, as 'uniq' kept it in makeBed.sh
+                for value in attributes.values():
+                    for key in id_keys(value):
+                        self.loci.setdefault(key, (scaffold, tag))
+                if fields[2] == feature_type:
+                    self.coordinates.setdefault(tag, (fields[3], fields[4]))
+
+    def lookup(self, seq_id):
+        '''
+        Method: Returns (scaffold, begin, end, locus tag) of an ID, None if the GFF has no such locus
+        '''
+        locus = self.loci.get(seq_id)
+        if locus is None:
+            return None
+        scaffold, tag = locus
+        coordinates = self.coordinates.get(tag)
+        if coordinates is None:
+            return None
+        return scaffold, coordinates[0], coordinates[1], tag
+
+    def bed_rows(self, seq_ids, missing=None):
+        '''
+        Method: Yields the BED row of every ID found, in order
+
+        Input:
+
+            - seq_ids: iterable of IDs
+            - missing: optional list the IDs that were not found are appended to
+        '''
+        for seq_id in seq_ids:
+            row = self.lookup(seq_id)
+            if row is None:
+                if missing is not None:
+                    missing.append(seq_id)
+                continue
+            yield row
+
+
+def read_ids(id_file):
+    '''
+    Method: Returns the IDs of a list file in order, the first word of every non-empty line
+    '''
+    with open(id_file) as handle:
+        return [line.split()[0] for line in handle if line.strip()]
+
+
+def write_bed(index, seq_ids, bed_file):
+    '''
+    Method: Writes the BED rows of seq_ids to bed_file (a path or open handle) and returns the IDs not found
+    '''
+    missing = []
+    handle = open(bed_file, 'w') if isinstance(bed_file, str) else bed_file
+    try:
+        for row in index.bed_rows(seq_ids, missing):
+            handle.write('\t'.join(row) + '\n')
+    finally:
+        if handle is not bed_file:
+            handle.close()
+    return missing
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='gff_to_bed.py',
+                                     description="Writes the BED intervals of a list of IDs from a GFF3 file.")
+    parser.add_argument("-i", "--ids", type=str, required=True, help="File of IDs, one per line.")
+    parser.add_argument("-g", "--gff", type=str, required=True, help="GFF3 annotation the IDs come from.")
+    parser.add_argument("--orfs", action="store_true",
+                        help="Look up ORF features by their Name instead of genes by their locus_tag.")
+    parser.add_argument("-o", "--output", type=str, default=None, help="Output BED file (default: standard output).")
+    args = parser.parse_args()
+
+    for path in (args.ids, args.gff):
+        if not os.path.isfile(path):
+            exit(f"{path} either is a directory or does not exist.")
+
+    tag_attribute, feature_type = PRESETS["orf" if args.orfs else "gene"]
+    index = GffIndex(args.gff, tag_attribute, feature_type)
+    missing = write_bed(index, read_ids(args.ids), args.output or sys.stdout)
+    if missing:
+        print(f"{len(missing)} IDs not found in {args.gff}, e.g. {missing[0]}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from fasta_reader import read_fasta
+from lineage_specificity import DEFAULT_EXCLUSIONS, excluded_subjects, parse_exclusion
+
+## take in:
+##    1) fasta files of the secretomes (or ORF sets) of all species, the "database"
+##    2) (optional) the secretomes to check, by default every database file
+
+## RUN LIKE THIS:
+##    python3 homology_prefilter.py -d ../../results/EffectorO_genome_results/secretomes/*.fasta \
+##        --index oomycetes.kmers.npz -o prefilter_results
+##    python3 homology_prefilter.py -d secretomes/*.fasta --index oomycetes.kmers.npz \
+##        -q sp_B_lac-SF5.protein.fasta -o prefilter_results
+##
+## a local prefilter for the all-vs-all blastp of the lineage-specificity
+## analysis: every protein is reduced to the set of its k-mers over a 10-letter
+## amino acid alphabet, and an inverted index of these k-mers over all species
+## is built once and saved (rebuilt only when a database file changes). A query
+## protein sharing a large fraction of its k-mers with one protein of another
+## species has a close homolog and is flagged as conserved; only the remaining,
+## ambiguous proteins need to be searched with blastp
+
+## output (one pair of files per secretome checked):
+##    1) conserved_{SECRETOME_FILE}: IDs of the proteins with a close homolog in another species
+##    2) blast_{SECRETOME_FILE}: fasta file of the other proteins, the queries left for blastp
+##    pass the output directory to lineage_specificity.py with --prefilter-dir to count
+##    the conserved proteins as such
+
+# Murphy et al. (2000) 10-letter alphabet; residues outside it (X, *, B, Z, ...) break k-mers
+REDUCED_ALPHABET = ["LVIM", "C", "A", "G", "ST", "P", "FYW", "EDNQ", "KR", "H"]
+DEFAULT_K = 6
+
+# k-mers found in more proteins than this are low-complexity or repeat
+# motifs, which say little about homology, and are ignored in queries
+DEFAULT_MAX_POSTINGS = 500
+
+# a protein is conserved if one protein of another species holds at least this
+# fraction of its distinct k-mers, and at least this many of them; on the
+# bundled secretomes 0.25% of the proteins flagged this way are in the
+# published LSP lists
+DEFAULT_MIN_CONTAINMENT = 0.3
+DEFAULT_MIN_SHARED = 10
+
+CONSERVED_PREFIX = "conserved_"
+BLAST_PREFIX = "blast_"
+
+_INVALID = 255
+_ENCODING = bytearray([_INVALID]) * 256
+for _code, _residues in enumerate(REDUCED_ALPHABET):
+    for _residue in _residues:
+        _ENCODING[ord(_residue)] = _ENCODING[ord(_residue.lower())] = _code
+_ENCODING = bytes(_ENCODING)
+
+
+def encode(sequences):
+    '''
+    Method: Returns (residue codes of all sequences concatenated, sequence lengths)
+    '''
+    lengths = np.fromiter((len(sequence) for sequence in sequences), dtype=np.int64, count=len(sequences))
+    codes = np.frombuffer(b"".join(sequence.translate(_ENCODING) for sequence in sequences), dtype=np.uint8)
+    return codes, lengths
+
+
+def kmer_pairs(sequences, k=DEFAULT_K):
+    '''
+    Method: Returns the distinct (k-mer code, sequence number) pairs of a list of sequences
+
+    Input:
+
+        - sequences: amino acid sequences as bytes
+        - k: k-mer length
+
+    Both arrays are sorted by sequence, then by k-mer code.
+    '''
+    codes, lengths = encode(sequences)
+    n_windows = len(codes) - k + 1
+    if n_windows <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    ends = np.cumsum(lengths)
+    sequence = np.repeat(np.arange(len(sequences)), lengths)[:n_windows]
+    invalid = np.concatenate([[0], np.cumsum(codes == _INVALID)])
+    # windows inside one sequence and without residues outside the alphabet
+    valid = ((np.arange(n_windows) + k <= ends[sequence])
+             & (invalid[k:k + n_windows] == invalid[:n_windows]))
+
+    kmer = np.zeros(n_windows, dtype=np.int64)
+    base = len(REDUCED_ALPHABET)
+    for offset in range(k):
+        kmer = kmer * base + codes[offset:offset + n_windows]
+    kmer, sequence = kmer[valid], sequence[valid]
+
+    pairs = np.unique(sequence * base**k + kmer)
+    return pairs % base**k, pairs // base**k
+
+
+def database_fingerprint(fasta_files, k):
+    # file names, sizes and modification times, enough to notice a changed database
+    return json.dumps({"k": k, "alphabet": REDUCED_ALPHABET,
+                       "files": [[os.path.abspath(path), os.path.getsize(path), int(os.path.getmtime(path))]
+                                 for path in fasta_files]})
+
+
+class KmerIndex:
+    '''
+    Inverted index of reduced-alphabet k-mers over the proteins of several species
+    '''
+
+    def __init__(self, ids, sources, source_names, offsets, postings, kmer_counts, k=DEFAULT_K, fingerprint=""):
+        self.ids = ids
+        self.sources = sources
+        self.source_names = source_names
+        self.offsets = offsets
+        self.postings = postings
+        self.kmer_counts = kmer_counts
+        self.k = k
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def build(cls, fasta_files, k=DEFAULT_K):
+        '''
+        Method: Indexes the proteins of fasta files, one species per file
+
+        Input:
+
+            - fasta_files: fasta files of the species
+            - k: k-mer length
+        '''
+        ids, sources, all_kmers, all_proteins = [], [], [], []
+        for source, fasta_file in enumerate(fasta_files):
+            records = list(read_fasta(fasta_file))
+            kmers, proteins = kmer_pairs([sequence for _, sequence in records], k)
+            all_kmers.append(kmers)
+            all_proteins.append(proteins + len(ids))
+            ids.extend(seq_id for seq_id, _ in records)
+            sources.extend([source] * len(records))
+
+        kmers = np.concatenate(all_kmers)
+        proteins = np.concatenate(all_proteins)
+        order = np.argsort(kmers, kind="stable")
+        n_kmers = len(REDUCED_ALPHABET)**k
+        offsets = np.searchsorted(kmers[order], np.arange(n_kmers + 1)).astype(np.int64)
+        return cls(np.array(ids), np.array(sources, dtype=np.int32),
+                   np.array([os.path.basename(path) for path in fasta_files]),
+                   offsets, proteins[order].astype(np.int32),
+                   np.bincount(proteins, minlength=len(ids)).astype(np.int32),
+                   k, database_fingerprint(fasta_files, k))
+
+    def save(self, index_file):
+        np.savez(index_file, ids=self.ids, sources=self.sources, source_names=self.source_names,
+                 offsets=self.offsets, postings=self.postings, kmer_counts=self.kmer_counts,
+                 k=self.k, fingerprint=self.fingerprint)
+
+    @classmethod
+    def load(cls, index_file):
+        with np.load(index_file) as data:
+            return cls(data["ids"], data["sources"], data["source_names"], data["offsets"],
+                       data["postings"], data["kmer_counts"], int(data["k"]), str(data["fingerprint"]))
+
+    def allowed_targets(self, source_name, exclude=()):
+        '''
+        Method: Returns a mask of the proteins a secretome may match, those of other species
+
+        Input:
+
+            - source_name: file name of the queried secretome; its own proteins are left out
+            - exclude: patterns of close relatives, matched against protein IDs and file names
+        '''
+        allowed = self.source_names != source_name
+        for pattern in exclude:
+            allowed &= np.char.find(self.source_names.astype(str), pattern) < 0
+        allowed = allowed[self.sources]
+        for pattern in exclude:
+            allowed &= np.char.find(self.ids.astype(str), pattern) < 0
+        return allowed
+
+    def best_matches(self, sequences, allowed, max_postings=DEFAULT_MAX_POSTINGS):
+        '''
+        Method: Returns (shared k-mers, distinct k-mers, best target) of every query sequence
+
+        Input:
+
+            - sequences: query sequences as bytes
+            - allowed: mask of the proteins that may be matched, see allowed_targets()
+            - max_postings: k-mers found in more proteins than this are ignored
+
+        The best target is the allowed protein holding most of the query's
+        k-mers, -1 if none holds any.
+        '''
+        shared = np.zeros(len(sequences), dtype=np.int64)
+        distinct = np.zeros(len(sequences), dtype=np.int64)
+        best = np.full(len(sequences), -1, dtype=np.int64)
+        kmers, queries = kmer_pairs(sequences, self.k)
+        bounds = np.searchsorted(queries, np.arange(len(sequences) + 1))
+        counts = self.offsets[1:] - self.offsets[:-1]
+
+        for query in range(len(sequences)):
+            query_kmers = kmers[bounds[query]:bounds[query + 1]]
+            query_kmers = query_kmers[counts[query_kmers] <= max_postings]
+            distinct[query] = len(query_kmers)
+            if not len(query_kmers):
+                continue
+            # postings of all the query's k-mers, gathered in one index array
+            lengths = counts[query_kmers]
+            starts = np.repeat(self.offsets[query_kmers] - np.cumsum(lengths) + lengths, lengths)
+            targets = self.postings[starts + np.arange(lengths.sum())]
+            targets = targets[allowed[targets]]
+            if not len(targets):
+                continue
+            target_ids, target_counts = np.unique(targets, return_counts=True)
+            top = np.argmax(target_counts)
+            shared[query], best[query] = target_counts[top], target_ids[top]
+        return shared, distinct, best
+
+
+def load_or_build(fasta_files, index_file=None, k=DEFAULT_K):
+    '''
+    Method: Returns the saved index of fasta_files, building (and saving) it if missing or out of date
+    '''
+    if index_file and os.path.isfile(index_file):
+        index = KmerIndex.load(index_file)
+        if index.fingerprint == database_fingerprint(fasta_files, k):
+            return index
+        print(f"{index_file} is out of date, rebuilding it")
+    index = KmerIndex.build(fasta_files, k)
+    if index_file:
+        index.save(index_file)
+    return index
+
+
+def prefilter_secretome(index, secretome_file, output_dir, exclude=(), max_postings=DEFAULT_MAX_POSTINGS,
+                        min_containment=DEFAULT_MIN_CONTAINMENT, min_shared=DEFAULT_MIN_SHARED):
+    '''
+    Method: Splits a secretome into conserved proteins and proteins left for blastp
+
+    Input:
+
+        - index: KmerIndex of all species
+        - secretome_file: fasta file of the secretome to check
+        - output_dir: directory of the conserved_ and blast_ files
+        - exclude: patterns of close relatives whose proteins are not matched
+        - max_postings: k-mers found in more proteins than this are ignored
+        - min_containment/min_shared: fraction and number of the query's k-mers
+          one protein of another species must hold for the query to be conserved
+
+    Returns a dictionary summarizing the run.
+    '''
+    records = list(read_fasta(secretome_file))
+    allowed = index.allowed_targets(os.path.basename(secretome_file), exclude)
+    shared, distinct, _ = index.best_matches([sequence for _, sequence in records], allowed, max_postings)
+    conserved = (shared >= min_shared) & (shared >= min_containment * np.maximum(distinct, 1))
+
+    name = os.path.basename(secretome_file)
+    with open(os.path.join(output_dir, CONSERVED_PREFIX + name), 'w') as conserved_handle, \
+            open(os.path.join(output_dir, BLAST_PREFIX + name), 'w') as blast_handle:
+        for (seq_id, sequence), is_conserved in zip(records, conserved):
+            if is_conserved:
+                conserved_handle.write(seq_id + '\n')
+            else:
+                blast_handle.write(f">{seq_id}\n{sequence.decode()}\n")
+
+    return {"secretome": secretome_file, "proteins": len(records), "conserved": int(conserved.sum()),
+            "excluded_subjects": list(exclude)}
+
+
+# index of the current worker process
+_worker_index = None
+
+
+def _init_worker(index):
+    global _worker_index
+    _worker_index = index
+
+
+def _prefilter_worker(*args):
+    return prefilter_secretome(_worker_index, *args)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='homology_prefilter.py',
+                                     description="Flag proteins with close homologs in other species before running blastp.")
+    parser.add_argument("-d", "--database", type=str, nargs='+', required=True,
+                        help="Fasta files of all species, one species per file.")
+    parser.add_argument("-q", "--query", type=str, nargs='+', default=None,
+                        help="Secretomes to check (default: every database file).")
+    parser.add_argument("--index", type=str, default=None,
+                        help="File the k-mer index is saved to and loaded from (.npz, default: not saved).")
+    parser.add_argument("-o", "--output-dir", type=str, default=".",
+                        help="Directory the conserved_* and blast_* files are written to (default: %(default)s).")
+    parser.add_argument("-k", type=int, default=DEFAULT_K, help="k-mer length (default: %(default)s).")
+    parser.add_argument("--min-containment", type=float, default=DEFAULT_MIN_CONTAINMENT,
+                        help="Fraction of a protein's k-mers a homolog must hold (default: %(default)s).")
+    parser.add_argument("--min-shared", type=int, default=DEFAULT_MIN_SHARED,
+                        help="Number of a protein's k-mers a homolog must hold (default: %(default)s).")
+    parser.add_argument("--max-postings", type=int, default=DEFAULT_MAX_POSTINGS,
+                        help="Ignore k-mers found in more proteins than this (default: %(default)s).")
+    parser.add_argument("--exclude", type=parse_exclusion, action="append", default=[],
+                        metavar="SECRETOME_PATTERN:SUBJECT[,SUBJECT...]",
+                        help="Also ignore proteins matching SUBJECT for secretome files matching SECRETOME_PATTERN.")
+    parser.add_argument("--no-default-exclusions", action="store_true",
+                        help="Do not ignore the Peronospora/Peronosclerospora relatives by default.")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="Number of secretomes checked at the same time (default: %(default)s).")
+    args = parser.parse_args()
+
+    for path in args.database + (args.query or []):
+        if not os.path.isfile(path):
+            exit(f"{path} either is a directory or does not exist.")
+
+    exclusions = {} if args.no_default_exclusions else dict(DEFAULT_EXCLUSIONS)
+    for pattern, subjects in args.exclude:
+        exclusions[pattern] = exclusions.get(pattern, []) + subjects
+
+    index = load_or_build(args.database, args.index, args.k)
+    print(f"k-mer index of {len(index.ids)} proteins from {len(index.source_names)} files")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    # the index is handed to every worker once, not with every secretome
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(index,)) as pool:
+        futures = [pool.submit(_prefilter_worker, secretome_file, args.output_dir,
+                               excluded_subjects(secretome_file, exclusions), args.max_postings,
+                               args.min_containment, args.min_shared)
+                   for secretome_file in args.query or args.database]
+        for future in futures:
+            summary = future.result()
+            print(f"{summary['secretome']}: {summary['conserved']} of {summary['proteins']} proteins are "
+                  f"conserved, {summary['proteins'] - summary['conserved']} left for blastp")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from psutil import Process
+
+## Process-wide timing and memory instrumentation of the pipeline stages.
+##
+## The parse, featurize, score and write steps of predict_effectors.py and of
+## the web app's scoring jobs run inside PROFILER.stage(name, sequences). When
+## the profiler is enabled every stage adds its wall time, number of calls and
+## sequences, and the resident memory seen around it (sampled in a background
+## thread if sample_interval is set) to per-stage totals; when it is disabled
+## a stage costs a single attribute check.
+##
+## Processes that should be reported together (gunicorn workers, job worker
+## processes) each dump their totals into a shared stats directory, which
+## aggregate() merges for the app's stats panel and its Prometheus endpoint.
+
+STAGES = ["parse", "dedup", "cache", "featurize", "score", "motifs", "write"]
+
+# seconds between RSS samples while a stage runs, with sampling on
+DEFAULT_SAMPLE_INTERVAL = 0.005
+
+
+class PeakRSS:
+    '''
+    Samples the resident memory of this process in a background thread while in use
+    '''
+
+    def __init__(self, interval=DEFAULT_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.process = Process()
+
+    def __enter__(self):
+        self.start = self.peak = self.process.memory_info().rss
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self.process.memory_info().rss)
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.process.memory_info().rss)
+
+
+class StageCall:
+    '''
+    One timed call of a stage; the block may set sequences once it knows how many it processed
+    '''
+    __slots__ = ("sequences",)
+
+    def __init__(self, sequences=0):
+        self.sequences = sequences
+
+
+class Profiler:
+    '''
+    Per-stage totals of wall time, calls, sequences and resident memory
+    '''
+
+    def __init__(self, enabled=False, sample_interval=None):
+        self.enabled = enabled
+        self.sample_interval = sample_interval
+        self.started = time.time()
+        self._stages = {}
+        self._lock = threading.Lock()
+        self._process = Process()
+
+    def enable(self, sample_interval=None):
+        self.enabled = True
+        self.sample_interval = sample_interval
+        return self
+
+    def reset(self):
+        with self._lock:
+            self._stages = {}
+            self.started = time.time()
+
+    @contextmanager
+    def stage(self, name, sequences=0):
+        '''
+        Method: Times the enclosed block as one call of stage name
+
+        Input:
+
+            - name: stage name, one of STAGES for the pipeline's own stages
+            - sequences: number of sequences the block processes, if known up front
+
+        Yields a StageCall whose sequences the block may set instead.
+        '''
+        call = StageCall(sequences)
+        if not self.enabled:
+            yield call
+            return
+        if self.sample_interval:
+            with PeakRSS(self.sample_interval) as rss:
+                start = time.perf_counter()
+                yield call
+                seconds = time.perf_counter() - start
+            rss_start, rss_peak = rss.start, rss.peak
+        else:
+            rss_start = self._process.memory_info().rss
+            start = time.perf_counter()
+            yield call
+            seconds = time.perf_counter() - start
+            rss_peak = max(rss_start, self._process.memory_info().rss)
+        self.add(name, seconds, call.sequences, rss_peak, rss_peak - rss_start)
+
+    def add(self, name, seconds, sequences=0, rss_peak=0, rss_increase=0):
+        with self._lock:
+            totals = self._stages.setdefault(name, {"calls": 0, "sequences": 0, "seconds": 0.0,
+                                                    "peak_rss": 0, "max_rss_increase": 0})
+            totals["calls"] += 1
+            totals["sequences"] += sequences
+            totals["seconds"] += seconds
+            totals["peak_rss"] = max(totals["peak_rss"], rss_peak)
+            totals["max_rss_increase"] = max(totals["max_rss_increase"], rss_increase)
+
+    def snapshot(self):
+        '''
+        Method: Returns the per-stage totals and the current memory of this process
+        '''
+        with self._lock:
+            stages = {name: dict(totals) for name, totals in self._stages.items()}
+        return {"pid": os.getpid(), "started": self.started, "updated": time.time(),
+                "rss": self._process.memory_info().rss, "stages": stages}
+
+    def dump(self, stats_dir):
+        '''
+        Method: Writes the snapshot of this process to stats_dir/{pid}.json
+        '''
+        os.makedirs(stats_dir, exist_ok=True)
+        stats_file = os.path.join(stats_dir, f"{os.getpid()}.json")
+        tmp_file = stats_file + ".tmp"
+        with open(tmp_file, 'w') as handle:
+            json.dump(self.snapshot(), handle)
+        os.replace(tmp_file, stats_file)
+
+
+# the profiler of this process; disabled until a CLI flag or the app enables it
+PROFILER = Profiler()
+
+
+def stage(name, sequences=0):
+    '''
+    Method: Times the enclosed block with the process-wide PROFILER
+    '''
+    return PROFILER.stage(name, sequences)
+
+
+def merge_snapshots(snapshots):
+    '''
+    Method: Sums the stage totals of several processes (peaks are the largest seen by any)
+    '''
+    stages = {}
+    for snapshot in snapshots:
+        for name, totals in snapshot["stages"].items():
+            merged = stages.setdefault(name, {"calls": 0, "sequences": 0, "seconds": 0.0,
+                                              "peak_rss": 0, "max_rss_increase": 0})
+            for key in ("calls", "sequences", "seconds"):
+                merged[key] += totals[key]
+            for key in ("peak_rss", "max_rss_increase"):
+                merged[key] = max(merged[key], totals[key])
+    return {"processes": [{"pid": snapshot["pid"], "rss": snapshot["rss"], "updated": snapshot["updated"]}
+                          for snapshot in snapshots],
+            "stages": stages}
+
+
+def aggregate(stats_dir=None, max_age=24 * 60 * 60):
+    '''
+    Method: Merges the snapshot of this process with those dumped to stats_dir
+
+    Snapshots of processes that have not dumped for max_age seconds are
+    ignored, as they belong to workers that are gone.
+    '''
+    snapshots = {os.getpid(): PROFILER.snapshot()}
+    if stats_dir and os.path.isdir(stats_dir):
+        cutoff = time.time() - max_age
+        for name in os.listdir(stats_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(stats_dir, name)) as handle:
+                    snapshot = json.load(handle)
+            except (OSError, ValueError):
+                continue
+            if snapshot["pid"] not in snapshots and snapshot["updated"] >= cutoff:
+                snapshots[snapshot["pid"]] = snapshot
+    return merge_snapshots(list(snapshots.values()))
+
+
+def stage_rows(stages):
+    '''
+    Method: Returns one report row per stage, pipeline stages first
+
+    Rows hold the stage name, calls, sequences, seconds, sequences per
+    second and peak RSS in MB.
+    '''
+    names = [name for name in STAGES if name in stages] + sorted(set(stages) - set(STAGES))
+    rows = []
+    for name in names:
+        totals = stages[name]
+        rate = totals["sequences"] / totals["seconds"] if totals["seconds"] > 0 else 0.0
+        rows.append({"stage": name, "calls": totals["calls"], "sequences": totals["sequences"],
+                     "seconds": round(totals["seconds"], 3), "sequences_per_second": round(rate, 1),
+                     "peak_rss_mb": round(totals["peak_rss"] / 1024**2, 1)})
+    return rows
+
+
+def format_report(snapshot):
+    '''
+    Method: Formats a snapshot as the text table printed by --profile
+    '''
+    rows = stage_rows(snapshot["stages"])
+    lines = [f"{'stage':<10} {'calls':>7} {'sequences':>10} {'seconds':>9} {'seq/s':>11} {'peak RSS MB':>12}"]
+    for row in rows:
+        lines.append(f"{row['stage']:<10} {row['calls']:>7} {row['sequences']:>10} {row['seconds']:>9.3f} "
+                     f"{row['sequences_per_second']:>11.1f} {row['peak_rss_mb']:>12.1f}")
+    total_seconds = sum(row["seconds"] for row in rows)
+    lines.append(f"{'total':<10} {'':>7} {'':>10} {total_seconds:>9.3f}")
+    return "\n".join(lines)
+
+
+def prometheus_text(aggregated, prefix="effectoro"):
+    '''
+    Method: Formats aggregated stage totals in the Prometheus text exposition format
+    '''
+    metrics = [
+        ("stage_calls_total", "counter", "Number of times a pipeline stage ran.", "calls"),
+        ("stage_sequences_total", "counter", "Sequences processed by a pipeline stage.", "sequences"),
+        ("stage_seconds_total", "counter", "Wall time spent in a pipeline stage.", "seconds"),
+        ("stage_peak_rss_bytes", "gauge", "Largest resident memory seen around a pipeline stage.", "peak_rss"),
+    ]
+    lines = []
+    for name, kind, description, key in metrics:
+        lines.append(f"# HELP {prefix}_{name} {description}")
+        lines.append(f"# TYPE {prefix}_{name} {kind}")
+        for stage_name, totals in sorted(aggregated["stages"].items()):
+            lines.append(f'{prefix}_{name}{{stage="{stage_name}"}} {totals[key]}')
+    lines.append(f"# HELP {prefix}_process_resident_memory_bytes Resident memory of a reporting process.")
+    lines.append(f"# TYPE {prefix}_process_resident_memory_bytes gauge")
+    for process in aggregated["processes"]:
+        lines.append(f'{prefix}_process_resident_memory_bytes{{pid="{process["pid"]}"}} {process["rss"]}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,233 @@
+import argparse
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from fasta_reader import read_ids
+
+## take in:
+##    1) BLAST tabular output (-outfmt "6 std qcovs") of a secretome against all other oomycetes
+##    2) fasta file of the secretome (the BLAST queries)
+##    (any number of such pairs, scored in parallel)
+
+## RUN LIKE THIS:
+##    python3 lineage_specificity.py -p sp_B_lac_vs_All.tab sp_B_lac-SF5.protein.fasta -o LSP_results
+##
+## the Python counterpart of analysis_scripts/lineage_specificity_analysis/getLSGs.R:
+## the BLAST table is read in typed chunks of a few columns and only the best
+## hit per query is kept, so memory is bounded by the size of the secretome,
+## not of the BLAST table
+
+## output (one file per secretome):
+##    1) lsgIDs_{SECRETOME_FILE}: IDs of the lineage-specific proteins, one per line
+
+BLAST_COLUMNS = ["qseqid", "sseqid", "pident", "length", "mismatch", "gapopen",
+                 "qstart", "qend", "sstart", "send", "evalue", "bitscore", "qcovs"]
+
+# only these columns are parsed
+USE_COLUMNS = ["qseqid", "sseqid", "pident", "evalue", "bitscore", "qcovs"]
+COLUMN_TYPES = {"qseqid": str, "sseqid": str, "pident": "float64",
+                "evalue": "float64", "bitscore": "float64", "qcovs": "float64"}
+
+DEFAULT_CHUNK_SIZE = 1000000
+
+# a query is conserved (not lineage-specific) if its best hit passes all three
+DEFAULT_MAX_EVALUE = 1e-7
+DEFAULT_MIN_PIDENT = 30.0
+DEFAULT_MIN_QCOVS = 30.0
+
+# hits of close relatives that are ignored, {secretome file pattern: subject ID patterns}
+DEFAULT_EXCLUSIONS = {
+    # Peronospora: P. effusa and P. schachtii
+    "Per_": ["Peff", "schachtii"],
+    # Peronosclerospora: P. maydis, P. philippinensis, P. sacchari and P. sorghi
+    "Perscl": ["Pmay", "Pphil", "Psac", "Psor"],
+}
+
+OUTPUT_PREFIX = "lsgIDs_"
+
+
+def excluded_subjects(secretome_file, exclusions=DEFAULT_EXCLUSIONS):
+    '''
+    Method: Returns the subject ID patterns whose hits are ignored for a secretome
+
+    Input:
+
+        - secretome_file: path of the secretome fasta file
+        - exclusions: {secretome file pattern: subject ID patterns}
+    '''
+    name = os.path.basename(secretome_file)
+    return [subject for pattern, subjects in exclusions.items() if pattern in name
+            for subject in subjects]
+
+
+def best_hits(blast_file, exclude=(), chunk_size=DEFAULT_CHUNK_SIZE):
+    '''
+    Method: Returns the highest-bitscore hit of every query in a BLAST table
+
+    Input:
+
+        - blast_file: BLAST tabular output, -outfmt "6 std qcovs"
+        - exclude: subject ID patterns whose hits are dropped first
+        - chunk_size: number of rows parsed at a time
+
+    Of hits with equal bitscores the first one in the file is kept, like the
+    R script's stable sort. Returns (best hits indexed by qseqid, rows read,
+    rows excluded).
+    '''
+    exclude_pattern = "|".join(re.escape(subject) for subject in exclude)
+    best = pd.DataFrame({column: pd.Series(dtype=COLUMN_TYPES[column])
+                         for column in USE_COLUMNS if column != "qseqid"},
+                        index=pd.Index([], dtype=object, name="qseqid"))
+    rows = excluded = 0
+
+    if os.path.getsize(blast_file) == 0:
+        # BLAST writes an empty table when no query has a hit
+        return best, rows, excluded
+
+    chunks = pd.read_csv(blast_file, sep='\t', header=None, names=BLAST_COLUMNS,
+                         usecols=USE_COLUMNS, dtype=COLUMN_TYPES, chunksize=chunk_size)
+    for chunk in chunks:
+        rows += len(chunk)
+        if exclude_pattern:
+            keep = ~chunk["sseqid"].str.contains(exclude_pattern, regex=True)
+            excluded += int((~keep).sum())
+            chunk = chunk[keep]
+
+        # earlier best hits go first, so they win ties against this chunk
+        chunk = chunk.sort_values("bitscore", ascending=False, kind="stable")
+        chunk = chunk.drop_duplicates("qseqid").set_index("qseqid")
+        best = pd.concat([best, chunk]).sort_values("bitscore", ascending=False, kind="stable")
+        best = best[~best.index.duplicated()]
+    return best, rows, excluded
+
+
+def conserved_queries(best, max_evalue=DEFAULT_MAX_EVALUE, min_pident=DEFAULT_MIN_PIDENT,
+                      min_qcovs=DEFAULT_MIN_QCOVS):
+    '''
+    Method: Returns the set of queries whose best hit passes every threshold
+    '''
+    passes = (best["evalue"] < max_evalue) & (best["pident"] > min_pident) & (best["qcovs"] > min_qcovs)
+    return set(best.index[passes])
+
+
+def find_lsps(blast_file, secretome_file, output_file, exclusions=DEFAULT_EXCLUSIONS,
+              max_evalue=DEFAULT_MAX_EVALUE, min_pident=DEFAULT_MIN_PIDENT,
+              min_qcovs=DEFAULT_MIN_QCOVS, chunk_size=DEFAULT_CHUNK_SIZE, prefiltered_file=None):
+    '''
+    Method: Writes the IDs of the lineage-specific proteins of one secretome
+
+    Input:
+
+        - blast_file: BLAST tabular output of the secretome against the other oomycetes
+        - secretome_file: fasta file of the secretome
+        - output_file: path of the ID list to write
+        - exclusions: {secretome file pattern: subject ID patterns} of hits to ignore
+        - max_evalue/min_pident/min_qcovs: thresholds a conserved best hit passes
+        - chunk_size: number of BLAST rows parsed at a time
+        - prefiltered_file: optional list of IDs found conserved by
+          homology_prefilter.py, which were left out of the BLAST search
+
+    Proteins without any hit, or whose best hit fails a threshold, are
+    lineage-specific. Returns a dictionary summarizing the run.
+    '''
+    exclude = excluded_subjects(secretome_file, exclusions)
+    best, rows, excluded = best_hits(blast_file, exclude, chunk_size)
+    conserved = conserved_queries(best, max_evalue, min_pident, min_qcovs)
+    prefiltered = 0
+    if prefiltered_file:
+        with open(prefiltered_file) as handle:
+            prefiltered_ids = {line.strip() for line in handle if line.strip()}
+        prefiltered = len(prefiltered_ids)
+        conserved |= prefiltered_ids
+
+    n_proteins = n_lsps = 0
+    with open(output_file, 'w') as handle:
+        for seq_id in read_ids(secretome_file):
+            n_proteins += 1
+            if seq_id not in conserved:
+                handle.write(seq_id + '\n')
+                n_lsps += 1
+
+    return {"secretome": secretome_file, "output": output_file, "rows": rows,
+            "excluded_rows": excluded, "excluded_subjects": exclude,
+            "proteins": n_proteins, "lsps": n_lsps, "prefiltered": prefiltered}
+
+
+def parse_exclusion(value):
+    # "Per_:Peff,schachtii" -> ("Per_", ["Peff", "schachtii"])
+    pattern, _, subjects = value.partition(':')
+    if not pattern or not subjects:
+        raise argparse.ArgumentTypeError(f"expected SECRETOME_PATTERN:SUBJECT[,SUBJECT...], got {value!r}")
+    return pattern, [subject for subject in subjects.split(',') if subject]
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='lineage_specificity.py',
+                                     description="Find lineage-specific proteins from BLAST tabular results.")
+    parser.add_argument("-p", "--pair", nargs=2, action="append", required=True,
+                        metavar=("BLAST_TAB", "SECRETOME_FASTA"),
+                        help="BLAST table (-outfmt \"6 std qcovs\") and the secretome queried; repeat for more species.")
+    parser.add_argument("-o", "--output-dir", type=str, default=".",
+                        help="Directory the lsgIDs_* files are written to (default: %(default)s).")
+    parser.add_argument("--evalue", type=float, default=DEFAULT_MAX_EVALUE,
+                        help="Best hits with a lower e-value count as conserved (default: %(default)s).")
+    parser.add_argument("--pident", type=float, default=DEFAULT_MIN_PIDENT,
+                        help="... and a higher percent identity (default: %(default)s).")
+    parser.add_argument("--qcovs", type=float, default=DEFAULT_MIN_QCOVS,
+                        help="... and a higher query coverage (default: %(default)s).")
+    parser.add_argument("--exclude", type=parse_exclusion, action="append", default=[],
+                        metavar="SECRETOME_PATTERN:SUBJECT[,SUBJECT...]",
+                        help="Also ignore hits to subjects matching SUBJECT for secretome files matching SECRETOME_PATTERN.")
+    parser.add_argument("--no-default-exclusions", action="store_true",
+                        help="Do not ignore the Peronospora/Peronosclerospora relatives by default.")
+    parser.add_argument("--prefilter-dir", type=str, default=None,
+                        help="Output directory of homology_prefilter.py; its conserved_* proteins count as conserved.")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="Number of BLAST rows parsed at a time (default: %(default)s).")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="Number of species processed at the same time (default: one per species, up to the number of cores).")
+    args = parser.parse_args()
+
+    for blast_file, secretome_file in args.pair:
+        for path in (blast_file, secretome_file):
+            if not os.path.isfile(path):
+                exit(f"{path} either is a directory or does not exist.")
+
+    prefiltered_files = {}
+    if args.prefilter_dir:
+        # imported here as homology_prefilter.py imports this module
+        from homology_prefilter import CONSERVED_PREFIX
+        for _, secretome_file in args.pair:
+            prefiltered_file = os.path.join(args.prefilter_dir, CONSERVED_PREFIX + os.path.basename(secretome_file))
+            if not os.path.isfile(prefiltered_file):
+                exit(f"{prefiltered_file} does not exist, run homology_prefilter.py on {secretome_file} first.")
+            prefiltered_files[secretome_file] = prefiltered_file
+
+    exclusions = {} if args.no_default_exclusions else dict(DEFAULT_EXCLUSIONS)
+    for pattern, subjects in args.exclude:
+        exclusions[pattern] = exclusions.get(pattern, []) + subjects
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    workers = args.workers or min(len(args.pair), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(find_lsps, blast_file, secretome_file,
+                               os.path.join(args.output_dir, OUTPUT_PREFIX + os.path.basename(secretome_file)),
+                               exclusions, args.evalue, args.pident, args.qcovs, args.chunk_size,
+                               prefiltered_files.get(secretome_file))
+                   for blast_file, secretome_file in args.pair]
+        for future in futures:
+            summary = future.result()
+            print(f"species: {summary['secretome']}")
+            if summary["excluded_subjects"]:
+                print(f"  removed {summary['excluded_rows']} of {summary['rows']} rows hitting "
+                      + ", ".join(summary["excluded_subjects"]))
+            if summary["prefiltered"]:
+                print(f"  {summary['prefiltered']} proteins conserved by the k-mer prefilter")
+            print(f"  {summary['lsps']} of {summary['proteins']} proteins are lineage-specific: {summary['output']}")
+
+
+if __name__ == "__main__":
+    main()
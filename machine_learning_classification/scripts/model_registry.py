@@ -0,0 +1,150 @@
+import gc
+import os
+import sys
+
+import joblib
+from psutil import Process
+
+from flat_forest import FlatForest, compile_model
+from prediction_cache import model_fingerprint
+
+## Process-wide registry of loaded models.
+##
+## Every model file is unpickled once per process and handed out to whoever
+## asks for it. In the web app the models are loaded while gunicorn imports
+## app.py in its master process (--preload), so the forked workers share the
+## forest's pages copy-on-write instead of each unpickling its own copy.
+##
+## Forests exported with flat_forest.py are always memory-mapped read-only.
+## Optionally (EFFECTORO_MMAP_DIR, or mmap_dir=...) any other model is re-saved
+## once in a mappable form (flat node arrays for forests, an uncompressed
+## joblib file otherwise) and loaded with mmap_mode='r', so any number of
+## processes - web workers and command-line runs alike - share the same pages.
+
+MMAP_DIR = os.environ.get("EFFECTORO_MMAP_DIR")
+
+# module paths the shipped scikit-learn 0.22 pickles refer to, and where newer
+# scikit-learn releases keep those classes
+LEGACY_SKLEARN_MODULES = {
+    "sklearn.ensemble.forest": "sklearn.ensemble._forest",
+    "sklearn.tree.tree": "sklearn.tree._classes",
+    "sklearn.svm.classes": "sklearn.svm._classes",
+}
+
+# fitted attributes renamed since scikit-learn 0.22, (old name, new name)
+LEGACY_SKLEARN_ATTRIBUTES = [("sigma_", "var_")]
+
+_models = {}
+
+
+def install_legacy_aliases():
+    '''
+    Method: Lets newer scikit-learn releases unpickle the 0.22 models in trained_models/
+
+    Only module paths are aliased, the pickled trees themselves must still be
+    readable by the installed release.
+    '''
+    import importlib
+    for old_name, new_name in LEGACY_SKLEARN_MODULES.items():
+        if old_name in sys.modules:
+            continue
+        try:
+            importlib.import_module(old_name)
+        except ImportError:
+            try:
+                sys.modules[old_name] = importlib.import_module(new_name)
+            except ImportError:
+                pass
+
+
+def upgrade_legacy_attributes(trained_model):
+    '''
+    Method: Copies fitted attributes of 0.22 models to the names newer releases use
+    '''
+    for old_name, new_name in LEGACY_SKLEARN_ATTRIBUTES:
+        if hasattr(trained_model, old_name) and not hasattr(trained_model, new_name):
+            setattr(trained_model, new_name, getattr(trained_model, old_name))
+    return trained_model
+
+
+def _read_model(model_file):
+    install_legacy_aliases()
+    with open(model_file, 'rb') as model_handle:
+        return upgrade_legacy_attributes(joblib.load(model_handle))
+
+
+def _load_mmap(model_file, mmap_dir):
+    # one mappable copy per model version, keyed by the model's fingerprint;
+    # forests are stored as flat node arrays, anything else as a joblib file
+    os.makedirs(mmap_dir, exist_ok=True)
+    mmap_path = os.path.join(mmap_dir, model_fingerprint(model_file))
+    if FlatForest.is_exported(mmap_path + ".flat"):
+        return FlatForest.load(mmap_path + ".flat", mmap_mode='r')
+    if os.path.isfile(mmap_path + ".joblib"):
+        return joblib.load(mmap_path + ".joblib", mmap_mode='r')
+
+    trained_model = compile_model(_read_model(model_file))
+    tmp_path = f"{mmap_path}.{os.getpid()}.tmp"
+    if isinstance(trained_model, FlatForest):
+        trained_model.save(tmp_path)
+        os.replace(tmp_path, mmap_path + ".flat")
+        return FlatForest.load(mmap_path + ".flat", mmap_mode='r')
+    joblib.dump(trained_model, tmp_path)
+    os.replace(tmp_path, mmap_path + ".joblib")
+    return joblib.load(mmap_path + ".joblib", mmap_mode='r')
+
+
+def load_model(model_file, mmap_dir=MMAP_DIR):
+    '''
+    Method: Returns the model stored in model_file, loading it only once per process
+
+    Input:
+
+        - model_file: path of a pickled/joblib model, or of a forest exported
+          with flat_forest.py (loaded memory-mapped, without scikit-learn)
+        - mmap_dir: optional directory of memory-mappable model copies
+
+    Forests are compiled into the flat-array FlatForest engine, which gives
+    the same predictions in a single pass over the trees.
+    '''
+    key = os.path.abspath(model_file)
+    if key not in _models:
+        if FlatForest.is_exported(model_file):
+            _models[key] = FlatForest.load(model_file, mmap_mode='r')
+        elif mmap_dir:
+            _models[key] = _load_mmap(model_file, mmap_dir)
+        else:
+            _models[key] = compile_model(_read_model(model_file))
+    return _models[key]
+
+
+def freeze_for_fork():
+    '''
+    Method: Moves everything loaded so far out of the garbage collector's reach
+
+    Call this in the gunicorn master once the models are loaded: collections
+    in the workers then no longer write to (and so un-share) those pages.
+    '''
+    gc.collect()
+    if hasattr(gc, "freeze"):
+        gc.freeze()
+
+
+def memory_report():
+    '''
+    Method: Returns the memory use of the current process in bytes
+
+    rss counts every resident page, uss only the pages private to this process
+    and pss splits shared pages between the processes sharing them (uss and
+    pss are only available on Linux).
+    '''
+    process = Process()
+    report = {"pid": process.pid, "rss": process.memory_info().rss}
+    try:
+        full_info = process.memory_full_info()
+        report["uss"] = full_info.uss
+        if hasattr(full_info, "pss"):
+            report["pss"] = full_info.pss
+    except Exception:
+        pass
+    return report
@@ -0,0 +1,222 @@
+import argparse
+import itertools
+import os
+import re
+import sys, warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from fasta_reader import read_fasta
+
+## take in:
+##    1) any number of secreted proteins fasta files
+##    2) (optional) a WY-domain profile HMM (needs pyhmmer)
+
+## RUN LIKE THIS:
+##    python3 motifs.py ../../results/EffectorO_genome_results/secretomes/sp_*.fasta -o motif_results -w 8
+##
+## RXLR-EER: an RXLR motif starting within a window of positions (by default
+## residues 30-60 of the full-length protein, Win et al. 2007) followed by an
+## EER motif ([DE][DE][KR]) within 25 residues.
+## WY: with an HMM (e.g. the WY-fold HMM of Boutemy et al. 2011) every sequence
+## is searched with hmmsearch; without one a regex profile of the conserved
+## hydrophobic-W-...-Y-...-hydrophobic core is searched downstream of the
+## RXLR-EER motif only, since it is far too common elsewhere.
+## The same scan adds columns to effector_classification_table.csv with
+## predict_effectors.py --motifs.
+
+## output (one pair of files per input, named like the RXLREER_results/ and WY_results/ lists):
+##    1) rxlr_eer_{INPUT_FILE}: IDs of the sequences with an RXLR-EER motif
+##    2) wy_{INPUT_FILE}: IDs of the sequences with a WY domain
+
+DEFAULT_RXLR_PATTERN = "R.LR"
+DEFAULT_EER_PATTERN = "[DE][DE][KR]"
+# 1-based positions the RXLR motif may start at
+DEFAULT_RXLR_WINDOW = (30, 60)
+# residues after the RXLR motif the EER motif may start within
+DEFAULT_EER_DISTANCE = 25
+DEFAULT_WY_PATTERN = "[LIVMF].{2}W.{6,12}Y.{3,8}[LIVMF]"
+DEFAULT_WY_EVALUE = 1e-3
+
+MOTIF_COLUMNS = ["rxlr_position", "eer_position", "rxlr_eer", "wy"]
+
+RXLR_EER_PREFIX = "rxlr_eer_"
+WY_PREFIX = "wy_"
+
+# profile HMMs loaded in this process, by path
+_hmms = {}
+
+
+def _load_hmm(hmm_file):
+    if hmm_file not in _hmms:
+        try:
+            from pyhmmer.plan7 import HMMFile
+        except ImportError:
+            raise ImportError("scanning with a WY HMM needs pyhmmer (pip install pyhmmer)")
+        with HMMFile(hmm_file) as handle:
+            _hmms[hmm_file] = list(handle)
+    return _hmms[hmm_file]
+
+
+class MotifScanner:
+    '''
+    Flags RXLR-EER motifs and WY domains in protein sequences
+    '''
+
+    def __init__(self, rxlr_pattern=DEFAULT_RXLR_PATTERN, eer_pattern=DEFAULT_EER_PATTERN,
+                 rxlr_window=DEFAULT_RXLR_WINDOW, eer_distance=DEFAULT_EER_DISTANCE,
+                 wy_pattern=DEFAULT_WY_PATTERN, wy_hmm=None, wy_evalue=DEFAULT_WY_EVALUE):
+        self.rxlr_pattern = rxlr_pattern
+        self.eer_pattern = eer_pattern
+        self.rxlr_window = rxlr_window
+        self.eer_distance = eer_distance
+        self.wy_pattern = wy_pattern
+        self.wy_hmm = wy_hmm
+        self.wy_evalue = wy_evalue
+        # lookahead, so overlapping RXLR candidates are all tried
+        self._rxlr = re.compile(f"(?=({rxlr_pattern}))")
+        self._eer = re.compile(eer_pattern)
+        self._wy = re.compile(wy_pattern)
+
+    def find_rxlr_eer(self, sequence):
+        '''
+        Method: Returns the 1-based (RXLR, EER) positions of a sequence, 0 where a motif is missing
+
+        The first RXLR in the window followed by an EER wins; without any, the
+        first RXLR in the window is reported with an EER position of 0.
+        '''
+        first, last = self.rxlr_window
+        first_rxlr = 0
+        for match in self._rxlr.finditer(sequence, first - 1):
+            if match.start() >= last:
+                break
+            rxlr_end = match.start() + len(match.group(1))
+            eer = self._eer.search(sequence, rxlr_end)
+            if eer is not None and eer.start() - rxlr_end < self.eer_distance:
+                return match.start() + 1, eer.start() + 1
+            first_rxlr = first_rxlr or match.start() + 1
+        return first_rxlr, 0
+
+    def _hmm_hits(self, sequences):
+        # indices of the sequences with a WY domain hit below the e-value cutoff
+        import pyhmmer
+        alphabet = pyhmmer.easel.Alphabet.amino()
+        digital = [pyhmmer.easel.TextSequence(name=str(index).encode(),
+                                              sequence=sequence.upper().replace('*', ''))
+                   .digitize(alphabet) for index, sequence in enumerate(sequences)]
+        hits = set()
+        block = pyhmmer.easel.DigitalSequenceBlock(alphabet, digital)
+        for top_hits in pyhmmer.hmmsearch(_load_hmm(self.wy_hmm), block, cpus=1, E=self.wy_evalue):
+            for hit in top_hits:
+                if hit.evalue < self.wy_evalue:
+                    name = hit.name
+                    hits.add(int(name.decode() if isinstance(name, bytes) else name))
+        return hits
+
+    def scan(self, sequences):
+        '''
+        Method: Returns a DataFrame of MOTIF_COLUMNS, one row per sequence
+
+        Input:
+
+            - sequences: amino acid strings
+        '''
+        sequences = [sequence.upper() for sequence in sequences]
+        positions = [self.find_rxlr_eer(sequence) for sequence in sequences]
+        motifDF = pd.DataFrame(positions, columns=["rxlr_position", "eer_position"], dtype="int64")
+        motifDF["rxlr_eer"] = motifDF["eer_position"] > 0
+
+        if self.wy_hmm is not None:
+            hmm_hits = self._hmm_hits(sequences) if sequences else set()
+            motifDF["wy"] = [index in hmm_hits for index in range(len(sequences))]
+        else:
+            motifDF["wy"] = [bool(eer) and self._wy.search(sequence, eer - 1) is not None
+                             for sequence, (_, eer) in zip(sequences, positions)]
+        return motifDF
+
+
+def add_motif_args(parser):
+    parser.add_argument("--rxlr-pattern", type=str, default=DEFAULT_RXLR_PATTERN,
+                        help="Regular expression of the RXLR motif (default: %(default)s).")
+    parser.add_argument("--rxlr-window", type=int, nargs=2, default=DEFAULT_RXLR_WINDOW,
+                        metavar=("FIRST", "LAST"),
+                        help="1-based positions the RXLR motif may start at (default: %(default)s); "
+                             "use e.g. 1 40 for signal-peptide-cleaved sequences.")
+    parser.add_argument("--eer-pattern", type=str, default=DEFAULT_EER_PATTERN,
+                        help="Regular expression of the EER motif (default: %(default)s).")
+    parser.add_argument("--eer-distance", type=int, default=DEFAULT_EER_DISTANCE,
+                        help="Residues after the RXLR motif the EER motif may start within (default: %(default)s).")
+    parser.add_argument("--wy-pattern", type=str, default=DEFAULT_WY_PATTERN,
+                        help="Regex profile of the WY domain, used without --wy-hmm (default: %(default)s).")
+    parser.add_argument("--wy-hmm", type=str, default=None,
+                        help="Profile HMM of the WY domain, searched with pyhmmer.")
+    parser.add_argument("--wy-evalue", type=float, default=DEFAULT_WY_EVALUE,
+                        help="E-value cutoff of WY HMM hits (default: %(default)s).")
+
+
+def scanner_from_args(args):
+    '''
+    Method: Returns the MotifScanner configured on the command line
+    '''
+    return MotifScanner(args.rxlr_pattern, args.eer_pattern, tuple(args.rxlr_window),
+                        args.eer_distance, args.wy_pattern, args.wy_hmm, args.wy_evalue)
+
+
+def scan_file(scanner, fasta_file, output_dir, chunk_size=10000):
+    '''
+    Method: Writes the RXLR-EER and WY ID lists of one FASTA file
+
+    Returns (file, sequences, RXLR-EER sequences, WY sequences).
+    '''
+    if not sys.warnoptions:
+        warnings.simplefilter("ignore")
+    name = os.path.basename(fasta_file)
+    n_sequences = n_rxlr_eer = n_wy = 0
+    with open(os.path.join(output_dir, RXLR_EER_PREFIX + name), 'w') as rxlr_eer, \
+            open(os.path.join(output_dir, WY_PREFIX + name), 'w') as wy:
+        records = read_fasta(fasta_file)
+        while True:
+            chunk = list(itertools.islice(records, chunk_size))
+            if not chunk:
+                break
+            seq_ids = [seq_id for seq_id, _ in chunk]
+            motifDF = scanner.scan([seq.decode() for _, seq in chunk])
+            for seq_id, has_rxlr_eer, has_wy in zip(seq_ids, motifDF["rxlr_eer"], motifDF["wy"]):
+                if has_rxlr_eer:
+                    rxlr_eer.write(seq_id + '\n')
+                    n_rxlr_eer += 1
+                if has_wy:
+                    wy.write(seq_id + '\n')
+                    n_wy += 1
+            n_sequences += len(seq_ids)
+    return fasta_file, n_sequences, n_rxlr_eer, n_wy
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='motifs.py',
+                                     description="Find RXLR-EER motifs and WY domains in secretomes.")
+    parser.add_argument("inputs", type=str, nargs='+', help="Input FASTA files of (secreted) protein sequences.")
+    parser.add_argument("-o", "--output-dir", type=str, default=".",
+                        help="Directory the ID lists are written to (default: %(default)s).")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="Number of files scanned at the same time (default: number of cores).")
+    add_motif_args(parser)
+    args = parser.parse_args()
+
+    for fasta_file in args.inputs:
+        if not os.path.isfile(fasta_file):
+            exit(f"{fasta_file} either is a directory or does not exist.")
+
+    scanner = scanner_from_args(args)
+    os.makedirs(args.output_dir, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(scan_file, scanner, fasta_file, args.output_dir)
+                   for fasta_file in args.inputs]
+        for future in futures:
+            fasta_file, n_sequences, n_rxlr_eer, n_wy = future.result()
+            print(f"{fasta_file}: {n_sequences} sequences, {n_rxlr_eer} RXLR-EER, {n_wy} WY")
+
+
+if __name__ == "__main__":
+    main()
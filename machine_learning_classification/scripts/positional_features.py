@@ -0,0 +1,211 @@
+import argparse
+import itertools
+import os
+import sys
+
+import numpy as np
+
+from fasta_reader import read_fasta
+from feature_engine import FEATURE_NAMES, LOOKUP_TABLE, to_residue_bytes
+
+## Positional and sliding-window profiles of the FEAT scales.
+##
+## The production counterpart of get_positional_features and
+## get_moving_average_features in notebooks/convolutional_neural_networks_raw_approach.ipynb.
+## The residues of a whole batch are concatenated and pushed through the
+## feature_engine lookup table once; a cumulative sum over them then gives the
+## sum of any stretch of a sequence as the difference of two rows, so every
+## window, running average or terminal region costs O(1) whatever its length.
+## Like in the notebooks, 'X' and '*' are dropped from the sequences first;
+## records left without residues are skipped with a warning.
+
+## take in:
+##    1) a fasta file of protein sequences
+
+## RUN LIKE THIS:
+##    python3 positional_features.py {INPUT_FASTA_PATH} -o features.npz --window 10 --positions 100
+
+## output:
+##    1) features.npz: ids, windows (sequences x positions x features, float32)
+##       and regions (sequences x N/C-terminal features, float32)
+
+DEFAULT_POSITIONS = 100
+DEFAULT_WINDOW = 10
+DEFAULT_STEP = 1
+DEFAULT_TERMINAL_LENGTH = 100
+
+REGION_FEATURE_NAMES = [f"{region}_{name}" for region in ("n_terminal", "c_terminal")
+                        for name in FEATURE_NAMES]
+
+# residues left out of the profiles, as in the notebooks (which drop [X*], lowercase x stays)
+_DROPPED_RESIDUES = b"X*"
+
+
+def has_residues(sequence):
+    '''
+    Method: Returns True if a sequence keeps any residue once 'X' and '*' are dropped
+    '''
+    return len(to_residue_bytes(sequence, None).translate(None, _DROPPED_RESIDUES)) > 0
+
+
+class ProfileBatch:
+    '''
+    Prefix sums of the FEAT scales over a batch of sequences
+    '''
+
+    def __init__(self, sequences, table=LOOKUP_TABLE):
+        encoded = [to_residue_bytes(seq, None).translate(None, _DROPPED_RESIDUES) for seq in sequences]
+        self.lengths = np.array([len(seq) for seq in encoded], dtype=np.int64)
+        if (self.lengths == 0).any():
+            raise ZeroDivisionError("cannot calculate features of an empty sequence")
+
+        codes = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        # row i holds the sums of the first i residues of the batch
+        self.prefix = np.zeros((len(codes) + 1, table.shape[1]), dtype=np.float64)
+        np.cumsum(table[codes], axis=0, out=self.prefix[1:])
+        self.offsets = np.cumsum(self.lengths) - self.lengths
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def sums(self, starts, ends):
+        '''
+        Method: Returns the summed features of residues [starts, ends) of every sequence, as float64
+        '''
+        base = self.offsets[:, np.newaxis]
+        return self.prefix[base + ends] - self.prefix[base + starts]
+
+    def means(self, starts, ends):
+        '''
+        Method: Returns the average features of residues [starts, ends) of every sequence
+
+        Input:
+
+            - starts/ends: (sequences x positions) integer arrays of 0-based bounds,
+              clipped to the sequence by the caller, ends > starts
+
+        Returns a (sequences x positions x features) float32 tensor.
+        '''
+        return (self.sums(starts, ends) / (ends - starts)[..., np.newaxis]).astype(np.float32)
+
+
+def get_window_features(sequences, window=DEFAULT_WINDOW, positions=DEFAULT_POSITIONS, step=DEFAULT_STEP):
+    '''
+    Method: Calculates sliding-window averages of the FEAT scales
+
+    Input:
+
+        - sequences: iterable of amino acid strings, Seq objects or bytes, or a ProfileBatch
+        - window: number of residues averaged per window
+        - positions: number of windows per sequence
+        - step: residues between the starts of consecutive windows
+
+    Windows that would run past the end of a sequence repeat its last full
+    window, and sequences shorter than a window are averaged whole. Returns a
+    (sequences x positions x features) float32 tensor.
+    '''
+    batch = sequences if isinstance(sequences, ProfileBatch) else ProfileBatch(sequences)
+    lengths = batch.lengths[:, np.newaxis]
+    starts = np.minimum(np.arange(positions) * step, np.maximum(lengths - window, 0))
+    ends = np.minimum(starts + window, lengths)
+    return batch.means(starts, ends)
+
+
+def get_moving_average_features(sequences, positions=DEFAULT_POSITIONS):
+    '''
+    Method: Calculates the running averages of the FEAT scales from the N-terminus
+
+    Position i holds the average of the first i + 1 residues; sequences
+    shorter than positions are padded with their last value. Returns a
+    (sequences x positions x features) float32 tensor.
+    '''
+    batch = sequences if isinstance(sequences, ProfileBatch) else ProfileBatch(sequences)
+    ends = np.minimum(np.arange(1, positions + 1), batch.lengths[:, np.newaxis])
+    return batch.means(np.zeros_like(ends), ends)
+
+
+def get_positional_features(sequences, positions=DEFAULT_POSITIONS):
+    '''
+    Method: Returns the FEAT scale values of the first residues of every sequence
+
+    Sequences shorter than positions are padded with zeros. Returns a
+    (sequences x positions x features) float32 tensor.
+    '''
+    batch = sequences if isinstance(sequences, ProfileBatch) else ProfileBatch(sequences)
+    lengths = batch.lengths[:, np.newaxis]
+    starts = np.minimum(np.arange(positions), lengths - 1)
+    values = batch.sums(starts, starts + 1)
+    values[np.arange(positions)[np.newaxis, :] >= lengths] = 0
+    return values.astype(np.float32)
+
+
+def get_region_features(sequences, n_terminal=DEFAULT_TERMINAL_LENGTH, c_terminal=DEFAULT_TERMINAL_LENGTH):
+    '''
+    Method: Calculates the average FEAT scales of the N-terminal and C-terminal regions
+
+    Input:
+
+        - sequences: iterable of amino acid strings, Seq objects or bytes, or a ProfileBatch
+        - n_terminal/c_terminal: number of residues in each region, sequences
+          shorter than a region are averaged whole
+
+    Returns a (sequences x features) float32 matrix, in REGION_FEATURE_NAMES order.
+    '''
+    batch = sequences if isinstance(sequences, ProfileBatch) else ProfileBatch(sequences)
+    lengths = batch.lengths[:, np.newaxis]
+    starts = np.hstack([np.zeros_like(lengths), np.maximum(lengths - c_terminal, 0)])
+    ends = np.hstack([np.minimum(lengths, n_terminal), lengths])
+    return batch.means(starts, ends).reshape(len(batch), -1)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='positional_features.py',
+                                     description="Calculate sliding-window and terminal-region FEAT profiles of a FASTA file.")
+    parser.add_argument("fasta", type=str, help="Input FASTA file of protein sequences.")
+    parser.add_argument("-o", "--output", type=str, default="features.npz",
+                        help="Output .npz file (default: %(default)s).")
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW,
+                        help="Residues averaged per window (default: %(default)s).")
+    parser.add_argument("--positions", type=int, default=DEFAULT_POSITIONS,
+                        help="Windows per sequence (default: %(default)s).")
+    parser.add_argument("--step", type=int, default=DEFAULT_STEP,
+                        help="Residues between window starts (default: %(default)s).")
+    parser.add_argument("--terminal-length", type=int, default=DEFAULT_TERMINAL_LENGTH,
+                        help="Residues in the N-terminal and C-terminal regions (default: %(default)s).")
+    parser.add_argument("--chunk-size", type=int, default=10000,
+                        help="Number of sequences profiled at a time (default: %(default)s).")
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.fasta):
+        exit(f"{args.fasta} either is a directory or does not exist.")
+    if args.window < 1 or args.positions < 1 or args.step < 1:
+        exit("--window, --positions and --step must be positive.")
+
+    ids, windows, regions, skipped = [], [], [], []
+    records = read_fasta(args.fasta)
+    while True:
+        chunk = list(itertools.islice(records, args.chunk_size))
+        if not chunk:
+            break
+        # empty and all-'X' records have no profile
+        skipped.extend(seq_id for seq_id, seq in chunk if not has_residues(seq))
+        chunk = [(seq_id, seq) for seq_id, seq in chunk if has_residues(seq)]
+        if not chunk:
+            continue
+        batch = ProfileBatch([seq for _, seq in chunk])
+        ids.extend(seq_id for seq_id, _ in chunk)
+        windows.append(get_window_features(batch, args.window, args.positions, args.step))
+        regions.append(get_region_features(batch, args.terminal_length, args.terminal_length))
+
+    n_features = len(FEATURE_NAMES)
+    np.savez(args.output, ids=np.array(ids, dtype=str),
+             windows=np.concatenate(windows) if windows else np.zeros((0, args.positions, n_features), np.float32),
+             regions=np.concatenate(regions) if regions else np.zeros((0, 2 * n_features), np.float32),
+             feature_names=np.array(FEATURE_NAMES), region_feature_names=np.array(REGION_FEATURE_NAMES))
+    if skipped:
+        print(f"Skipped {len(skipped)} sequences without residues, e.g. {skipped[0]}", file=sys.stderr)
+    print(f"Wrote profiles of {len(ids)} sequences to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
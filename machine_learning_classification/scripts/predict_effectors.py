@@ -1,143 +1,291 @@
-import FEAT
+import argparse
+import itertools
 import sys, warnings
 import numpy as np
 import pandas as pd
-import joblib
-from Bio import SeqIO
+from fasta_reader import read_fasta
+from feature_engine import FEATURE_NAMES
+from instrumentation import PROFILER, DEFAULT_SAMPLE_INTERVAL, format_report, stage
+from motifs import MOTIF_COLUMNS, add_motif_args, scanner_from_args
+from model_registry import load_model
+from prediction_cache import DEFAULT_MAX_BYTES, MemoryCache, PredictionCache, model_fingerprint, predict_sequences
 
-## take in: 
+## take in:
 ##    1) secreted proteins fasta file
 ##    2) (optional) model file path (will default to best Random Forest)
 
 ## RUN LIKE THIS:
 ##    python3.6 predict_effectors.py {INPUT_FASTA_PATH}
+##
+## sequences are read, scored and written in chunks (--chunk-size) so memory
+## stays bounded no matter how large the input FASTA is; sequences identical
+## in the residues the features look at are scored once
 
 ## output:
 ##    1) csv of IDs|class_prediction|meaning|probability_of_prediction
+##       (with --motifs also RXLR/EER positions and RXLR-EER/WY flags, see motifs.py)
 ##    2) fasta file of predicted effectors
 
-if len(sys.argv) < 2:
-    exit("Error: run script as ")
-
-FASTA_FILE = sys.argv[1]
-
-# import trained model
-if len(sys.argv) < 3:
-    MODEL_FILE = "../trained_models/RF_88_best.sav"
-else:
-    MODEL_FILE = sys.argv[2]
-    
-if not sys.warnoptions:
-    warnings.simplefilter("ignore")
-    
-trained_model = joblib.load(open(MODEL_FILE, 'rb'))
-seqs_to_predict = SeqIO.parse(open(FASTA_FILE),'fasta')
+DEFAULT_MODEL_FILE = "../trained_models/RF_88_best.flat"
+DEFAULT_CHUNK_SIZE = 10000
+
+TABLE_FILE = "effector_classification_table.csv"
+EFFECTORS_FILE = "predicted_effectors.fasta"
+
 prediction_map = {'0': "predicted_non-effector", '1': "predicted_effector"}
 
 
-def get_average_features(sequence, df=0, protID=0):
-	'''
-	Method: Fills feature columns in a dataframe with net averages
+def read_chunks(fasta_file, chunk_size=DEFAULT_CHUNK_SIZE):
+    '''
+    Method: Yields (IDs, sequences) lists of at most chunk_size FASTA records
 
-	Input:
+    Input:
 
-		- sequence: amino acid string
-		- df: dataframe
-		- protID: sequence identifier
-	'''
+        - fasta_file: path of the FASTA file to read
+        - chunk_size: maximum number of records per chunk
+    '''
+    records = read_fasta(fasta_file)
+    while True:
+        with stage("parse") as call:
+            chunk = list(itertools.islice(records, chunk_size))
+            seq_ids, sequences = [seq_id for seq_id, _ in chunk], [seq.decode() for _, seq in chunk]
+            call.sequences = len(chunk)
+        if not chunk:
+            return
+        yield seq_ids, sequences
 
-	# get net cumulative sums
-	#print("calculating for", sequence)
-	length = min(len(sequence), 900)
 
-	gravy = hydrophobicity = exposed = disorder = bulkiness = interface = 0.0
-	for ind, aa in enumerate(sequence):
-		if ind == length: break
+def score_chunk(trained_model, seq_ids, sequences, offset=0, cache=None, model=None,
+                scanner=None, features=False):
+    '''
+    Method: Featurizes and scores one chunk of sequences
 
-		if aa.upper() in FEAT.INTERFACE_DIC:
-			gravy += FEAT.GRAVY_DIC[aa.upper()]
-			hydrophobicity += FEAT.HYDRO_DIC[aa.upper()]
-			exposed += FEAT.EXPOSED_DIC[aa.upper()]
-			disorder += FEAT.DISORDER_DIC[aa.upper()]
-			bulkiness += FEAT.BULKY_DIC[aa.upper()]
-			interface += FEAT.INTERFACE_DIC[aa.upper()]
+    Input:
 
-	# return averages
-	return [gravy           / length,
-			hydrophobicity 	/ length,
-			exposed 		/ length,
-			disorder 		/ length,
-			bulkiness 		/ length,
-			interface 		/ length]
+        - trained_model: fitted classifier with predict/predict_proba
+        - seq_ids: FASTA IDs of the chunk
+        - sequences: amino acid strings of the chunk
+        - offset: number of records in earlier chunks, used as the row index
+        - cache: optional PredictionCache, only cache misses are scored
+        - model: fingerprint of trained_model, required with a cache
+        - scanner: optional motifs.MotifScanner, its flags are added as columns
+        - features: also add the averaged feature columns (FEATURE_NAMES)
+    '''
+    # get predicted output
+    predicted = predict_sequences(trained_model, sequences, cache, model, with_features=features)
+    predictions, probabilities = predicted[:2]
+    meanings = np.array([prediction_map[pred] for pred in predictions])
 
-    
-def main():
-    # preprocessing
-    seq_ids = []
-    full_sequences = []
-    str_sequences = []
+    resultDF = pd.DataFrame({"proteinID": seq_ids,
+                             "sequence": sequences,
+                             "prediction": predictions,
+                             "probability": probabilities,
+                             "meaning": meanings},
+                            index=pd.RangeIndex(offset, offset + len(seq_ids)))
 
-    # generate features, retrieve fasta IDs
-    for protein in seqs_to_predict:
-        seq_ids.append(protein.id)
-        full_sequences.append(protein.seq)
-        str_sequences.append(str(protein.seq))
+    # round probabilities
+    resultDF['probability'] = np.round(resultDF['probability'], 2)
 
+    if features:
+        for column, values in zip(FEATURE_NAMES, predicted[2].T):
+            resultDF[column] = values
 
+    if scanner is not None:
+        with stage("motifs", len(sequences)):
+            motifDF = scanner.scan(sequences)
+        motifDF.index = resultDF.index
+        resultDF = pd.concat([resultDF, motifDF], axis=1)
+    return resultDF
 
-    seq_features = np.array([get_average_features(seq) for seq in full_sequences])
 
-    print("Sequences to run secreted oomycete-trained Random Forest \
-effector classifier on: ", len(seq_features))
-    
-    print("\n**NOTES**: \n\n \
-            Positive training dataset: ~100 experimentally validated oomycete avirulence effectors \n \
-            Negative training dataset: ~100 secreted orthologous oomycete genes \n\n\
-**END OF NOTES**\n")
-          
+class ResultWriter:
+    '''
+    Appends scored chunks to the classification table and effector FASTA
+    '''
 
-    # get predicted output
-    predictions = trained_model.predict(seq_features)
-    probabilities = trained_model.predict_proba(seq_features)
-    meanings = np.array([prediction_map[pred] for pred in predictions])
+    # whether score_chunk should add the feature columns for this writer
+    features = False
 
+    def __init__(self, table_file=TABLE_FILE, effectors_file=EFFECTORS_FILE, motifs=False):
+        self.columns = ["proteinID", "sequence", "prediction", "probability", "meaning"]
+        if motifs:
+            self.columns += MOTIF_COLUMNS
+        self.table = self._open_table(table_file)
+        self.effectors = open(effectors_file, 'w')
+        self.rows_written = 0
+        self.effectors_written = 0
+        self.class_counts = pd.Series(dtype=np.int64)
 
-    resultDF = pd.DataFrame({"proteinID": seq_ids,
-                             "sequence": str_sequences,
-                             "prediction": predictions, 
-                             "probability": probabilities[:,1], 
-                             "meaning": meanings})
-    
-    # round probabilities
-    resultDF['probability'] = np.round(resultDF['probability'], 2)
+    def write(self, resultDF):
+        with stage("write", len(resultDF)):
+            self._write(resultDF)
 
-    print("\nCounts of predicted classes: ")
-    print(resultDF['meaning'].value_counts())
-    
-    # write table and predicted effectors to CSV
-    resultDF.to_csv("effector_classification_table.csv")
-    
-    # write effectors
-    with open("predicted_effectors.fasta", 'w') as outfile:
+    def _open_table(self, table_file):
+        return open(table_file, 'w')
+
+    def _write_table(self, resultDF):
+        # write table rows, header only in front of the first chunk
+        resultDF.to_csv(self.table, header=self.rows_written == 0)
+
+    def _close_table(self):
+        if self.rows_written == 0:
+            # keep the table readable even when the input had no records
+            pd.DataFrame(columns=self.columns).to_csv(self.table)
+        self.table.close()
+
+    def _write(self, resultDF):
+        self._write_table(resultDF)
+        self.rows_written += len(resultDF)
+        self.class_counts = self.class_counts.add(resultDF['meaning'].value_counts(),
+                                                  fill_value=0)
+
+        # write effectors
         effectors = resultDF[resultDF['meaning'] == "predicted_effector"]
 
         ids_to_write = effectors["proteinID"] + ' ' \
                         + effectors["meaning"] + ' ' \
                         + "probability=" \
                         + effectors["probability"].astype(str)
-        
+
         ids_to_write = ids_to_write.tolist()
         effector_seqs = effectors['sequence'].tolist()
-        
+
         for idx, cur_id in enumerate(ids_to_write):
-            if idx != 0: outfile.write("\n")
-            outfile.write(">" + cur_id + " \n")
-            outfile.write(effector_seqs[idx])
-        
+            if self.effectors_written != 0: self.effectors.write("\n")
+            self.effectors.write(">" + cur_id + " \n")
+            self.effectors.write(effector_seqs[idx])
+            self.effectors_written += 1
+
+    def close(self):
+        if self.effectors.closed:
+            return
+        self._close_table()
+        self.effectors.close()
+
+
+def predict_file(trained_model, fasta_file, writer, chunk_size=DEFAULT_CHUNK_SIZE,
+                 cache=None, model=None, scanner=None):
+    '''
+    Method: Streams a FASTA file through the model chunk by chunk
+
+    Input:
+
+        - trained_model: fitted classifier with predict/predict_proba
+        - fasta_file: path of the FASTA file to score
+        - writer: ResultWriter the scored chunks are appended to
+        - chunk_size: maximum number of records held in memory at once
+        - cache: optional PredictionCache
+        - model: fingerprint of trained_model, required with a cache
+        - scanner: optional motifs.MotifScanner
+    '''
+    # without a cache file, sequences repeated in later chunks are still scored once
+    if cache is None:
+        cache = MemoryCache(with_features=writer.features)
+    for seq_ids, sequences in read_chunks(fasta_file, chunk_size):
+        writer.write(score_chunk(trained_model, seq_ids, sequences, writer.rows_written,
+                                 cache, model, scanner, writer.features))
+    return writer.rows_written
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='predict_effectors.py',
+                                     description="Predict oomycete effectors from a FASTA file of secreted proteins.")
+    parser.add_argument("fasta", type=str, help="Input FASTA file of (secreted) protein sequences.")
+    parser.add_argument("model", type=str, nargs='?', default=DEFAULT_MODEL_FILE,
+                        help="Trained model file (default: %(default)s).")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="Number of sequences read, scored and written at a time (default: %(default)s).")
+    add_cache_args(parser)
+    parser.add_argument("--motifs", action="store_true",
+                        help="Also scan for RXLR-EER motifs and WY domains, adding their flags to the table.")
+    add_motif_args(parser)
+    parser.add_argument("--output-format", choices=["csv", "parquet", "arrow"], default="csv",
+                        help="Format of the classification table; parquet/arrow (needs pyarrow) also store the "
+                             "features and keep sequences in a separate file (default: %(default)s).")
+    parser.add_argument("--columns", type=str, nargs='+', default=None,
+                        help="Columns of a parquet/arrow table to write (default: all); "
+                             "include 'sequence' to write the sequences file.")
+    parser.add_argument("--compression", type=str, default="zstd",
+                        help="Compression of parquet/arrow output, e.g. zstd, lz4 or none (default: %(default)s).")
+    parser.add_argument("--profile", action="store_true",
+                        help="Print the time, throughput and peak memory of every stage (parse, featurize, score, write).")
+    args = parser.parse_args(argv)
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be a positive integer")
+    if args.columns is not None and args.output_format == "csv":
+        parser.error("--columns only applies to --output-format parquet or arrow")
+    return args
+
+
+def add_cache_args(parser):
+    parser.add_argument("--cache", type=str, default=None,
+                        help="SQLite prediction cache; sequences scored before with the same model are looked up instead of re-scored.")
+    parser.add_argument("--cache-size", type=float, default=DEFAULT_MAX_BYTES / 1024**2,
+                        help="Maximum cache size in MB, least recently used entries are evicted (default: %(default)s).")
+
+
+def open_cache(args):
+    '''
+    Method: Returns the PredictionCache and model fingerprint requested on the command line
+    '''
+    if args.cache is None:
+        return None, None
+    return PredictionCache(args.cache, int(args.cache_size * 1024**2)), model_fingerprint(args.model)
+
+
+def main():
+    args = parse_args()
+
+    if not sys.warnoptions:
+        warnings.simplefilter("ignore")
+
+    if args.profile:
+        PROFILER.enable(DEFAULT_SAMPLE_INTERVAL)
+
+    trained_model = load_model(args.model)
+
+    print("\n**NOTES**: \n\n \
+            Positive training dataset: ~100 experimentally validated oomycete avirulence effectors \n \
+            Negative training dataset: ~100 secreted orthologous oomycete genes \n\n\
+**END OF NOTES**\n")
+
+    cache, model = open_cache(args)
+    scanner = scanner_from_args(args) if args.motifs else None
+    if args.output_format == "csv":
+        writer = ResultWriter(motifs=args.motifs)
+        table_file = TABLE_FILE
+    else:
+        from columnar_output import ColumnarResultWriter
+        try:
+            writer = ColumnarResultWriter(args.output_format, motifs=args.motifs, columns=args.columns,
+                                          compression=args.compression)
+        except (ImportError, ValueError) as e:
+            exit(str(e))
+        table_file = writer.table_file
+        if writer.with_sequences:
+            table_file += " (sequences in " + writer.sequences_file + ")"
+    try:
+        n_sequences = predict_file(trained_model, args.fasta, writer, args.chunk_size,
+                                   cache, model, scanner)
+    finally:
+        writer.close()
+        if cache is not None:
+            cache.close()
+
+    print("Sequences run through secreted oomycete-trained Random Forest \
+effector classifier: ", n_sequences)
+
+    print("\nCounts of predicted classes: ")
+    print(writer.class_counts.astype(np.int64).sort_values(ascending=False))
+
     print("\nOutput fasta of predicted effectors available in: \n \
              predicted_effectors.fasta\n")
-    print("Detailed CSV with fasta IDs | sequences | predictions | probabilities in: \n \
-           effector_classification_table.csv\n")
+    print("Detailed table with fasta IDs | sequences | predictions | probabilities in: \n \
+           " + table_file + "\n")
+
+    if args.profile:
+        print("Profile of the run:")
+        print(format_report(PROFILER.snapshot()))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,175 @@
+import argparse
+import os
+import sys, warnings
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from feature_engine import get_features_matrix
+from flat_forest import predict_with_proba
+from model_registry import load_model
+from predict_effectors import DEFAULT_CHUNK_SIZE, prediction_map, read_chunks
+
+## take in:
+##    1) secreted proteins fasta file
+##    2) (optional) any number of model file paths (will default to every model in trained_models/)
+
+## RUN LIKE THIS:
+##    python3 predict_ensemble.py {INPUT_FASTA_PATH}
+##    python3 predict_ensemble.py {INPUT_FASTA_PATH} ../trained_models/RF_88_best.flat ../trained_models/Gaussian_2_90.sav
+##
+## every chunk of sequences is featurized once and scored by all models at the
+## same time, so comparing models costs one pass over the FASTA file
+
+## output:
+##    1) csv of IDs|one score per model|consensus score|votes|consensus prediction|meaning
+
+DEFAULT_MODEL_FILES = ["../trained_models/RF_88_best.flat",
+                       "../trained_models/RF_secondary.flat",
+                       "../trained_models/Gaussian_0_91.sav",
+                       "../trained_models/Gaussian_2_90.sav",
+                       "../trained_models/LinSVC_1_87.sav"]
+
+ENSEMBLE_TABLE_FILE = "ensemble_classification_table.csv"
+
+
+def model_name(model_file):
+    '''
+    Method: Returns the column name of a model, its file name up to the first '.'
+    '''
+    return os.path.basename(os.path.normpath(model_file)).split('.')[0]
+
+
+def effector_scores(trained_model, seq_features):
+    '''
+    Method: Returns the effector score of every row and whether the model predicts an effector
+
+    Input:
+
+        - trained_model: fitted classifier
+        - seq_features: (sequences x features) matrix
+
+    The score is the effector probability for models with predict_proba. Margin
+    classifiers (the LinearSVC models) have no probabilities, their decision
+    function is squashed into (0, 1) with a logistic instead, which is
+    uncalibrated but still crosses 0.5 where the prediction flips.
+    '''
+    # models trained on a numeric label column have the classes 0 and 1 instead of '0' and '1'
+    effector_index = [str(label) for label in trained_model.classes_].index('1')
+    if hasattr(trained_model, "predict_proba"):
+        predictions, probabilities = predict_with_proba(trained_model, seq_features)
+        scores = probabilities[:, effector_index]
+    else:
+        predictions = trained_model.predict(seq_features)
+        margins = trained_model.decision_function(seq_features)
+        if effector_index == 0:
+            margins = -margins
+        scores = 1.0 / (1.0 + np.exp(-margins))
+    return scores, predictions == trained_model.classes_[effector_index]
+
+
+class EnsembleScorer:
+    '''
+    Scores featurized chunks with several models concurrently
+    '''
+
+    def __init__(self, model_files, workers=None):
+        self.names = [model_name(model_file) for model_file in model_files]
+        if len(set(self.names)) != len(self.names):
+            raise ValueError(f"model names must be unique, got {self.names}")
+        self.models = [load_model(model_file) for model_file in model_files]
+        # scikit-learn and NumPy release the GIL for most of the work, threads are enough
+        self.pool = ThreadPoolExecutor(max_workers=workers or len(self.models))
+
+    def score_chunk(self, seq_ids, sequences, offset=0):
+        '''
+        Method: Featurizes one chunk once and scores it with every model
+
+        Input:
+
+            - seq_ids: FASTA IDs of the chunk
+            - sequences: amino acid strings of the chunk
+            - offset: number of records in earlier chunks, used as the row index
+        '''
+        seq_features = get_features_matrix(sequences)
+        results = list(self.pool.map(lambda trained_model: effector_scores(trained_model, seq_features),
+                                     self.models))
+
+        resultDF = pd.DataFrame({"proteinID": seq_ids},
+                                index=pd.RangeIndex(offset, offset + len(seq_ids)))
+        for name, (scores, _) in zip(self.names, results):
+            resultDF[name] = np.round(scores, 2)
+
+        # consensus: mean score over models, majority vote for the prediction
+        consensus = np.mean([scores for scores, _ in results], axis=0)
+        votes = np.sum([is_effector for _, is_effector in results], axis=0)
+        resultDF["consensus"] = np.round(consensus, 2)
+        resultDF["votes"] = votes
+        resultDF["prediction"] = np.where(2 * votes > len(self.models), '1', '0')
+        resultDF["meaning"] = resultDF["prediction"].map(prediction_map)
+        return resultDF
+
+    def close(self):
+        self.pool.shutdown()
+
+
+def predict_file(scorer, fasta_file, table_file=ENSEMBLE_TABLE_FILE, chunk_size=DEFAULT_CHUNK_SIZE):
+    '''
+    Method: Streams a FASTA file through every model of the ensemble, writing one table
+
+    Input:
+
+        - scorer: EnsembleScorer
+        - fasta_file: path of the FASTA file to score
+        - table_file: path of the csv to write
+        - chunk_size: maximum number of records held in memory at once
+    '''
+    rows_written = 0
+    votes = pd.Series(dtype=np.int64)
+    with open(table_file, 'w') as table:
+        for seq_ids, sequences in read_chunks(fasta_file, chunk_size):
+            resultDF = scorer.score_chunk(seq_ids, sequences, rows_written)
+            resultDF.to_csv(table, header=rows_written == 0)
+            rows_written += len(resultDF)
+            votes = votes.add(resultDF["votes"].value_counts(), fill_value=0)
+        if rows_written == 0:
+            pd.DataFrame(columns=["proteinID", *scorer.names, "consensus", "votes",
+                                  "prediction", "meaning"]).to_csv(table)
+    return rows_written, votes.astype(np.int64).sort_index()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='predict_ensemble.py',
+                                     description="Score a FASTA file of secreted proteins with several trained models in one pass.")
+    parser.add_argument("fasta", type=str, help="Input FASTA file of (secreted) protein sequences.")
+    parser.add_argument("models", type=str, nargs='*', default=DEFAULT_MODEL_FILES,
+                        help="Trained model files (default: every model in trained_models/).")
+    parser.add_argument("-o", "--output", type=str, default=ENSEMBLE_TABLE_FILE,
+                        help="Output csv (default: %(default)s).")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="Number of sequences read, scored and written at a time (default: %(default)s).")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="Number of models scored at the same time (default: all of them).")
+    args = parser.parse_args()
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be a positive integer")
+
+    if not sys.warnoptions:
+        warnings.simplefilter("ignore")
+
+    scorer = EnsembleScorer(args.models, args.workers)
+    try:
+        n_sequences, votes = predict_file(scorer, args.fasta, args.output, args.chunk_size)
+    finally:
+        scorer.close()
+
+    print("Sequences run through", len(scorer.models), "models (" + ", ".join(scorer.names) + "):", n_sequences)
+    print("\nNumber of models predicting an effector: ")
+    print(votes.to_string())
+    print("\nDetailed CSV with fasta IDs | model scores | consensus | votes | predictions in: \n \
+           " + args.output + "\n")
+
+
+if __name__ == "__main__":
+    main()
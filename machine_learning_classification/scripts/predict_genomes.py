@@ -0,0 +1,234 @@
+import argparse
+import collections
+import glob
+import os
+import sys, warnings
+from concurrent.futures import ProcessPoolExecutor
+
+from model_registry import load_model
+from motifs import add_motif_args, scanner_from_args
+from prediction_cache import PredictionCache, model_fingerprint
+from predict_effectors import (DEFAULT_MODEL_FILE, TABLE_FILE, EFFECTORS_FILE,
+                               read_chunks, score_chunk, ResultWriter, add_cache_args)
+
+## take in:
+##    1) any number of secreted proteins fasta files (or quoted glob patterns)
+##    2) (optional) model file path (will default to best Random Forest)
+
+## RUN LIKE THIS:
+##    python3 predict_genomes.py "../../results/EffectorO_genome_results/secretomes/*.fasta" -o genome_predictions
+##
+## the model is loaded once and every input is split into chunks that are
+## scored by a pool of worker processes, so one large genome is spread over
+## all workers instead of holding up the run
+
+## output (one directory per input, named after the file up to its first '.',
+## with a _2, _3, ... suffix for inputs whose names agree up to there):
+##    1) csv of IDs|class_prediction|meaning|probability_of_prediction
+##    2) fasta file of predicted effectors
+
+# smaller than the single-file default so even one genome feeds every worker
+DEFAULT_CHUNK_SIZE = 2000
+
+# model (and optional prediction cache) shared by the chunks scored in a worker process
+_worker_model = None
+_worker_cache = None
+_worker_fingerprint = None
+_worker_scanner = None
+
+
+def available_cores():
+    '''
+    Method: Returns the number of cores this process may run on
+    '''
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _init_worker(trained_model, n_jobs, cache_path=None, cache_bytes=None, fingerprint=None,
+                 scanner=None):
+    global _worker_model, _worker_cache, _worker_fingerprint, _worker_scanner
+    if not sys.warnoptions:
+        warnings.simplefilter("ignore")
+    if hasattr(trained_model, "n_jobs"):
+        trained_model.n_jobs = n_jobs
+    _worker_model = trained_model
+    _worker_scanner = scanner
+    if cache_path is not None:
+        # every worker keeps its own connection to the shared cache file
+        _worker_cache = PredictionCache(cache_path, cache_bytes)
+        _worker_fingerprint = fingerprint
+
+
+def _score_worker_chunk(seq_ids, sequences, offset):
+    return score_chunk(_worker_model, seq_ids, sequences, offset,
+                       _worker_cache, _worker_fingerprint, _worker_scanner)
+
+
+def expand_inputs(patterns):
+    '''
+    Method: Expands glob patterns into an ordered, duplicate-free list of files
+
+    Input:
+
+        - patterns: FASTA paths and/or glob patterns
+    '''
+    fasta_files = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        if not matches:
+            exit(f"No FASTA files match {pattern}.")
+        for fasta_file in matches:
+            if not os.path.isfile(fasta_file):
+                exit(f"{fasta_file} either is not a file or does not exist.")
+            if fasta_file not in fasta_files:
+                fasta_files.append(fasta_file)
+    return fasta_files
+
+
+def genome_name(fasta_file):
+    return os.path.basename(fasta_file).split('.')[0]
+
+
+def output_names(fasta_files):
+    '''
+    Method: Returns {fasta_file: name of its output directory}, distinct for every file
+
+    Files whose names agree up to the first '.' (sp_B_lac-SF5.protein.fasta and
+    sp_B_lac-SF5.orfs.fasta, or one file name in two directories) would write
+    into the same directory, so the later ones get a _2, _3, ... suffix.
+    '''
+    names = {}
+    taken = set()
+    for fasta_file in fasta_files:
+        name = base = genome_name(fasta_file)
+        suffix = 1
+        while name in taken:
+            suffix += 1
+            name = f"{base}_{suffix}"
+        taken.add(name)
+        names[fasta_file] = name
+    return names
+
+
+def predict_genomes(trained_model, fasta_files, output_dir, workers, chunk_size=DEFAULT_CHUNK_SIZE,
+                    cache_path=None, cache_bytes=None, fingerprint=None, scanner=None, names=None):
+    '''
+    Method: Scores many FASTA files with one model over a process pool
+
+    Input:
+
+        - trained_model: fitted classifier with predict/predict_proba
+        - fasta_files: FASTA files to score
+        - output_dir: directory receiving one sub-directory per FASTA file
+        - workers: number of worker processes
+        - chunk_size: number of records per unit of work
+        - cache_path: optional SQLite prediction cache shared by the workers
+        - cache_bytes: maximum size of the prediction cache
+        - fingerprint: fingerprint of trained_model, required with a cache
+        - scanner: optional motifs.MotifScanner, adds motif columns to the tables
+        - names: {fasta_file: output directory name} (default: output_names(fasta_files))
+
+    Returns a {fasta_file: number of sequences scored} dictionary.
+    '''
+    n_jobs = max(1, available_cores() // workers)
+    # bound the chunks held in memory while keeping every worker busy
+    max_pending = 2 * workers
+    pending = collections.deque()
+    writers = []
+    counts = {}
+    names = names or output_names(fasta_files)
+
+    def flush_oldest():
+        # a None future marks the end of a genome, its writer can be closed
+        writer, future = pending.popleft()
+        if future is None:
+            writer.close()
+        else:
+            writer.write(future.result())
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(trained_model, n_jobs, cache_path,
+                                       cache_bytes, fingerprint, scanner)) as pool:
+        try:
+            for fasta_file in fasta_files:
+                genome_dir = os.path.join(output_dir, names[fasta_file])
+                os.makedirs(genome_dir, exist_ok=True)
+                writer = ResultWriter(os.path.join(genome_dir, TABLE_FILE),
+                                      os.path.join(genome_dir, EFFECTORS_FILE),
+                                      motifs=scanner is not None)
+                writers.append(writer)
+                offset = 0
+                for seq_ids, sequences in read_chunks(fasta_file, chunk_size):
+                    while len(pending) >= max_pending:
+                        flush_oldest()
+                    pending.append((writer, pool.submit(_score_worker_chunk,
+                                                        seq_ids, sequences, offset)))
+                    offset += len(seq_ids)
+                pending.append((writer, None))
+                counts[fasta_file] = offset
+
+            while pending:
+                flush_oldest()
+        finally:
+            for writer in writers:
+                writer.close()
+
+    return counts
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='predict_genomes.py',
+                                     description="Predict oomycete effectors for many FASTA files with one model over a process pool.")
+    parser.add_argument("fasta", type=str, nargs='+',
+                        help="Input FASTA files of (secreted) protein sequences, or quoted glob patterns.")
+    parser.add_argument("--model", "-m", type=str, default=DEFAULT_MODEL_FILE,
+                        help="Trained model file (default: %(default)s).")
+    parser.add_argument("--output-dir", "-o", type=str, default=".",
+                        help="Directory for the per-genome output directories (default: current directory).")
+    parser.add_argument("--workers", "-w", type=int, default=available_cores(),
+                        help="Number of worker processes (default: available cores).")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="Number of sequences per unit of work (default: %(default)s).")
+    add_cache_args(parser)
+    parser.add_argument("--motifs", action="store_true",
+                        help="Also scan for RXLR-EER motifs and WY domains, adding their flags to the tables.")
+    add_motif_args(parser)
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be a positive integer")
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be a positive integer")
+    return args
+
+
+def main():
+    args = parse_args()
+
+    if not sys.warnoptions:
+        warnings.simplefilter("ignore")
+
+    fasta_files = expand_inputs(args.fasta)
+
+    trained_model = load_model(args.model)
+
+    names = output_names(fasta_files)
+    for fasta_file, name in names.items():
+        if name != genome_name(fasta_file):
+            print(f"{fasta_file}: another input is also named {genome_name(fasta_file)}, "
+                  f"its results are written to {name}", file=sys.stderr)
+
+    fingerprint = model_fingerprint(args.model) if args.cache is not None else None
+    counts = predict_genomes(trained_model, fasta_files, args.output_dir,
+                             args.workers, args.chunk_size, args.cache,
+                             int(args.cache_size * 1024**2), fingerprint,
+                             scanner_from_args(args) if args.motifs else None, names)
+
+    for fasta_file, n_sequences in counts.items():
+        print(f"{names[fasta_file]}: {n_sequences} sequences scored, results in "
+              f"{os.path.join(args.output_dir, names[fasta_file])}")
+
+
+if __name__ == "__main__":
+    main()
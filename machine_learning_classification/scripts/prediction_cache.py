@@ -0,0 +1,328 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from feature_engine import FEATURE_NAMES, MAX_SEQUENCE_LENGTH, get_features_matrix, to_residue_bytes
+from flat_forest import predict_with_proba
+from instrumentation import stage
+
+## Persistent, content-addressed cache of model predictions.
+##
+## Entries are keyed by a model fingerprint and a hash of the first 900
+## residues (the only part of a sequence the features look at), and hold the
+## six averaged features, the predicted class and the effector probability.
+## The SQLite file is kept under a size limit by evicting the least recently
+## used entries. Without a cache file, a MemoryCache with the same interface
+## remembers the sequences of a single run.
+
+DEFAULT_MAX_BYTES = 512 * 1024**2
+
+# memory a MemoryCache may take up, see MemoryCache.entry_bytes()
+DEFAULT_MEMORY_BYTES = 64 * 1024**2
+
+# SQLite's default limit on host parameters per statement is 999
+_LOOKUP_BATCH = 500
+
+
+def sequence_digest(sequence):
+    '''
+    Method: Hashes the residues of a sequence that the features are computed on
+
+    Input:
+
+        - sequence: amino acid string, Seq object or bytes
+    '''
+    # the feature tables are case-insensitive, so the hash is too
+    residues = to_residue_bytes(sequence, MAX_SEQUENCE_LENGTH).upper()
+    return hashlib.blake2b(residues, digest_size=16).digest()
+
+
+def model_fingerprint(model_file):
+    '''
+    Method: Hashes a trained model file, so cache entries never outlive a model
+
+    Input:
+
+        - model_file: path of the pickled model, or directory of an exported model
+    '''
+    digest = hashlib.sha256()
+    if os.path.isdir(model_file):
+        files = [os.path.join(model_file, name) for name in sorted(os.listdir(model_file))]
+    else:
+        files = [model_file]
+    for path in files:
+        digest.update(os.path.basename(path).encode())
+        with open(path, 'rb') as handle:
+            for block in iter(lambda: handle.read(1024**2), b''):
+                digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+class PredictionCache:
+    '''
+    SQLite-backed store of (features, prediction, probability) per sequence
+    '''
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        feature_columns = ", ".join(f"{name} REAL NOT NULL" for name in FEATURE_NAMES)
+        with self.connection:
+            self.connection.execute(f"""
+                CREATE TABLE IF NOT EXISTS predictions (
+                    model TEXT NOT NULL,
+                    digest BLOB NOT NULL,
+                    {feature_columns},
+                    prediction INTEGER NOT NULL,
+                    probability REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (model, digest)
+                ) WITHOUT ROWID""")
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS predictions_last_used ON predictions (last_used)")
+
+    @property
+    def connection(self):
+        '''
+        Connection of the calling thread and process
+
+        Several processes (gunicorn workers, predict_genomes.py workers) and
+        the threads of a web server may share one cache file, but SQLite
+        connections may not cross threads or forks, so each gets its own.
+        '''
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            local.connection = sqlite3.connect(self.path, timeout=60)
+            local.connection.execute("PRAGMA journal_mode=WAL")
+            local.connection.execute("PRAGMA synchronous=NORMAL")
+            local.pid = os.getpid()
+        return local.connection
+
+    def lookup(self, model, digests):
+        '''
+        Method: Returns {digest: (features, prediction index, probability)} for cached digests
+
+        Input:
+
+            - model: model fingerprint
+            - digests: sequence digests to look up
+        '''
+        unique = list(set(digests))
+        hits = {}
+        columns = ", ".join(FEATURE_NAMES)
+        for start in range(0, len(unique), _LOOKUP_BATCH):
+            batch = unique[start:start + _LOOKUP_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            rows = self.connection.execute(
+                f"SELECT digest, {columns}, prediction, probability FROM predictions "
+                f"WHERE model = ? AND digest IN ({placeholders})", [model] + batch)
+            for row in rows:
+                hits[row[0]] = (row[1:-2], row[-2], row[-1])
+
+        if hits:
+            # refresh recency of the hits for LRU eviction
+            now = time.time()
+            with self.connection:
+                self.connection.executemany(
+                    "UPDATE predictions SET last_used = ? WHERE model = ? AND digest = ?",
+                    [(now, model, digest) for digest in hits])
+        return hits
+
+    def store(self, model, digests, features, predictions, probabilities):
+        '''
+        Method: Adds freshly scored sequences to the cache, evicting old entries if needed
+
+        Input:
+
+            - model: model fingerprint
+            - digests: sequence digests
+            - features: (sequences x features) matrix
+            - predictions: predicted class indices
+            - probabilities: effector probabilities
+        '''
+        now = time.time()
+        placeholders = ",".join("?" * (len(FEATURE_NAMES) + 5))
+        rows = [(model, digest, *map(float, feature_row), int(prediction), float(probability), now)
+                for digest, feature_row, prediction, probability
+                in zip(digests, features, predictions, probabilities)]
+        with self.connection:
+            self.connection.executemany(
+                f"INSERT OR REPLACE INTO predictions VALUES ({placeholders})", rows)
+        self.evict()
+
+    def size(self):
+        '''
+        Method: Returns the number of bytes of the cache file holding live entries
+        '''
+        page_size, = self.connection.execute("PRAGMA page_size").fetchone()
+        page_count, = self.connection.execute("PRAGMA page_count").fetchone()
+        free_pages, = self.connection.execute("PRAGMA freelist_count").fetchone()
+        return (page_count - free_pages) * page_size
+
+    def evict(self):
+        '''
+        Method: Drops least recently used entries until the cache fits in max_bytes
+        '''
+        while self.size() > self.max_bytes:
+            entries, = self.connection.execute("SELECT COUNT(*) FROM predictions").fetchone()
+            if entries == 0:
+                return
+            with self.connection:
+                self.connection.execute(
+                    "DELETE FROM predictions WHERE (model, digest) IN (SELECT model, digest "
+                    "FROM predictions ORDER BY last_used LIMIT ?)", (max(1, entries // 10),))
+
+    def close(self):
+        if getattr(self._local, "pid", None) == os.getpid():
+            self._local.connection.close()
+            del self._local.pid
+
+
+class MemoryCache:
+    '''
+    In-memory store of (features, prediction, probability) per sequence, for the duration of one run
+
+    Has the lookup/store interface of PredictionCache, so sequences repeated
+    across the chunks of a run are scored once without a cache file. Digests
+    map to rows of preallocated arrays, so an entry costs one dictionary slot
+    and digest object plus a few array bytes, and the cache never grows past
+    max_bytes; once full it keeps what it has. The features are only kept
+    with with_features, as only parquet/arrow output writes them.
+    '''
+
+    # dictionary slot, 16-byte digest object and row number of an entry
+    _KEY_BYTES = 170
+
+    def __init__(self, max_bytes=DEFAULT_MEMORY_BYTES, with_features=False):
+        self.max_bytes = max_bytes
+        self.with_features = with_features
+        self.max_entries = max(0, max_bytes // self.entry_bytes(with_features))
+        self.model = None
+        self._rows = {}
+        # untouched pages of the arrays take up no memory, so they are sized for max_entries up front
+        self._prediction_indices = np.empty(self.max_entries, dtype=np.int8)
+        self._probabilities = np.empty(self.max_entries, dtype=np.float64)
+        self._features = np.empty((self.max_entries, len(FEATURE_NAMES)), dtype=np.float64) \
+            if with_features else None
+
+    @classmethod
+    def entry_bytes(cls, with_features=False):
+        '''
+        Method: Returns the approximate number of bytes one entry takes up
+        '''
+        return cls._KEY_BYTES + 1 + 8 + (8 * len(FEATURE_NAMES) if with_features else 0)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def lookup(self, model, digests):
+        if model != self.model:
+            return {}
+        rows = self._rows
+        hits = {}
+        for digest in digests:
+            row = rows.get(digest)
+            if row is not None:
+                hits[digest] = (self._features[row] if self.with_features else None,
+                                int(self._prediction_indices[row]), float(self._probabilities[row]))
+        return hits
+
+    def store(self, model, digests, features, predictions, probabilities):
+        if model != self.model:
+            # entries of another model would never be looked up again
+            self._rows = {}
+            self.model = model
+        rows = self._rows
+        for digest, feature_row, prediction, probability in zip(digests, features, predictions, probabilities):
+            if digest in rows:
+                continue
+            row = len(rows)
+            if row >= self.max_entries:
+                # a run this diverse gains little from remembering more
+                return
+            rows[digest] = row
+            self._prediction_indices[row] = prediction
+            self._probabilities[row] = probability
+            if self.with_features:
+                self._features[row] = feature_row
+
+    def close(self):
+        self._rows = {}
+
+
+def predict_sequences(trained_model, sequences, cache=None, model=None, with_features=False):
+    '''
+    Method: Predicts classes and effector probabilities, scoring every distinct sequence once
+
+    Input:
+
+        - trained_model: fitted classifier with predict/predict_proba
+        - sequences: amino acid strings or Seq objects
+        - cache: optional PredictionCache or MemoryCache
+        - model: fingerprint of trained_model, required with a PredictionCache
+        - with_features: also return the (sequences x features) matrix
+
+    Sequences whose first MAX_SEQUENCE_LENGTH residues are identical get the
+    same features, so only the first of them is featurized and scored (or
+    looked up in the cache) and its results are copied to the others.
+
+    Returns the predicted classes and the probabilities of the second class
+    (and the features, with with_features).
+    '''
+    classes = trained_model.classes_
+    class_index = {label: index for index, label in enumerate(classes)}
+
+    with stage("dedup", len(sequences)):
+        # row of every sequence in the distinct ones, and the first row of each distinct sequence
+        digest_rows = {}
+        inverse = np.fromiter((digest_rows.setdefault(sequence_digest(seq), len(digest_rows)) for seq in sequences),
+                              dtype=np.int64, count=len(sequences))
+        digests = list(digest_rows)
+        _, first_rows = np.unique(inverse, return_index=True)
+
+    if cache is not None:
+        with stage("cache", len(digests)):
+            hits = cache.lookup(model, digests)
+    else:
+        hits = {}
+
+    prediction_indices = np.empty(len(digests), dtype=np.int64)
+    probabilities = np.empty(len(digests), dtype=np.float64)
+    features = np.empty((len(digests), len(FEATURE_NAMES)), dtype=np.float64) if with_features else None
+    misses = []
+    for row, digest in enumerate(digests):
+        hit = hits.get(digest)
+        # a MemoryCache without features cannot answer for them
+        if hit is None or (with_features and hit[0] is None):
+            misses.append(row)
+            continue
+        row_features, prediction_indices[row], probabilities[row] = hit
+        if with_features:
+            features[row] = row_features
+
+    if misses:
+        with stage("featurize", len(misses)):
+            seq_features = get_features_matrix([sequences[first_rows[row]] for row in misses])
+        with stage("score", len(misses)):
+            miss_predictions, miss_probabilities = predict_with_proba(trained_model, seq_features)
+        miss_indices = np.array([class_index[label] for label in miss_predictions])
+        miss_probabilities = miss_probabilities[:, 1]
+        prediction_indices[misses] = miss_indices
+        probabilities[misses] = miss_probabilities
+        if cache is not None:
+            cache.store(model, [digests[row] for row in misses], seq_features,
+                        miss_indices, miss_probabilities)
+        if with_features:
+            features[misses] = seq_features
+
+    if with_features:
+        return classes[prediction_indices[inverse]], probabilities[inverse], features[inverse]
+    return classes[prediction_indices[inverse]], probabilities[inverse]
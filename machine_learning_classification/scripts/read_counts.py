@@ -0,0 +1,288 @@
+import argparse
+import os
+import re
+import sys
+from array import array
+
+import numpy as np
+import pandas as pd
+
+from gff_to_bed import PRESETS, GffIndex
+
+## take in:
+##    1) effector_classification_table.csv (output of predict_effectors.py)
+##    2) candidate intervals: a BED file (e.g. from gff_to_bed.py) or the GFF3 annotation
+##    3) read counts: a per-interval count table (bedtools multicov output) or
+##       alignments as SAM text, one file per sample or '-' for standard input
+
+## RUN LIKE THIS:
+##    python3 read_counts.py -t effector_classification_table.csv --bed candidate_orfs.bed --counts readcounts.txt
+##    samtools view sorted-CG_SF5-All.bam | python3 read_counts.py -t effector_classification_table.csv \
+##        --gff BlacSF5_genomic_ORFs.gff --orfs --sam -
+##
+## the intervals are indexed per scaffold; the alignments are streamed and the
+## reads of a scaffold are counted against its intervals in one sorted sweep
+## once the stream moves on, so a coordinate-sorted SAM stream only keeps the
+## reads of one scaffold in memory
+
+## output:
+##    the classification table with the columns interval_length, read_count and
+##    read_count_per_base (one pair per sample if several are given), written to
+##    {TABLE_NAME}_readcounts.csv next to the table unless -o is given
+
+COUNT_COLUMN = "read_count"
+PER_BASE_COLUMN = "read_count_per_base"
+
+# SAM flags of alignments that are not counted: unmapped, failed QC and,
+# unless asked for, duplicates (the defaults of bedtools multicov)
+UNMAPPED, QC_FAIL, DUPLICATE = 0x4, 0x200, 0x400
+
+# CIGAR operations that consume the reference
+CIGAR_PATTERN = re.compile(r"(\d+)([MIDNSHP=X])")
+REFERENCE_OPERATIONS = set("MDN=X")
+
+
+def reference_span(cigar):
+    '''
+    Method: Returns the number of reference bases a CIGAR string covers
+    '''
+    return sum(int(length) for length, operation in CIGAR_PATTERN.findall(cigar)
+               if operation in REFERENCE_OPERATIONS)
+
+
+def read_sam(handle, min_mapq=0, duplicates=False):
+    '''
+    Method: Yields (scaffold, start, end) of every counted alignment of a SAM text stream
+
+    Input:
+
+        - handle: open SAM file or standard input, header lines are skipped
+        - min_mapq: smallest mapping quality counted
+        - duplicates: whether reads flagged as duplicates are counted
+
+    Coordinates are 0-based and half-open, like BED intervals.
+    '''
+    skipped = UNMAPPED | QC_FAIL | (0 if duplicates else DUPLICATE)
+    for line in handle:
+        if line.startswith('@'):
+            continue
+        fields = line.split('\t', 6)
+        if len(fields) < 6 or int(fields[1]) & skipped or fields[5] == '*' or int(fields[4]) < min_mapq:
+            continue
+        start = int(fields[3]) - 1
+        yield fields[2], start, start + reference_span(fields[5])
+
+
+class IntervalIndex:
+    '''
+    Candidate intervals as start, end and row arrays per scaffold
+    '''
+
+    def __init__(self, intervals):
+        '''
+        Input:
+
+            - intervals: iterable of (scaffold, start, end, name), BED coordinates
+        '''
+        self.names = []
+        positions = {}
+        for scaffold, start, end, name in intervals:
+            positions.setdefault(scaffold, []).append((int(start), int(end), len(self.names)))
+            self.names.append(name)
+        self.scaffolds = {}
+        for scaffold, rows in positions.items():
+            rows = np.array(rows, dtype=np.int64).reshape(-1, 3)
+            self.scaffolds[scaffold] = (rows[:, 0], rows[:, 1], rows[:, 2])
+
+    def __len__(self):
+        return len(self.names)
+
+    def count_overlaps(self, scaffold, read_starts, read_ends, counts):
+        '''
+        Method: Adds the number of reads overlapping every interval of a scaffold to counts
+
+        A read overlaps an interval if it starts before the interval ends and
+        does not end before the interval starts. As a read ends after it starts,
+        the overlaps of an interval are the reads starting before its end minus
+        those ending at or before its start, two binary searches on sorted arrays.
+        '''
+        if scaffold not in self.scaffolds or not len(read_starts):
+            return
+        starts, ends, rows = self.scaffolds[scaffold]
+        read_starts = np.sort(np.frombuffer(read_starts, dtype=np.int64))
+        read_ends = np.sort(np.frombuffer(read_ends, dtype=np.int64))
+        counts[rows] += (np.searchsorted(read_starts, ends, side="left")
+                         - np.searchsorted(read_ends, starts, side="right"))
+
+    def count_alignments(self, alignments):
+        '''
+        Method: Returns the number of alignments overlapping every interval, in the order of names
+
+        Input:
+
+            - alignments: iterable of (scaffold, start, end), e.g. from read_sam()
+
+        The reads of a scaffold are counted as soon as the next scaffold starts,
+        so a coordinate-sorted stream holds one scaffold at a time; unsorted
+        input is still counted correctly, a scaffold seen again is counted again.
+        '''
+        counts = np.zeros(len(self.names), dtype=np.int64)
+        current, read_starts, read_ends = None, array('q'), array('q')
+        for scaffold, start, end in alignments:
+            if scaffold != current:
+                self.count_overlaps(current, read_starts, read_ends, counts)
+                current, read_starts, read_ends = scaffold, array('q'), array('q')
+            if scaffold in self.scaffolds:
+                read_starts.append(start)
+                read_ends.append(end)
+        self.count_overlaps(current, read_starts, read_ends, counts)
+        return counts
+
+
+def read_bed(bed_file):
+    '''
+    Method: Yields (scaffold, start, end, name) of every line of a BED file
+    '''
+    with open(bed_file) as handle:
+        for line in handle:
+            if not line.strip() or line.startswith(("#", "track", "browser")):
+                continue
+            fields = line.rstrip('\n').split('\t')
+            name = fields[3] if len(fields) > 3 else f"{fields[0]}:{fields[1]}-{fields[2]}"
+            yield fields[0], int(fields[1]), int(fields[2]), name
+
+
+def gff_intervals(gff_file, seq_ids, orfs=False):
+    '''
+    Method: Yields the intervals of seq_ids in a GFF3 file, named by ID, as gff_to_bed.py writes them
+    '''
+    index = GffIndex(gff_file, *PRESETS["orf" if orfs else "gene"])
+    for seq_id in seq_ids:
+        row = index.lookup(seq_id)
+        if row is not None:
+            yield row[0], int(row[1]), int(row[2]), seq_id
+
+
+def read_count_table(count_file, sample_names=None):
+    '''
+    Method: Returns (intervals, {sample: counts}) of a bedtools multicov table
+
+    Input:
+
+        - count_file: tab-separated scaffold|start|end|name|one count column per BAM
+        - sample_names: names of the count columns (default: sample1, sample2, ...)
+    '''
+    table = pd.read_csv(count_file, sep='\t', header=None, dtype={0: str, 3: str})
+    count_columns = list(table.columns[4:])
+    if not count_columns:
+        raise ValueError(f"{count_file} has no count column")
+    if sample_names is None:
+        sample_names = [f"sample{i + 1}" for i in range(len(count_columns))]
+    if len(sample_names) != len(count_columns):
+        raise ValueError(f"{count_file} has {len(count_columns)} count columns, {len(sample_names)} names were given")
+    intervals = list(zip(table[0], table[1], table[2], table[3]))
+    return intervals, {name: table[column].to_numpy() for name, column in zip(sample_names, count_columns)}
+
+
+def sample_name(sam_file):
+    return "stdin" if sam_file == '-' else os.path.basename(sam_file).split('.')[0]
+
+
+def add_read_columns(table, intervals, sample_counts):
+    '''
+    Method: Returns the classification table with interval length and read count columns
+
+    Input:
+
+        - table: classification table with a proteinID column
+        - intervals: list of (scaffold, start, end, name), names matching proteinIDs
+        - sample_counts: {sample: counts of the intervals}; with one sample the
+          columns are read_count and read_count_per_base, with several they are
+          suffixed by the sample name
+
+    Proteins without an interval get empty counts, an interval named twice counts once (the first).
+    '''
+    reads = pd.DataFrame({"proteinID": [name for _, _, _, name in intervals],
+                          "interval_length": [end - start for _, start, end, _ in intervals]})
+    suffixes = {name: "" if len(sample_counts) == 1 else f"_{name}" for name in sample_counts}
+    for name, counts in sample_counts.items():
+        reads[COUNT_COLUMN + suffixes[name]] = counts
+        reads[PER_BASE_COLUMN + suffixes[name]] = counts / reads["interval_length"].where(reads["interval_length"] > 0)
+    reads = reads.drop_duplicates("proteinID")
+    table = table.drop(columns=[column for column in reads.columns if column != "proteinID" and column in table.columns])
+    # the merge renumbers the rows, keep the table's own index (predict_effectors.py writes one)
+    index = table.index
+    table = table.merge(reads, on="proteinID", how="left")
+    table.index = index
+    for name in sample_counts:
+        table[COUNT_COLUMN + suffixes[name]] = table[COUNT_COLUMN + suffixes[name]].astype("Int64")
+    table["interval_length"] = table["interval_length"].astype("Int64")
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='read_counts.py',
+                                     description="Add the read counts of candidate intervals to an effector classification table.")
+    parser.add_argument("-t", "--table", type=str, required=True,
+                        help="effector_classification_table.csv of predict_effectors.py.")
+    intervals_group = parser.add_mutually_exclusive_group()
+    intervals_group.add_argument("--bed", type=str, default=None,
+                                 help="Candidate intervals, named by protein ID (e.g. from gff_to_bed.py).")
+    intervals_group.add_argument("--gff", type=str, default=None,
+                                 help="GFF3 annotation the intervals of the table's protein IDs are looked up in.")
+    parser.add_argument("--orfs", action="store_true", help="With --gff, look up ORF features by their Name.")
+    counts_group = parser.add_mutually_exclusive_group(required=True)
+    counts_group.add_argument("--counts", type=str, default=None,
+                              help="Per-interval count table (bedtools multicov output), holding the intervals too.")
+    counts_group.add_argument("--sam", type=str, nargs='+', default=None,
+                              help="SAM text of the alignments of each sample, '-' for standard input.")
+    parser.add_argument("--samples", type=str, nargs='+', default=None,
+                        help="Names of the samples (default: SAM file names, or sample1, ... for --counts).")
+    parser.add_argument("--min-mapq", type=int, default=0, help="Smallest mapping quality counted (default: %(default)s).")
+    parser.add_argument("--duplicates", action="store_true", help="Also count reads flagged as duplicates.")
+    parser.add_argument("-o", "--output", type=str, default=None,
+                        help="Output CSV file (default: TABLE_NAME_readcounts.csv next to the table).")
+    args = parser.parse_args()
+
+    if args.sam and not (args.bed or args.gff):
+        parser.error("--sam needs the intervals to count in, give --bed or --gff")
+
+    for path in [args.table, args.bed, args.gff, args.counts] + [path for path in args.sam or [] if path != '-']:
+        if path and not os.path.isfile(path):
+            exit(f"{path} either is a directory or does not exist.")
+    if args.sam and args.samples and len(args.samples) != len(args.sam):
+        exit(f"{len(args.sam)} SAM files were given, but {len(args.samples)} sample names")
+
+    table = pd.read_csv(args.table, index_col=0, dtype={"proteinID": str, "prediction": str})
+
+    if args.counts:
+        try:
+            intervals, sample_counts = read_count_table(args.counts, args.samples)
+        except ValueError as e:
+            exit(str(e))
+    else:
+        if args.bed:
+            intervals = list(read_bed(args.bed))
+        else:
+            intervals = list(gff_intervals(args.gff, table["proteinID"], args.orfs))
+        index = IntervalIndex(intervals)
+        samples = args.samples or [sample_name(path) for path in args.sam]
+        sample_counts = {}
+        for name, path in zip(samples, args.sam):
+            handle = sys.stdin if path == '-' else open(path)
+            try:
+                sample_counts[name] = index.count_alignments(read_sam(handle, args.min_mapq, args.duplicates))
+            finally:
+                if handle is not sys.stdin:
+                    handle.close()
+
+    table = add_read_columns(table, intervals, sample_counts)
+    output_file = args.output or os.path.splitext(args.table)[0] + "_readcounts.csv"
+    table.to_csv(output_file)
+
+    found = table["interval_length"].notna().sum()
+    print(f"Read counts of {found} of {len(table)} proteins written to {output_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+import argparse
+import datetime
+import glob
+import hashlib
+import itertools
+import json
+import os
+import re
+import sys, warnings
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+
+from fasta_reader import read_fasta
+from feature_engine import FEATURE_NAMES, MAX_SEQUENCE_LENGTH, feature_table_hash, get_features_matrix
+from flat_forest import FlatForest
+
+## take in:
+##    1) fasta files of positive (effector) and negative (non-effector) training sequences,
+##       by default the two files in ../training_data
+
+## RUN LIKE THIS:
+##    python3 train_models.py -o ../trained_models --n-estimators 100 200 500 --max-depth 3 5 0 -w 8
+##
+## the command-line version of the Random Forest grid in
+## notebooks/effectorO_training_pipeline.ipynb: the training sets are
+## featurized with the same feature engine predict_effectors.py uses (cached
+## per file content), every (hyperparameters, fold) pair of a stratified
+## k-fold cross-validation is fitted in a process pool, and the best
+## configuration is refitted on all sequences. Runs are reproducible given
+## --seed.
+
+## output (in the output directory, N counting up from 1 per model name):
+##    1) {NAME}_v{N}.sav: the refitted model (joblib, like the other trained models)
+##    2) {NAME}_v{N}.json: metadata sidecar (features, FEAT table hash, training
+##       files, hyperparameter grid with the CV scores of every configuration,
+##       the chosen configuration, training time, package versions)
+##    3) with --flat, {NAME}_v{N}.flat: the model exported for flat_forest.py
+
+TRAINING_DATA_DIR = "../training_data"
+DEFAULT_POSITIVE_FILE = os.path.join(TRAINING_DATA_DIR, "positive_training_set_effectors.fasta")
+DEFAULT_NEGATIVE_FILE = os.path.join(TRAINING_DATA_DIR, "negative_training_set_orthologs.fasta")
+DEFAULT_CACHE_DIR = os.path.join(TRAINING_DATA_DIR, "feature_cache")
+
+DEFAULT_N_ESTIMATORS = [100, 200, 500]
+# 0 grows the trees until their leaves are pure
+DEFAULT_MAX_DEPTH = [3, 5, 10, 0]
+DEFAULT_MIN_SAMPLES_LEAF = [1]
+DEFAULT_FOLDS = 5
+DEFAULT_SEED = 1338
+
+METRICS = ["accuracy", "roc_auc", "sensitivity", "specificity"]
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(1024**2), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def featurize_file(fasta_file, cache_dir=DEFAULT_CACHE_DIR):
+    '''
+    Method: Returns the IDs and feature matrix of a FASTA file, cached by file content
+
+    Input:
+
+        - fasta_file: path of the FASTA file
+        - cache_dir: directory of cached matrices, None to always featurize
+
+    The cache key covers the file content and feature_table_hash(), so edits
+    to the training sets or to FEAT.py are never served stale matrices.
+    '''
+    cache_file = None
+    if cache_dir:
+        key = f"{file_digest(fasta_file)[:16]}_{feature_table_hash()}"
+        cache_file = os.path.join(cache_dir, f"{os.path.basename(fasta_file)}.{key}.npz")
+        if os.path.isfile(cache_file):
+            cached = np.load(cache_file, allow_pickle=False)
+            return cached["ids"].tolist(), cached["features"]
+
+    records = list(read_fasta(fasta_file))
+    ids = [seq_id for seq_id, _ in records]
+    features = get_features_matrix([seq for _, seq in records])
+
+    if cache_file:
+        os.makedirs(cache_dir, exist_ok=True)
+        # written under a temporary name, so parallel runs never read half a file
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_file, ids=np.array(ids, dtype=str), features=features)
+        os.replace(tmp_file, cache_file)
+    return ids, features
+
+
+def load_training_set(positive_files, negative_files, cache_dir=DEFAULT_CACHE_DIR, balance=False,
+                      seed=DEFAULT_SEED):
+    '''
+    Method: Returns the IDs, feature matrix and labels ('1' effector, '0' not) of the training set
+
+    Input:
+
+        - positive_files/negative_files: FASTA files of each class
+        - cache_dir: directory of cached feature matrices
+        - balance: randomly keep as many negatives as positives, like the notebook
+        - seed: random seed of the balancing
+    '''
+    ids, matrices, labels = [], [], []
+    for label, fasta_files in (('1', positive_files), ('0', negative_files)):
+        for fasta_file in fasta_files:
+            file_ids, features = featurize_file(fasta_file, cache_dir)
+            ids.extend(file_ids)
+            matrices.append(features)
+            labels.extend([label] * len(file_ids))
+    ids, X, y = np.array(ids, dtype=str), np.vstack(matrices), np.array(labels)
+
+    if balance:
+        rng = np.random.default_rng(seed)
+        positives = np.flatnonzero(y == '1')
+        negatives = np.flatnonzero(y == '0')
+        if len(negatives) > len(positives):
+            negatives = np.sort(rng.choice(negatives, len(positives), replace=False))
+        keep = np.concatenate([positives, negatives])
+        ids, X, y = ids[keep], X[keep], y[keep]
+    return ids, X, y
+
+
+def parameter_grid(n_estimators, max_depth, min_samples_leaf):
+    '''
+    Method: Returns every combination of the hyperparameters as RandomForestClassifier keyword dictionaries
+    '''
+    return [{"n_estimators": trees, "max_depth": depth or None, "min_samples_leaf": leaf}
+            for trees, depth, leaf in itertools.product(n_estimators, max_depth, min_samples_leaf)]
+
+
+def make_model(params, seed):
+    from sklearn.ensemble import RandomForestClassifier
+    # the pool already keeps every core busy, so each forest is fitted on one
+    return RandomForestClassifier(random_state=seed, n_jobs=1, **params)
+
+
+def score_fold(params, seed, X, y, train_index, test_index):
+    '''
+    Method: Fits one configuration on one training fold and scores it on the test fold
+
+    Returns {metric: score} for METRICS.
+    '''
+    from sklearn.metrics import accuracy_score, confusion_matrix, roc_auc_score
+    if not sys.warnoptions:
+        warnings.simplefilter("ignore")
+    model = make_model(params, seed).fit(X[train_index], y[train_index])
+    predictions = model.predict(X[test_index])
+    probabilities = model.predict_proba(X[test_index])[:, list(model.classes_).index('1')]
+
+    truth = y[test_index]
+    (tn, fp), (fn, tp) = confusion_matrix(truth, predictions, labels=['0', '1'])
+    return {"accuracy": float(accuracy_score(truth, predictions)),
+            "roc_auc": float(roc_auc_score(truth == '1', probabilities)),
+            "sensitivity": float(tp / (tp + fn)) if tp + fn else 0.0,
+            "specificity": float(tn / (tn + fp)) if tn + fp else 0.0}
+
+
+def cross_validate_grid(grid, X, y, folds=DEFAULT_FOLDS, seed=DEFAULT_SEED, workers=None):
+    '''
+    Method: Scores every configuration of the grid with stratified k-fold cross-validation
+
+    Input:
+
+        - grid: list of RandomForestClassifier keyword dictionaries
+        - X/y: feature matrix and labels
+        - folds: number of cross-validation folds
+        - seed: random seed of the folds and forests
+        - workers: number of processes fitting folds at the same time
+
+    Every configuration sees the same folds. Returns one dictionary per
+    configuration with its parameters and the mean and standard deviation
+    (and per-fold values) of every metric.
+    '''
+    from sklearn.model_selection import StratifiedKFold
+    splits = list(StratifiedKFold(n_splits=folds, shuffle=True, random_state=seed).split(X, y))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [[pool.submit(score_fold, params, seed, X, y, train_index, test_index)
+                    for train_index, test_index in splits] for params in grid]
+        results = []
+        for params, fold_futures in zip(grid, futures):
+            scores = [future.result() for future in fold_futures]
+            result = {"params": params}
+            for metric in METRICS:
+                values = [score[metric] for score in scores]
+                result[metric] = {"mean": float(np.mean(values)), "std": float(np.std(values)),
+                                  "folds": values}
+            results.append(result)
+    return results
+
+
+def next_version(output_dir, name):
+    '''
+    Method: Returns the version number following the {name}_v{N} artifacts in output_dir
+    '''
+    pattern = re.compile(rf"{re.escape(name)}_v(\d+)\.(?:sav|json|flat)$")
+    versions = [int(match.group(1)) for match in
+                (pattern.match(os.path.basename(path)) for path in glob.glob(os.path.join(output_dir, name + "_v*")))
+                if match]
+    return max(versions, default=0) + 1
+
+
+def package_versions():
+    import sklearn
+    return {"python": sys.version.split()[0], "numpy": np.__version__,
+            "scikit-learn": sklearn.__version__, "joblib": joblib.__version__}
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='train_models.py',
+                                     description="Train Random Forest effector classifiers with a cross-validated hyperparameter grid.")
+    parser.add_argument("-p", "--positive", type=str, nargs='+', default=[DEFAULT_POSITIVE_FILE],
+                        help="FASTA files of effector sequences (default: %(default)s).")
+    parser.add_argument("-n", "--negative", type=str, nargs='+', default=[DEFAULT_NEGATIVE_FILE],
+                        help="FASTA files of non-effector sequences (default: %(default)s).")
+    parser.add_argument("-o", "--output-dir", type=str, default="../trained_models",
+                        help="Directory the model and its metadata are written to (default: %(default)s).")
+    parser.add_argument("--name", type=str, default="RF",
+                        help="Model name; artifacts are named NAME_vN (default: %(default)s).")
+    parser.add_argument("--n-estimators", type=int, nargs='+', default=DEFAULT_N_ESTIMATORS,
+                        help="Numbers of trees to try (default: %(default)s).")
+    parser.add_argument("--max-depth", type=int, nargs='+', default=DEFAULT_MAX_DEPTH,
+                        help="Maximum tree depths to try, 0 for unlimited (default: %(default)s).")
+    parser.add_argument("--min-samples-leaf", type=int, nargs='+', default=DEFAULT_MIN_SAMPLES_LEAF,
+                        help="Minimum numbers of sequences per leaf to try (default: %(default)s).")
+    parser.add_argument("--folds", type=int, default=DEFAULT_FOLDS,
+                        help="Number of stratified cross-validation folds (default: %(default)s).")
+    parser.add_argument("--metric", choices=METRICS, default="accuracy",
+                        help="Mean CV score the best configuration is chosen by (default: %(default)s).")
+    parser.add_argument("--balance", action="store_true",
+                        help="Randomly keep as many negative as positive sequences, like the training notebook.")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED,
+                        help="Random seed of the balancing, folds and forests (default: %(default)s).")
+    parser.add_argument("--cache-dir", type=str, default=DEFAULT_CACHE_DIR,
+                        help="Directory of cached feature matrices, '' to disable (default: %(default)s).")
+    parser.add_argument("--flat", action="store_true",
+                        help="Also export the model for flat_forest.py (the format predict_effectors.py loads by default).")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="Number of folds fitted at the same time (default: number of cores).")
+    args = parser.parse_args()
+
+    for fasta_file in args.positive + args.negative:
+        if not os.path.isfile(fasta_file):
+            exit(f"{fasta_file} either is a directory or does not exist.")
+    if args.folds < 2:
+        exit("--folds must be at least 2.")
+
+    start = time.time()
+    ids, X, y = load_training_set(args.positive, args.negative, args.cache_dir, args.balance, args.seed)
+    n_positive, n_negative = int((y == '1').sum()), int((y == '0').sum())
+    if min(n_positive, n_negative) < args.folds:
+        exit(f"{args.folds} folds need at least {args.folds} sequences of each class.")
+    print(f"Training set: {n_positive} effectors, {n_negative} non-effectors")
+
+    grid = parameter_grid(args.n_estimators, args.max_depth, args.min_samples_leaf)
+    results = cross_validate_grid(grid, X, y, args.folds, args.seed, args.workers)
+    for result in results:
+        print(result["params"], " ".join(f"{metric}={result[metric]['mean']:.3f}" for metric in METRICS))
+
+    # ties go to the configuration listed first, i.e. the smaller forest
+    best = max(results, key=lambda result: result[args.metric]["mean"])
+    if not sys.warnoptions:
+        warnings.simplefilter("ignore")
+    trained_model = make_model(best["params"], args.seed)
+    trained_model.n_jobs = args.workers or -1
+    trained_model.fit(X, y)
+    trained_model.n_jobs = None
+    training_time = time.time() - start
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    version = next_version(args.output_dir, args.name)
+    base = os.path.join(args.output_dir, f"{args.name}_v{version}")
+    joblib.dump(trained_model, base + ".sav")
+    if args.flat:
+        FlatForest.from_sklearn(trained_model).save(base + ".flat")
+
+    metadata = {
+        "name": args.name,
+        "version": version,
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "model": type(trained_model).__name__,
+        "params": best["params"],
+        "features": FEATURE_NAMES,
+        "feature_table_hash": feature_table_hash(),
+        "max_sequence_length": MAX_SEQUENCE_LENGTH,
+        "classes": [str(label) for label in trained_model.classes_],
+        "training_data": {"positive": [{"file": path, "sha256": file_digest(path)} for path in args.positive],
+                          "negative": [{"file": path, "sha256": file_digest(path)} for path in args.negative],
+                          "n_positive": n_positive, "n_negative": n_negative, "balanced": args.balance},
+        "cross_validation": {"folds": args.folds, "seed": args.seed, "metric": args.metric,
+                             "best": {metric: best[metric] for metric in METRICS},
+                             "grid": results},
+        "training_time_seconds": round(training_time, 3),
+        "versions": package_versions(),
+    }
+    with open(base + ".json", 'w') as handle:
+        json.dump(metadata, handle, indent=2)
+
+    print(f"Best {args.metric}: {best[args.metric]['mean']:.3f} with {best['params']}")
+    print(f"Model written to {base}.sav{' and ' + base + '.flat' if args.flat else ''}, metadata to {base}.json")
+
+
+if __name__ == "__main__":
+    main()
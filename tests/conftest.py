@@ -0,0 +1,8 @@
+import os
+import sys
+
+# the pipeline modules import each other as flat scripts, as when run from their directory
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           "machine_learning_classification", "scripts")
+if SCRIPTS_DIR not in sys.path:
+    sys.path.insert(0, SCRIPTS_DIR)
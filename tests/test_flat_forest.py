@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import ExtraTreesClassifier, RandomForestClassifier
+
+from flat_forest import FlatForest, check_parity, compile_model, predict_with_proba
+
+
+def training_data(labels):
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(400, 8))
+    # rounded features put many rows exactly on split thresholds
+    X[:, :4] = np.round(X[:, :4], 1)
+    y = (X[:, 0] + X[:, 1] * X[:, 2] + rng.normal(scale=0.5, size=len(X)) > 0).astype(int)
+    return X, np.array(labels)[y]
+
+
+def query_rows(X):
+    rng = np.random.default_rng(1)
+    return np.vstack([X, rng.normal(size=(1000, X.shape[1])), np.round(rng.normal(size=(200, X.shape[1])), 1)])
+
+
+@pytest.mark.parametrize("forest_class", [RandomForestClassifier, ExtraTreesClassifier])
+@pytest.mark.parametrize("max_depth", [4, None])
+@pytest.mark.parametrize("labels", [["0", "1"], [0, 1]])
+def test_parity_after_save_and_mmap(tmp_path, forest_class, max_depth, labels):
+    X, y = training_data(labels)
+    forest = forest_class(n_estimators=25, max_depth=max_depth, random_state=0).fit(X, y)
+
+    FlatForest.from_sklearn(forest).save(str(tmp_path / "model.flat"))
+    flat_forest = FlatForest.load(str(tmp_path / "model.flat"), mmap_mode='r')
+
+    X_test = query_rows(X)
+    predictions, probabilities = flat_forest.predict_with_proba(X_test)
+    np.testing.assert_array_equal(predictions, forest.predict(X_test))
+    np.testing.assert_array_equal(probabilities, forest.predict_proba(X_test))
+    np.testing.assert_array_equal(flat_forest.predict(X_test), forest.predict(X_test))
+    assert check_parity(forest, flat_forest, X_test)
+    assert predictions.dtype.kind == np.asarray(y).dtype.kind
+
+
+def test_empty_batch():
+    X, y = training_data(["0", "1"])
+    flat_forest = compile_model(RandomForestClassifier(n_estimators=5, random_state=0).fit(X, y))
+    predictions, probabilities = predict_with_proba(flat_forest, np.empty((0, X.shape[1])))
+    assert predictions.shape == (0,) and probabilities.shape == (0, 2)
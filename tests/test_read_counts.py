@@ -0,0 +1,136 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from read_counts import (COUNT_COLUMN, PER_BASE_COLUMN, IntervalIndex, add_read_columns, read_bed,
+                         read_count_table, read_sam, reference_span)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+READ_COUNTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           "machine_learning_classification", "scripts", "read_counts.py")
+
+# reads.sam counted against candidates.bed by hand, in the order of the BED file
+EXPECTED_COUNTS = [2, 2, 2, 2, 0, 0]
+
+
+def data_file(name):
+    return os.path.join(DATA_DIR, name)
+
+
+def read_table(table_file):
+    # classification tables are written by predict_effectors.ResultWriter, with an index column
+    return pd.read_csv(table_file, index_col=0, dtype={"proteinID": str, "prediction": str})
+
+
+def sam_alignments(**options):
+    with open(data_file("reads.sam")) as handle:
+        return list(read_sam(handle, **options))
+
+
+def brute_force_counts(intervals, alignments):
+    return [sum(1 for read_scaffold, read_start, read_end in alignments
+                if read_scaffold == scaffold and read_start < end and read_end > start)
+            for scaffold, start, end, _ in intervals]
+
+
+def test_reference_span():
+    assert reference_span("10M") == 10
+    # soft clips and insertions take no reference bases, deletions and skips do
+    assert reference_span("5S20M3D10M") == 33
+    assert reference_span("5M1000N5M") == 1010
+    assert reference_span("4M2I4M") == 8
+
+
+def test_read_sam_flags_and_spans():
+    alignments = sam_alignments()
+    # unmapped (0x4), QC-failed (0x200) and duplicate (0x400) reads are skipped
+    assert len(alignments) == 9
+    assert ("scaffold1", 189, 1199) in alignments
+    assert ("scaffold2", 0, 33) in alignments
+    assert len(sam_alignments(duplicates=True)) == 10
+    assert len(sam_alignments(min_mapq=10)) == 8
+
+
+@pytest.mark.parametrize("options, expected", [
+    ({}, EXPECTED_COUNTS),
+    ({"duplicates": True}, [3, 3, 2, 2, 0, 0]),
+    ({"min_mapq": 10}, [2, 1, 2, 2, 0, 0]),
+])
+def test_count_alignments(options, expected):
+    intervals = list(read_bed(data_file("candidates.bed")))
+    alignments = sam_alignments(**options)
+    counts = IntervalIndex(intervals).count_alignments(alignments)
+    assert counts.tolist() == expected
+    assert counts.tolist() == brute_force_counts(intervals, alignments)
+
+
+def test_count_alignments_matches_brute_force():
+    rng = np.random.default_rng(0)
+    scaffolds = ["scaffold1", "scaffold2", "scaffold3"]
+    intervals = []
+    for row in range(200):
+        start = int(rng.integers(0, 10000))
+        intervals.append((scaffolds[row % 3], start, start + int(rng.integers(1, 500)), f"p{row}"))
+    alignments = []
+    for _ in range(5000):
+        start = int(rng.integers(0, 10500))
+        alignments.append((scaffolds[int(rng.integers(0, 4)) % 3], start, start + int(rng.integers(1, 300))))
+    # scaffolds come back several times, as in unsorted SAM
+    counts = IntervalIndex(intervals).count_alignments(alignments)
+    assert counts.tolist() == brute_force_counts(intervals, alignments)
+
+
+def test_add_read_columns_from_sam():
+    table = read_table(data_file("classification_table.csv"))
+    intervals = list(read_bed(data_file("candidates.bed")))
+    counts = IntervalIndex(intervals).count_alignments(sam_alignments())
+    table = add_read_columns(table, intervals, {"reads": counts})
+
+    assert list(table["proteinID"]) == ["p1", "p2", "p3", "p4", "p5", "p6", "p7"]
+    assert table[COUNT_COLUMN].tolist()[:6] == EXPECTED_COUNTS
+    # p7 has no interval
+    assert table[COUNT_COLUMN].isna().tolist() == [False] * 6 + [True]
+    assert table["interval_length"].tolist()[:6] == [100, 250, 100, 50, 100, 10]
+    np.testing.assert_allclose(table[PER_BASE_COLUMN][:6], [0.02, 0.008, 0.02, 0.04, 0.0, 0.0])
+
+
+def test_add_read_columns_from_multicov():
+    table = read_table(data_file("classification_table.csv"))
+    intervals, sample_counts = read_count_table(data_file("multicov.txt"), ["leaf", "root"])
+    table = add_read_columns(table, intervals, sample_counts)
+
+    assert table[COUNT_COLUMN + "_leaf"].tolist()[:6] == EXPECTED_COUNTS
+    assert table[COUNT_COLUMN + "_root"].tolist()[:6] == [0, 8, 1, 5, 3, 0]
+    assert str(table[COUNT_COLUMN + "_root"].dtype) == "Int64"
+    np.testing.assert_allclose(table[PER_BASE_COLUMN + "_root"][:6], [0.0, 0.032, 0.01, 0.1, 0.03, 0.0])
+    assert pd.isna(table[PER_BASE_COLUMN + "_root"].iloc[6])
+
+
+def test_read_count_table_checks_sample_names():
+    with pytest.raises(ValueError):
+        read_count_table(data_file("multicov.txt"), ["leaf"])
+
+
+def test_cli_keeps_the_table_layout(tmp_path):
+    output_file = str(tmp_path / "classification_table_readcounts.csv")
+    subprocess.run([sys.executable, READ_COUNTS, "-t", data_file("classification_table.csv"),
+                    "--counts", data_file("multicov.txt"), "--samples", "leaf", "root", "-o", output_file],
+                   check=True, capture_output=True)
+
+    with open(data_file("classification_table.csv")) as handle:
+        input_header = handle.readline().rstrip("\n").split(",")
+    with open(output_file) as handle:
+        output_header = handle.readline().rstrip("\n").split(",")
+    # the unnamed index column stays first and no "Unnamed: 0" column is added
+    assert output_header[:len(input_header)] == input_header
+    assert output_header[len(input_header):] == [
+        "interval_length", "read_count_leaf", "read_count_per_base_leaf",
+        "read_count_root", "read_count_per_base_root"]
+
+    table = read_table(output_file)
+    assert table.index.tolist() == list(range(7))
+    assert table["read_count_root"].tolist()[:6] == [0, 8, 1, 5, 3, 0]